@@ -0,0 +1,97 @@
+""" Compare the auth decorators with and without the cache of decrypted tokens (see token_cache). Reports the time per
+    request of a view decorated with IsAuthorized, for a valid and an invalid device token, decrypted every time
+    (cache cleared) and served from the cache.
+
+    ManagerAuthorized decrypts its token the same way (decrypt_token), but also looks up the project manager in the
+    database, which is not part of this benchmark.
+
+    usage: DJANGO_SETTINGS_MODULE=main_application.settings python auth_benchmark.py [requests]
+"""
+import os
+import sys
+import time
+from uuid import uuid4
+
+import django
+
+django.setup()
+
+# pylint: disable=wrong-import-position
+from django.test import RequestFactory
+
+from construction_work.generic_functions.aes_cipher import AESCipher, get_key_iv
+from construction_work.generic_functions.is_authorized import (
+    AES_SECRET,
+    IsAuthorized,
+    decrypted_tokens,
+)
+
+DEFAULT_REQUESTS = 10000
+
+
+@IsAuthorized
+def a_view(request):
+    """Decorated view"""
+    return "success"
+
+
+class AuthBenchmark:
+    """Run the decorated view with and without the token cache"""
+
+    def __init__(self, requests=DEFAULT_REQUESTS):
+        self.requests = requests
+        self.results = {}
+        app_token = os.getenv("APP_TOKEN", str(uuid4()))
+        factory = RequestFactory()
+        self.http_requests = {
+            "valid": factory.get(
+                "/",
+                headers={
+                    "DeviceAuthorization": AESCipher(app_token, AES_SECRET).encrypt()
+                },
+            ),
+            "invalid": factory.get(
+                "/",
+                headers={
+                    "DeviceAuthorization": AESCipher("bogus", AES_SECRET).encrypt()
+                },
+            ),
+        }
+
+    def run_mode(self, http_request, cached):
+        """Time requests, returns seconds per request"""
+        start = time.perf_counter()
+        for _ in range(self.requests):
+            if not cached:
+                decrypted_tokens.clear()
+                get_key_iv.cache_clear()
+            a_view(http_request)
+        return (time.perf_counter() - start) / self.requests
+
+    def start_test(self):
+        """Perform benchmark"""
+        for name, http_request in self.http_requests.items():
+            self.results[name] = (
+                self.run_mode(http_request, cached=False),
+                self.run_mode(http_request, cached=True),
+            )
+
+    def print_metrics(self):
+        """Print report"""
+        print("Auth Benchmark:")
+        print("=" * 50)
+        print(f"Requests: {self.requests}")
+        print("_" * 50)
+        for name, (uncached, cached) in self.results.items():
+            print(
+                f"{name:<8} decrypted: {uncached * 1e6:.1f} us/request, "
+                f"cached: {cached * 1e6:.1f} us/request, speedup: {uncached / cached:.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    benchmark = AuthBenchmark(
+        int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REQUESTS
+    )
+    benchmark.start_test()
+    benchmark.print_metrics()
@@ -9,6 +9,7 @@ class Messages:
         self.access_denied = "ACCESS DENIED"
         self.distance_params = "Use either street + num or lat/lon"
         self.do_not_match = "Passwords do not match"
+        self.image_too_large = "Image too large"
         self.invalid_headers = (
             "Invalid header(s). See /api/v1/apidocs for more information"
         )
@@ -7,3 +7,9 @@ class ConstructionWorkApiConfig(AppConfig):
 
     default_auto_field = "django.db.models.BigAutoField"
     name = "construction_work"
+
+    def ready(self):
+        """Register signal handlers"""
+        # pylint: disable=import-outside-toplevel,unused-import
+        from construction_work.generic_functions import distance_ranking, projects_cache
+        from construction_work.push_notifications import topics
@@ -1,11 +1,16 @@
 """ AESCipher: Encrypts and de-crypts data
 """
+import functools
 from hashlib import md5
 
 from Crypto import Random
 from Crypto.Cipher import AES
 from pybase64 import b64decode, b64encode
 
+BLOCK_SIZE = 16
+# Salts of which the derived key and IV are kept, a ciphertext keeps its salt
+KEY_CACHE_SIZE = 1024
+
 
 class AESException(Exception):
     """Exception class for AES"""
@@ -16,16 +21,26 @@ class AESException(Exception):
 class AESCipher:
     """AESCipher class implementation"""
 
+    blk_size = BLOCK_SIZE
+
     def __init__(self, data, secret):
         self.data = data
         self.secret = secret.encode()
-        self.blk_size = 16
-        self.pad = lambda s: s + (self.blk_size - len(s) % self.blk_size) * chr(
-            self.blk_size - len(s) % self.blk_size
+
+    @staticmethod
+    def pad(s):
+        """Add PKCS#7 padding"""
+        return s + (BLOCK_SIZE - len(s) % BLOCK_SIZE) * chr(
+            BLOCK_SIZE - len(s) % BLOCK_SIZE
         )
-        self.unpad = lambda s: s[: -ord(s[len(s) - 1 :])]
 
-    def bytes_to_key(self, data, salt, output=48):
+    @staticmethod
+    def unpad(s):
+        """Remove PKCS#7 padding"""
+        return s[: -ord(s[len(s) - 1 :])]
+
+    @staticmethod
+    def bytes_to_key(data, salt, output=48):
         """Convert byte to key"""
         assert len(salt) == 8, len(salt)
         data += salt
@@ -60,7 +75,7 @@ class AESCipher:
             salt = encrypted[8:16]
             # Derive encryption key and initialization vector (IV)
             # Key = 32 bytes, IV = 16 bytes
-            key_iv = self.bytes_to_key(self.secret, salt, 32 + self.blk_size)
+            key_iv = get_key_iv(self.secret, salt)
             key = key_iv[:32]
             iv = key_iv[32:]
             # Initializes AES cipher object
@@ -71,3 +86,9 @@ class AESCipher:
             return unpadded_cipher.decode()
         except Exception as e:
             raise AESException(e) from e
+
+
+@functools.lru_cache(maxsize=KEY_CACHE_SIZE)
+def get_key_iv(secret, salt):
+    """Derive key and IV of a salt, memoized because the same ciphertexts are decrypted over and over"""
+    return AESCipher.bytes_to_key(secret, salt, 32 + BLOCK_SIZE)
@@ -0,0 +1,371 @@
+""" Bulk ingestion of ETL data
+
+    The ETL posts a batch of items, either as a JSON array or as NDJSON (application/x-ndjson, one JSON object per
+    line). All items are validated first, the valid items are then written with a single upsert (INSERT ... ON
+    CONFLICT (foreign_id) DO UPDATE) per batch of BATCH_SIZE, in one transaction. Each item gets its own result:
+
+    {"index": 0, "foreign_id": 1337, "status": "created|updated|unchanged|invalid", "errors": {...}}
+
+    Every project and article stores the content hash of the payload it was last written with: the SHA-256 (hex) of
+    the item as canonical JSON (keys sorted, separators "," and ":", no ASCII escaping). An item with an unchanged
+    content hash is not written, so last_seen/modification_date are not touched and the caches stay valid. The ETL
+    posts its hashes to the diff endpoints first, which return the foreign ids that need to be sent at all.
+
+    The projects of all articles are resolved by a single query. Project ids that are unknown are reported per
+    article (unknown_project_ids), an article without any known project is invalid. The links between articles and
+    projects (Article.projects) are rewritten with one bulk delete and one bulk insert.
+
+    Bulk writes bypass Model.save() and the post_save/m2m_changed signals, the cached project listings are
+    invalidated explicitly.
+"""
+
+import hashlib
+import json
+
+from django.db import transaction
+from django.utils import timezone
+
+from construction_work.generic_functions import projects_cache
+from construction_work.generic_functions.distance_ranking import project_coordinates
+from construction_work.models import Article, Project
+from construction_work.serializers import (
+    ArticleIngestSerializer,
+    ProjectIngestSerializer,
+)
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+BATCH_SIZE = 500
+
+CREATED = "created"
+UPDATED = "updated"
+UNCHANGED = "unchanged"
+INVALID = "invalid"
+
+
+class InvalidPayload(Exception):
+    """Payload is not a list of items, or not an object of hashes"""
+
+    pass  # pylint: disable=unnecessary-pass
+
+
+def get_items(request) -> list:
+    """Get items posted as JSON array or NDJSON, a line that is not valid JSON becomes None"""
+    if request.content_type == NDJSON_CONTENT_TYPE:
+        items = []
+        for line in request.body.splitlines():
+            if len(line.strip()) == 0:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)
+        return items
+
+    items = request.data
+    if not isinstance(items, list):
+        raise InvalidPayload("Expected a list of items")
+    return items
+
+
+def get_content_hash(iprox_data: dict) -> str:
+    """Get content hash of an ingest payload (canonical JSON)"""
+    canonical = json.dumps(
+        iprox_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def get_changed_foreign_ids(model, hashes) -> list:
+    """Get foreign ids of which the content hash differs from the stored one, or that are not stored at all"""
+    if not isinstance(hashes, dict):
+        raise InvalidPayload("Expected an object of content hashes by foreign id")
+    try:
+        hashes = {int(foreign_id): value for foreign_id, value in hashes.items()}
+    except ValueError as error:
+        raise InvalidPayload("Expected integer foreign ids") from error
+
+    stored_hashes = dict(
+        model.objects.filter(foreign_id__in=hashes.keys()).values_list(
+            "foreign_id", "content_hash"
+        )
+    )
+    return [
+        foreign_id
+        for foreign_id, content_hash in hashes.items()
+        if stored_hashes.get(foreign_id) is None
+        or stored_hashes[foreign_id] != content_hash
+    ]
+
+
+def get_project_data(etl_iprox_data: dict) -> dict:
+    """Map ETL (iprox) project data onto the project model fields"""
+    return {
+        "title": etl_iprox_data.get("title", ""),
+        "subtitle": etl_iprox_data.get("subtitle", ""),
+        "sections": etl_iprox_data.get("sections"),
+        "contacts": etl_iprox_data.get("contacts"),
+        "timeline": etl_iprox_data.get("timeline"),
+        "image": etl_iprox_data.get("image"),
+        "images": etl_iprox_data.get("images"),
+        "url": etl_iprox_data.get("url"),
+        "foreign_id": etl_iprox_data.get("foreign_id"),
+        "coordinates": etl_iprox_data.get("coordinates"),
+        "district_id": etl_iprox_data.get("districtId"),
+        "creation_date": etl_iprox_data.get("created"),
+        "modification_date": etl_iprox_data.get("modified"),
+        "publication_date": etl_iprox_data.get("publicationDate"),
+        "expiration_date": etl_iprox_data.get("expirationDate"),
+    }
+
+
+def get_article_data(iprox_data: dict) -> dict:
+    """Map ETL (iprox) article data onto the article model fields, except its projects"""
+    return {
+        "foreign_id": iprox_data.get("foreign_id"),
+        "title": iprox_data.get("title"),
+        "intro": iprox_data.get("intro"),
+        "body": iprox_data.get("body"),
+        "image": iprox_data.get("image"),
+        "type": iprox_data.get("type"),
+        "url": iprox_data.get("url"),
+        "creation_date": iprox_data.get("created"),
+        "modification_date": iprox_data.get("modified"),
+        "publication_date": iprox_data.get("publicationDate"),
+        "expiration_date": iprox_data.get("expirationDate"),
+    }
+
+
+def get_project_foreign_ids(iprox_data: dict):
+    """Get foreign project ids of an article, returns None if these are not a list of integers"""
+    project_foreign_ids = iprox_data.get("projectIds")
+    if not isinstance(project_foreign_ids, list):
+        return None
+    try:
+        return [int(x) for x in project_foreign_ids]
+    except (TypeError, ValueError):
+        return None
+
+
+def validate(items: list, serializer_class, get_data) -> tuple[dict, list]:
+    """Validate all items. Returns the validated data by foreign id and the result of each item,
+    the status of valid items is set once they are written
+    """
+    validated = {}
+    results = []
+    for index, item in enumerate(items):
+        result = {"index": index, "foreign_id": None, "status": None}
+        results.append(result)
+
+        if not isinstance(item, dict):
+            result["status"] = INVALID
+            result["errors"] = {"non_field_errors": ["Expected a JSON object"]}
+            continue
+
+        serializer = serializer_class(data=get_data(item))
+        if not serializer.is_valid():
+            result["foreign_id"] = item.get("foreign_id")
+            result["status"] = INVALID
+            result["errors"] = serializer.errors
+            continue
+
+        foreign_id = serializer.validated_data["foreign_id"]
+        result["foreign_id"] = foreign_id
+        if foreign_id in validated:
+            result["status"] = INVALID
+            result["errors"] = {"foreign_id": ["Duplicate foreign_id in payload"]}
+            continue
+        validated[foreign_id] = serializer.validated_data
+
+    return validated, results
+
+
+def get_stored_hashes(model, foreign_ids) -> dict:
+    """Get stored content hash by foreign id, of the existing items"""
+    return dict(
+        model.objects.filter(foreign_id__in=foreign_ids).values_list(
+            "foreign_id", "content_hash"
+        )
+    )
+
+
+def skip_unchanged(
+    validated: dict, results: list, content_hashes: dict, stored_hashes: dict
+):
+    """Leave out the items of which the content hash is unchanged"""
+    for result in results:
+        foreign_id = result["foreign_id"]
+        if result["status"] is not None or content_hashes[foreign_id] is None:
+            continue
+        if content_hashes[foreign_id] == stored_hashes.get(foreign_id):
+            result["status"] = UNCHANGED
+            del validated[foreign_id]
+
+
+def set_write_status(results: list, existing_foreign_ids: set):
+    """Set status of the written (valid) items"""
+    for result in results:
+        if result["status"] is None:
+            result["status"] = (
+                UPDATED if result["foreign_id"] in existing_foreign_ids else CREATED
+            )
+
+
+def get_summary(results: list) -> dict:
+    """Count results by status"""
+    summary = {CREATED: 0, UPDATED: 0, UNCHANGED: 0, INVALID: 0}
+    for result in results:
+        summary[result["status"]] += 1
+    return {**summary, "results": results}
+
+
+def upsert_projects(items: list) -> dict:
+    """Validate and write projects, existing projects (by foreign id) are updated"""
+    validated, results = validate(items, ProjectIngestSerializer, get_project_data)
+    content_hashes = {
+        x["foreign_id"]: get_content_hash(items[x["index"]])
+        for x in results
+        if x["status"] is None
+    }
+
+    # Every field is overwritten on conflict, except the follower count (see models/device.py)
+    update_fields = [
+        field.name
+        for field in Project._meta.concrete_fields
+        if not field.primary_key and field.name not in ["foreign_id", "follower_count"]
+    ]
+
+    with transaction.atomic():
+        stored_hashes = get_stored_hashes(Project, validated.keys())
+        skip_unchanged(validated, results, content_hashes, stored_hashes)
+
+        now = timezone.now()
+        projects = []
+        for foreign_id, data in validated.items():
+            # Equivalent of Project.save(), which is bypassed by bulk_create
+            projects.append(
+                Project(
+                    **data,
+                    active=True,
+                    last_seen=now,
+                    content_hash=content_hashes[foreign_id],
+                )
+            )
+
+        Project.objects.bulk_create(
+            projects,
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["foreign_id"],
+            update_fields=update_fields,
+        )
+
+    if len(projects) > 0:
+        projects_cache.invalidate()
+        project_coordinates.invalidate()
+
+    set_write_status(results, stored_hashes.keys())
+    return get_summary(results)
+
+
+def upsert_articles(items: list) -> dict:
+    """Validate and write articles and their links to projects, existing articles (by foreign id) are updated"""
+    validated, results = validate(items, ArticleIngestSerializer, get_article_data)
+
+    # Resolve the projects of all articles at once
+    article_project_foreign_ids = {}
+    content_hashes = {}
+    for result in results:
+        if result["status"] is None:
+            item = items[result["index"]]
+            article_project_foreign_ids[result["foreign_id"]] = get_project_foreign_ids(
+                item
+            )
+            content_hashes[result["foreign_id"]] = get_content_hash(item)
+    projects = Project.objects.in_bulk(
+        {y for x in article_project_foreign_ids.values() for y in x or []},
+        field_name="foreign_id",
+    )
+
+    article_project_ids = {}
+    for result in results:
+        if result["status"] is not None:
+            continue
+
+        foreign_id = result["foreign_id"]
+        project_foreign_ids = article_project_foreign_ids[foreign_id]
+        if project_foreign_ids is None:
+            result["status"] = INVALID
+            result["errors"] = {"projectIds": ["Expected a list of project ids"]}
+            del validated[foreign_id]
+            continue
+
+        unknown_project_ids = [x for x in project_foreign_ids if x not in projects]
+        if len(unknown_project_ids) > 0:
+            result["unknown_project_ids"] = unknown_project_ids
+            # Not stored, so the article is written again once its projects are known
+            content_hashes[foreign_id] = None
+
+        project_ids = {projects[x].pk for x in project_foreign_ids if x in projects}
+        if len(project_ids) == 0:
+            result["status"] = INVALID
+            result["errors"] = {"projectIds": ["No known project ids"]}
+            del validated[foreign_id]
+            continue
+        article_project_ids[foreign_id] = project_ids
+
+    # The posted fields are overwritten on conflict, like an update through the serializer
+    update_fields = list(get_article_data({}).keys()) + ["last_seen", "content_hash"]
+    update_fields.remove("foreign_id")
+
+    through = Article.projects.through
+    with transaction.atomic():
+        stored_hashes = get_stored_hashes(Article, validated.keys())
+        skip_unchanged(validated, results, content_hashes, stored_hashes)
+
+        articles = [
+            Article(**data, content_hash=content_hashes[foreign_id])
+            for foreign_id, data in validated.items()
+        ]
+        Article.objects.bulk_create(
+            articles,
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["foreign_id"],
+            update_fields=update_fields,
+        )
+
+        # Rewrite the links between the articles and their projects
+        article_pks = dict(
+            Article.objects.filter(foreign_id__in=validated.keys()).values_list(
+                "foreign_id", "pk"
+            )
+        )
+        links = {
+            (article_pks[foreign_id], project_id)
+            for foreign_id, project_ids in article_project_ids.items()
+            if foreign_id in validated
+            for project_id in project_ids
+        }
+        existing_links = {
+            (article_id, project_id): pk
+            for pk, article_id, project_id in through.objects.filter(
+                article_id__in=article_pks.values()
+            ).values_list("pk", "article_id", "project_id")
+        }
+        through.objects.filter(
+            pk__in=[pk for link, pk in existing_links.items() if link not in links]
+        ).delete()
+        through.objects.bulk_create(
+            [
+                through(article_id=article_id, project_id=project_id)
+                for article_id, project_id in links
+                if (article_id, project_id) not in existing_links
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+    if len(articles) > 0:
+        projects_cache.invalidate()
+
+    set_write_status(results, stored_hashes.keys())
+    return get_summary(results)
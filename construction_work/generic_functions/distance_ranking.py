@@ -0,0 +1,142 @@
+""" Array backed coordinate table of all projects, used to compute the distance to every project in a single
+    vectorized pass (see gps_utils.get_distances) instead of one geodesic solve per project.
+
+    The table is rebuilt lazily on the next lookup when:
+
+    - a project is saved or deleted within this process (ingest, garbage collector)
+    - a project is requested that is not part of the table yet
+    - the table is older than TABLE_TTL seconds, this picks up changes made by other uWSGI workers
+
+    Projects without (valid) coordinates, or with coordinates (0, 0), are stored as NaN and have no distance.
+"""
+
+import threading
+import time
+
+import numpy as np
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from construction_work.generic_functions.gps_utils import (
+    STRIDES_PER_METER,
+    get_distances,
+)
+from construction_work.models import Project
+
+TABLE_TTL = 300
+
+
+class ProjectCoordinates:
+    """Coordinate table of all projects, backed by numpy arrays sorted by project pk"""
+
+    def __init__(self, ttl=TABLE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._dirty = True
+        self._built_at = 0.0
+        # (project_ids, lats, lons) is swapped as a whole, readers never see a half-built table
+        self._table = (
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.float64),
+        )
+
+    def invalidate(self):
+        """Rebuild the table on next lookup"""
+        self._dirty = True
+
+    def _rebuild(self):
+        """Load coordinates of all projects from the database"""
+        rows = Project.objects.order_by("pk").values_list("pk", "coordinates")
+
+        project_ids = []
+        lats = []
+        lons = []
+        for pk, coordinates in rows:
+            lat, lon = np.nan, np.nan
+            if isinstance(coordinates, dict):
+                try:
+                    lat = float(coordinates.get("lat"))
+                    lon = float(coordinates.get("lon"))
+                except (TypeError, ValueError):
+                    lat, lon = np.nan, np.nan
+            if (lat, lon) == (0.0, 0.0):
+                lat, lon = np.nan, np.nan
+            project_ids.append(pk)
+            lats.append(lat)
+            lons.append(lon)
+
+        self._table = (
+            np.array(project_ids, dtype=np.int64),
+            np.array(lats, dtype=np.float64),
+            np.array(lons, dtype=np.float64),
+        )
+        self._built_at = time.monotonic()
+
+    def _get_table(self, force=False):
+        """Get current table, rebuild first if needed"""
+        expired = time.monotonic() - self._built_at > self.ttl
+        if force or self._dirty or expired:
+            with self._lock:
+                # Another thread might have rebuilt the table while we were waiting
+                expired = time.monotonic() - self._built_at > self.ttl
+                if force or self._dirty or expired:
+                    self._dirty = False
+                    self._rebuild()
+        return self._table
+
+    def _lookup(self, project_ids, force=False):
+        """Get lats and lons aligned with project_ids, returns None if any project is unknown"""
+        table_ids, table_lats, table_lons = self._get_table(force=force)
+        if len(table_ids) == 0:
+            return None
+
+        rows = np.searchsorted(table_ids, project_ids).clip(0, len(table_ids) - 1)
+        if not np.array_equal(table_ids[rows], project_ids):
+            return None
+        return table_lats[rows], table_lons[rows]
+
+    def get_meters(self, lat, lon, project_ids) -> np.ndarray:
+        """Get distance in meters from (lat, lon) to each of project_ids, NaN if unknown"""
+        project_ids = np.asarray(project_ids, dtype=np.int64)
+        if len(project_ids) == 0:
+            return np.empty(0, dtype=np.float64)
+
+        lookup = self._lookup(project_ids)
+        if lookup is None:
+            # Project(s) created after the table was built, try once more with a fresh table
+            lookup = self._lookup(project_ids, force=True)
+        if lookup is None:
+            return np.full(len(project_ids), np.nan)
+
+        lats, lons = lookup
+        return get_distances((float(lat), float(lon)), lats, lons)
+
+    def rank_by_distance(self, lat, lon, project_ids) -> tuple[list, dict]:
+        """Rank project_ids from near to far (unknown distances last, original order on ties)
+        Returns the ranked project ids and a {project_id: (meter, strides)} lookup
+        """
+        meters = self.get_meters(lat, lon, project_ids)
+        order = np.argsort(np.nan_to_num(meters, nan=np.inf), kind="stable")
+        ranked_ids = [int(x) for x in np.asarray(project_ids, dtype=np.int64)[order]]
+
+        distances = {}
+        for project_id, meter in zip(project_ids, meters.tolist()):
+            if np.isnan(meter):
+                distances[project_id] = (None, None)
+            else:
+                distances[project_id] = (
+                    int(meter),
+                    int(int(meter) * STRIDES_PER_METER),
+                )
+
+        return ranked_ids, distances
+
+
+project_coordinates = ProjectCoordinates()
+
+
+@receiver([post_save, post_delete], sender=Project)
+def invalidate_project_coordinates(sender, **kwargs):
+    """Rebuild coordinate table after projects changed"""
+    project_coordinates.invalidate()
@@ -0,0 +1,101 @@
+""" Streamed snapshots of the ingested projects and articles, used by the ETL to decide what to (re)post
+
+    The rows are read from a server-side cursor (QuerySet.iterator) and written to the response per chunk of
+    SNAPSHOT_CHUNK_SIZE rows, so memory use does not depend on the number of rows. The snapshot is either a single
+    JSON object (default, as before):
+
+    {"1337": {"modification_date": "2023-10-11 11:36:00+00:00"}, ...}
+
+    or NDJSON (output=ndjson), one object per line:
+
+    {"foreign_id": 1337, "modification_date": "2023-10-11 11:36:00+00:00"}
+"""
+
+import json
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from construction_work.generic_functions.bulk_ingest import NDJSON_CONTENT_TYPE
+
+SNAPSHOT_CHUNK_SIZE = 2000
+OUTPUT_NDJSON = "ndjson"
+
+
+class InvalidSince(Exception):
+    """Value of since is not a datetime"""
+
+    pass  # pylint: disable=unnecessary-pass
+
+
+def get_since(value):
+    """Parse value of since (ISO 8601), returns None if not given"""
+    if value is None:
+        return None
+
+    try:
+        since = parse_datetime(value)
+    except ValueError as error:
+        raise InvalidSince(value) from error
+    if since is None:
+        raise InvalidSince(value)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def get_rows(model, since=None):
+    """Get (foreign_id, modification_date) of all items, modified after since if given"""
+    queryset = model.objects.order_by("pk")
+    if since is not None:
+        queryset = queryset.filter(modification_date__gt=since)
+    return queryset.values_list("foreign_id", "modification_date").iterator(
+        chunk_size=SNAPSHOT_CHUNK_SIZE
+    )
+
+
+def get_chunks(rows):
+    """Split rows into lists of at most SNAPSHOT_CHUNK_SIZE rows"""
+    while True:
+        chunk = list(islice(rows, SNAPSHOT_CHUNK_SIZE))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def stream_json(rows):
+    """Stream rows as a single JSON object"""
+    yield "{"
+    separator = ""
+    for chunk in get_chunks(rows):
+        members = [
+            f'{json.dumps(str(foreign_id))}:{json.dumps({"modification_date": str(modification_date)})}'
+            for foreign_id, modification_date in chunk
+        ]
+        yield separator + ",".join(members)
+        separator = ","
+    yield "}"
+
+
+def stream_ndjson(rows):
+    """Stream rows as NDJSON"""
+    for chunk in get_chunks(rows):
+        yield "".join(
+            json.dumps(
+                {"foreign_id": foreign_id, "modification_date": str(modification_date)}
+            )
+            + "\n"
+            for foreign_id, modification_date in chunk
+        )
+
+
+def get_response(model, since=None, output=None) -> StreamingHttpResponse:
+    """Get streamed snapshot of model (project or article)"""
+    rows = get_rows(model, since)
+    if output == OUTPUT_NDJSON:
+        return StreamingHttpResponse(
+            stream_ndjson(rows), content_type=NDJSON_CONTENT_TYPE
+        )
+    return StreamingHttpResponse(stream_json(rows), content_type="application/json")
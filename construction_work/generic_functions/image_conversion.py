@@ -1,15 +1,42 @@
 """ Convert/Scale images to jpg while maintaining the aspect-ration and extract gps data if possible
     Supported images formats: HEIC, AVIF, JPG, PNG
+
+    The image header (and EXIF data) is read first (see read_metadata), malformed images and images with more than
+    MAX_PIXELS pixels are rejected before any pixels are decoded.
+
+    Each scaled image is also encoded in the formats of VARIANT_FORMATS supported by Pillow (see get_variant_formats),
+    these variants are smaller than the jpg and served to clients that accept them (see image_variants).
 """
 
 import io
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
-import exifread
 import pyheif
 import whatimage
 from PIL import Image
 
+# Images with more pixels are rejected, this caps the memory used for decoding (a 12MP photo is 4032 x 3024 pixels)
+MAX_PIXELS = 50_000_000
+
+EXIF_ORIENTATION = 0x0112
+EXIF_GPS_IFD = 0x8825
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+
+# EXIF orientation: transpose to display the image upright (see PIL.ImageOps.exif_transpose)
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
 DIMENSIONS = {
     "SMALL": (320, 180),
     "MEDIUM": (768, 432),
@@ -17,9 +44,28 @@ DIMENSIONS = {
     "XLARGE": (1920, 1080),
 }
 
+# Image.resize() first shrinks by an integer factor (Image.reduce) while the result stays REDUCING_GAP times larger
+# than the target size, only the remaining step is done with LANCZOS
+REDUCING_GAP = 3.0
+
+# Pillow releases the GIL while encoding, so the scaled images are encoded in parallel
+ENCODE_WORKERS = 4
+
+# Pillow format: mime type, most preferred (smallest) first
+VARIANT_FORMATS = {
+    "AVIF": "image/avif",
+    "WEBP": "image/webp",
+}
+
+
+def get_variant_formats() -> list:
+    """Get variant formats Pillow can encode (WebP and AVIF support depend on the installed libraries)"""
+    Image.init()
+    return [x for x in VARIANT_FORMATS if x in Image.SAVE]
+
 
-class UnsupportedFormat(Exception):
-    """Exception class"""
+class ImageTooLarge(Exception):
+    """Image has more than MAX_PIXELS pixels"""
 
     pass  # pylint: disable=unnecessary-pass
 
@@ -29,8 +75,12 @@ class ImageConversion:
     Supported images formats: HEIC, AVIF, JPG, PNG
     """
 
-    def __init__(self, image_data, image_name=None):
+    def __init__(self, image_data, image_name=None, cascade=True, variant_formats=None):
         self.image_data = image_data
+        self.cascade = cascade
+        if variant_formats is None:
+            variant_formats = get_variant_formats()
+        self.variant_formats = variant_formats
         self.target_sizes = [
             DIMENSIONS["SMALL"],
             DIMENSIONS["MEDIUM"],
@@ -42,19 +92,20 @@ class ImageConversion:
         self.aspect_ratio = None
         self.landscape = False
         self.image_format = None
+        self.orientation = 1
+        self.heif_file = None
         self.raw_data = None
         self.gps_info = {"lat": None, "lon": None}
         self.images = {}
+        self.variants = {}
         self.image_name = image_name
         self.mime_type = "image/jpeg"
 
     def run(self):
-        """process image"""
-        self.get_format()
-        if not self.get_raw_data():
+        """process image, raises ImageTooLarge for images with more than MAX_PIXELS pixels"""
+        if not self.read_metadata() or not self.get_raw_data():
             # Bail-out! We caught an unsupported image format.
             return False
-        self.get_gps_info()
         self.scale_image()
         self.mime_type = "image/{format}".format(format=self.image_format)
         self.set_image(
@@ -66,30 +117,78 @@ class ImageConversion:
         """Get image format, returns None if unknown format"""
         self.image_format = whatimage.identify_image(self.image_data)
 
-    def get_raw_data(self):
-        """Get the raw image data and meta-data. Raise an exception for unsupported image formats"""
+    def read_metadata(self):
+        """Read format, dimensions, orientation and GPS data. Only the image header and EXIF data are parsed, no
+        pixels are decoded. Returns False for unsupported or malformed images, raises ImageTooLarge for images with
+        more than MAX_PIXELS pixels
+        """
+        self.get_format()
         try:
             if self.image_format in ["heic", "avif"]:
-                image = pyheif.read(self.image_data)
+                # Transformations (rotation, mirroring) are applied by libheif when decoding
+                self.heif_file = pyheif.open(self.image_data)
+                width, height = self.heif_file.size
+                exif = self.get_heif_exif(self.heif_file)
+            elif self.image_format in ["jpeg", "png"]:
+                self.raw_data = Image.open(
+                    BytesIO(self.image_data), formats=[self.image_format.upper()]
+                )
+                width, height = self.raw_data.size
+                # Not getexif(), for png it decodes the image to find EXIF data after the pixel data
+                exif = Image.Exif()
+                if "exif" in self.raw_data.info:
+                    exif.load(self.raw_data.info["exif"])
+                self.orientation = exif.get(EXIF_ORIENTATION, 1)
+            else:
+                return False
+        except Image.DecompressionBombError as error:
+            raise ImageTooLarge(str(error)) from error
+        except (pyheif.error.HeifError, OSError, SyntaxError, ValueError):
+            return False
+
+        if self.orientation not in ORIENTATION_TRANSPOSE:
+            self.orientation = 1
+        if self.orientation >= 5:
+            # Stored rotated by 90 degrees
+            width, height = height, width
+
+        if width <= 0 or height <= 0:
+            return False
+        if width * height > MAX_PIXELS:
+            raise ImageTooLarge(f"Image of {width} x {height} pixels")
+
+        self.width = width
+        self.height = height
+        self.aspect_ratio = round(float(self.height) / float(self.width), 2)
+        self.landscape = bool(self.width > self.height)
+        self.get_gps_info(exif)
+        return True
+
+    @staticmethod
+    def get_heif_exif(heif_file):
+        """Get EXIF data from the HEIF metadata"""
+        exif = Image.Exif()
+        for metadata in heif_file.metadata or []:
+            if metadata["type"] == "Exif":
+                exif.load(metadata["data"])
+                break
+        return exif
+
+    def get_raw_data(self):
+        """Decode the image read by read_metadata"""
+        try:
+            if self.heif_file is not None:
+                image = self.heif_file.load()
                 self.raw_data = Image.frombytes(
                     mode=image.mode, size=image.size, data=image.data
                 )
-            elif self.image_format in ["jpeg", "png"]:
-                image = BytesIO(self.image_data)
-                self.raw_data = Image.open(image)
-                if self.raw_data.mode == "RGBA":  # JPG Doesn't support alpha channel.
-                    self.raw_data = self.raw_data.convert("RGB")
-            else:
-                raise UnsupportedFormat("Unsupported format")
-            self.width = self.raw_data.width
-            self.height = self.raw_data.height
-            self.aspect_ratio = round(float(self.height) / float(self.width), 2)
-            self.landscape = bool(self.width > self.height)
+            if self.raw_data.mode == "RGBA":  # JPG Doesn't support alpha channel.
+                self.raw_data = self.raw_data.convert("RGB")
 
             # Convert original image to jpeg
             if self.image_format != "jpeg":
                 stream = io.BytesIO()
-                self.raw_data.save(stream, format="JPEG")
+                self.transpose(self.raw_data).save(stream, format="JPEG")
                 self.set_image(
                     data=stream.getvalue(),
                     width=self.width,
@@ -98,68 +197,153 @@ class ImageConversion:
                 )
 
             return True
-        except UnsupportedFormat:
+        except (pyheif.error.HeifError, OSError, SyntaxError, ValueError):
             return False
 
-    def get_gps_info(self):
-        """Get GPS degrees, minutes and seconds from efix data and convert to decimal (negate if E or S)
+    def get_gps_info(self, exif):
+        """Get GPS degrees, minutes and seconds from efix data and convert to decimal (negate if W or S)
         If the image does not have any GPS data embedded, catch the exception
         """
         try:
-            tags = exifread.process_file(BytesIO(self.image_data))
-            lat_ref = "N" in tags.get("GPS GPSLatitudeRef").values
-            lat_dms = tags.get("GPS GPSLatitude").values
+            gps = exif.get_ifd(EXIF_GPS_IFD)
+            lat_ref = "N" in gps[GPS_LATITUDE_REF]
+            lat_dms = gps[GPS_LATITUDE]
             self.gps_info["lat"] = (
                 lat_dms[0] + lat_dms[1] / 60.0 + lat_dms[2] / 3600.0
             ) * (1 if lat_ref else -1)
 
-            lon_ref = "W" in tags.get("GPS GPSLongitudeRef").values
-            lon_dms = tags.get("GPS GPSLongitude").values
+            lon_ref = "W" in gps[GPS_LONGITUDE_REF]
+            lon_dms = gps[GPS_LONGITUDE]
             self.gps_info["lon"] = (
                 lon_dms[0] + lon_dms[1] / 60.0 + lon_dms[2] / 3600.0
             ) * (-1 if lon_ref else 1)
         except Exception:
-            pass
+            self.gps_info = {"lat": None, "lon": None}
+
+    def transpose(self, image):
+        """Transpose image according to its EXIF orientation"""
+        if self.orientation in ORIENTATION_TRANSPOSE:
+            return image.transpose(ORIENTATION_TRANSPOSE[self.orientation])
+        return image
+
+    def get_stored_size(self, size):
+        """Get size of the image as stored, before applying its EXIF orientation"""
+        if self.orientation >= 5:
+            return size[1], size[0]
+        return size
 
     def calculate_new_size(self, target_size):
         """Keep aspect ratio whilst setting new width and height"""
         if self.landscape:
             width = target_size[0]
-            ratio = width / float(self.raw_data.size[0])
-            height = int((float(self.raw_data.size[1]) * float(ratio)))
+            ratio = width / float(self.width)
+            height = int((float(self.height) * float(ratio)))
         else:
             height = target_size[1]
-            ratio = height / float(self.raw_data.size[1])
-            width = int((float(self.raw_data.size[0]) * float(ratio)))
+            ratio = height / float(self.height)
+            width = int((float(self.width) * float(ratio)))
 
         return tuple((width, height))
 
-    def scale_image(self):
-        """For each desired image size convert the image and write the result into self.images dict"""
+    def get_new_sizes(self):
+        """Get new size of each target size the image is large enough for, from small to large"""
+        new_sizes = []
         for target_size in self.target_sizes:
-            stream = io.BytesIO()
             valid_landscape_target = self.landscape and self.width >= target_size[0]
             valid_portrait_target = not self.landscape and self.height >= target_size[1]
             if valid_landscape_target or valid_portrait_target:
-                new_size = self.calculate_new_size(target_size)
-                img = self.raw_data.resize(new_size, Image.Resampling.LANCZOS)
-                img.save(stream, format="JPEG")
+                new_sizes.append(self.calculate_new_size(target_size))
+        return new_sizes
+
+    def resize_direct(self, new_sizes):
+        """Yield (new_size, image) scaling the original image to every new size"""
+        for new_size in new_sizes:
+            image = self.raw_data.resize(
+                self.get_stored_size(new_size), Image.Resampling.LANCZOS
+            )
+            yield new_size, self.transpose(image)
+
+    def resize_cascade(self, new_sizes):
+        """Yield (new_size, image) from large to small, each image is scaled down from the previous (larger) one.
+        Only the largest image is scaled from the original image.
+        """
+        if self.image_format == "jpeg":
+            # Let the decoder scale down by 1/2, 1/4 or 1/8 (DCT scaling), never below the largest new size
+            self.raw_data.draft(self.raw_data.mode, self.get_stored_size(new_sizes[-1]))
+
+        # Scaled as stored, each scaled image is transposed to its EXIF orientation
+        source = self.raw_data
+        for new_size in reversed(new_sizes):
+            source = source.resize(
+                self.get_stored_size(new_size),
+                Image.Resampling.LANCZOS,
+                reducing_gap=REDUCING_GAP,
+            )
+            yield new_size, self.transpose(source)
+
+    @staticmethod
+    def encode(image, image_format="JPEG"):
+        """Encode image, as jpeg by default"""
+        stream = io.BytesIO()
+        image.save(stream, format=image_format)
+        return stream.getvalue()
+
+    def scale_image(self):
+        """For each desired image size convert the image and write the result into self.images dict"""
+        new_sizes = self.get_new_sizes()
+        if len(new_sizes) == 0:
+            return
+
+        resized = self.resize_cascade if self.cascade else self.resize_direct
+        with ThreadPoolExecutor(max_workers=ENCODE_WORKERS) as executor:
+            # Encoding an image overlaps with scaling the next one
+            encoded = {}
+            for new_size, img in resized(new_sizes):
+                encoded[new_size] = {
+                    x: executor.submit(self.encode, img, x)
+                    for x in ["JPEG"] + self.variant_formats
+                }
+
+            for new_size in new_sizes:
                 key = "{width}x{height}".format(width=new_size[0], height=new_size[1])
                 self.set_image(
-                    data=stream.getvalue(),
+                    data=encoded[new_size]["JPEG"].result(),
                     width=new_size[0],
                     height=new_size[1],
                     key=key,
                 )
+                for variant_format in self.variant_formats:
+                    self.set_image(
+                        data=encoded[new_size][variant_format].result(),
+                        width=new_size[0],
+                        height=new_size[1],
+                        key=f"{key}-{variant_format.lower()}",
+                        mime_type=VARIANT_FORMATS[variant_format],
+                        variant_of=key,
+                    )
 
-    def set_image(self, data=None, width=None, height=None, key=None):
-        """Populate self.images"""
-        self.images[key] = {
+    def set_image(
+        self,
+        data=None,
+        width=None,
+        height=None,
+        key=None,
+        mime_type=None,
+        variant_of=None,
+    ):
+        """Populate self.images, or self.variants for a variant of the image stored by key variant_of"""
+        image = {
+            "key": key,
             "data": data,
             "width": width,
             "height": height,
             "filename": "{key}-{image_name}".format(
                 key=key, image_name=self.image_name
             ),
-            "mime_type": self.mime_type,
+            "mime_type": mime_type or self.mime_type,
         }
+        if variant_of is None:
+            self.images[key] = image
+        else:
+            image["variant_of"] = variant_of
+            self.variants[key] = image
@@ -0,0 +1,188 @@
+""" Background conversion of uploaded warning images
+
+    An upload is stored as is (see image_storage) together with a pending ImageConversionJob, the request does not
+    wait for the conversion. The convertimages management command claims pending jobs, converts them in a process
+    pool and adds the resulting images to the warning image. Until then the warning image has no images and is left
+    out of the public warning messages. The upload is deleted once its job is done, failed or deleted.
+
+    A claim is identified by the attempt: a worker only finishes (or fails) a job as long as it is still running the
+    attempt it claimed, a stale job claimed again by another worker is left to that worker.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from construction_work.generic_functions import image_storage
+from construction_work.generic_functions.generic_logger import Logger
+from construction_work.generic_functions.image_conversion import ImageConversion
+from construction_work.models import Image, ImageConversionJob, WarningImage
+from construction_work.models.image import delete_stored_data_if_unused
+
+logger = Logger()
+
+# A job running longer than this is assumed to be lost (e.g. the worker was killed) and is claimed again
+STALE_JOB_TIMEOUT = timedelta(minutes=10)
+MAX_ATTEMPTS = 3
+
+
+def enqueue(warning_image: WarningImage, data: bytes, description: str):
+    """Store uploaded image and schedule its conversion"""
+    with transaction.atomic():
+        return ImageConversionJob.objects.create(
+            warning_image=warning_image,
+            content_hash=image_storage.save(data),
+            description=description,
+        )
+
+
+def convert(data: bytes, description: str):
+    """Convert uploaded image into its scaled images, runs in a worker process
+    Returns None for unsupported image formats
+    """
+    image_conversion = ImageConversion(data, description)
+    if image_conversion.run() is False:
+        return None
+
+    return {
+        "images": list(image_conversion.images.values()),
+        "variants": list(image_conversion.variants.values()),
+        "aspect_ratio": image_conversion.aspect_ratio,
+        "gps_info": image_conversion.gps_info,
+    }
+
+
+def claim_jobs(limit: int) -> list:
+    """Claim pending (or stale) jobs, other workers skip the claimed jobs"""
+    stale = timezone.now() - STALE_JOB_TIMEOUT
+    given_up = ImageConversionJob.objects.filter(
+        status=ImageConversionJob.RUNNING,
+        modification_date__lt=stale,
+        attempts__gte=MAX_ATTEMPTS,
+    )
+    for pk, content_hash in given_up.values_list("pk", "content_hash"):
+        if given_up.filter(pk=pk).update(
+            status=ImageConversionJob.FAILED, error="Too many attempts"
+        ):
+            delete_stored_data_if_unused(content_hash)
+
+    with transaction.atomic():
+        jobs = list(
+            ImageConversionJob.objects.filter(
+                Q(status=ImageConversionJob.PENDING)
+                | Q(status=ImageConversionJob.RUNNING, modification_date__lt=stale)
+            )
+            .filter(attempts__lt=MAX_ATTEMPTS)
+            .order_by("pk")
+            .select_for_update(skip_locked=True)[:limit]
+        )
+        ImageConversionJob.objects.filter(pk__in=[x.pk for x in jobs]).update(
+            status=ImageConversionJob.RUNNING,
+            attempts=F("attempts") + 1,
+            modification_date=timezone.now(),
+        )
+    for job in jobs:
+        job.status = ImageConversionJob.RUNNING
+        job.attempts += 1
+    return jobs
+
+
+def get_claimed(job: ImageConversionJob):
+    """Get queryset of the job, as long as it is still running the attempt claimed by this worker"""
+    return ImageConversionJob.objects.filter(
+        pk=job.pk, status=ImageConversionJob.RUNNING, attempts=job.attempts
+    )
+
+
+def fail(job: ImageConversionJob, error: str):
+    """Mark job as failed"""
+    logger.error(f"Image conversion job {job.pk} failed: {error}")
+    updated = get_claimed(job).update(
+        status=ImageConversionJob.FAILED,
+        error=error,
+        modification_date=timezone.now(),
+    )
+    if updated == 0:
+        logger.info(f"Image conversion job {job.pk} was claimed again, not failed")
+        return
+
+    job.status = ImageConversionJob.FAILED
+    job.error = error
+    delete_stored_data_if_unused(job.content_hash)
+
+
+def finish(job: ImageConversionJob, result: dict):
+    """Store converted images and add them to the warning image"""
+    if result is None:
+        fail(job, "Unsupported image format")
+        return
+
+    with transaction.atomic():
+        # Lock the job, so it is not claimed again while its images are stored
+        if get_claimed(job).select_for_update().first() is None:
+            # Claimed again by another worker after going stale, or the warning (image) was deleted in the
+            # meantime, which also deleted the job
+            logger.info(
+                f"Image conversion job {job.pk} was claimed again or deleted, not finished"
+            )
+            return
+
+        warning_image = WarningImage.objects.filter(pk=job.warning_image_id).first()
+        if warning_image is None:
+            return
+
+        images = {}
+        for image in result["images"] + result["variants"]:
+            image_object = Image(
+                content_hash=image_storage.save(image["data"]),
+                description=job.description,
+                width=image["width"],
+                height=image["height"],
+                aspect_ratio=result["aspect_ratio"],
+                coordinates=result["gps_info"],
+                mime_type=image["mime_type"],
+                variant_of=images.get(image.get("variant_of")),
+            )
+            image_object.save()
+            images[image["key"]] = image_object
+        warning_image.images.add(*images.values())
+
+        job.status = ImageConversionJob.DONE
+        job.save(update_fields=["status", "modification_date"])
+
+    delete_stored_data_if_unused(job.content_hash)
+
+
+def run_jobs(limit: int, executor=None) -> int:
+    """Claim and convert jobs, in the executor (e.g. a process pool) if given, returns the number of claimed jobs"""
+    jobs = claim_jobs(limit)
+
+    conversions = []
+    for job in jobs:
+        try:
+            with image_storage.open_file(job.content_hash) as f:
+                data = f.read()
+        except FileNotFoundError:
+            fail(job, "Uploaded image not found")
+            continue
+
+        # Without executor the conversion runs in this process, one job at a time
+        future = None
+        if executor is not None:
+            future = executor.submit(convert, data, job.description)
+        conversions.append((job, data, future))
+
+    for job, data, future in conversions:
+        try:
+            if future is None:
+                result = convert(data, job.description)
+            else:
+                result = future.result()
+        except Exception as error:
+            fail(job, repr(error))
+            continue
+        finish(job, result)
+
+    return len(jobs)
@@ -0,0 +1,64 @@
+""" Storage of image data outside of the database
+
+    Image data is stored content addressed: a file is named after the sha256 hash of its content, so identical
+    images are stored once and a stored file never changes.
+
+    The backend is the "images" storage in STORAGES (see settings). It defaults to the local filesystem, any Django
+    storage backend (e.g. an object store) can be configured instead.
+
+    As a file is shared, saving and deleting the same data is serialized by a database lock on its content hash
+    (see lock). The row referring to saved data is stored in the transaction of the save, so a file found by save()
+    is not deleted before that row is committed.
+"""
+
+import hashlib
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import connection
+
+STORAGE_ALIAS = "images"
+
+
+def get_storage():
+    """Get configured image storage backend"""
+    return storages[STORAGE_ALIAS]
+
+
+def get_content_hash(data: bytes) -> str:
+    """Get content hash of image data"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_name(content_hash: str) -> str:
+    """Get storage name of content hash, spread over subdirectories to keep directories small"""
+    return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}"
+
+
+def lock(content_hash: str):
+    """Lock content hash until the end of the transaction"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [content_hash])
+
+
+def save(data: bytes) -> str:
+    """Store image data, returns its content hash"""
+    content_hash = get_content_hash(data)
+    name = get_name(content_hash)
+
+    lock(content_hash)
+    storage = get_storage()
+    if not storage.exists(name):
+        storage.save(name, ContentFile(data))
+    return content_hash
+
+
+def open_file(content_hash: str) -> File:
+    """Open stored image data for reading, raises FileNotFoundError if missing"""
+    return get_storage().open(get_name(content_hash), "rb")
+
+
+def delete(content_hash: str):
+    """Delete stored image data"""
+    get_storage().delete(get_name(content_hash))
@@ -0,0 +1,53 @@
+""" Content negotiation of image variants
+
+    Scaled images of warnings are also stored as smaller variants, e.g. WebP (see ImageConversion and
+    Image.variant_of). The image sources of a response only refer to the jpg images, the image view serves the most
+    preferred variant the client accepts instead (see views_generic.image).
+
+    Only mime types explicitly listed in the Accept header are used, clients accepting anything (*/* or image/*) get
+    jpg as before.
+"""
+
+from construction_work.generic_functions.image_conversion import VARIANT_FORMATS
+from construction_work.models import Image
+
+# Most preferred (smallest) first
+VARIANT_MIME_TYPES = list(VARIANT_FORMATS.values())
+
+
+def get_accepted_mime_types(request) -> list:
+    """Get variant mime types explicitly accepted by the client, most preferred first"""
+    mime_types = set()
+    for media_range in request.headers.get("Accept", "").split(","):
+        mime_type, *params = [x.strip() for x in media_range.split(";")]
+        if mime_type not in VARIANT_MIME_TYPES:
+            continue
+
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            mime_types.add(mime_type)
+    return [x for x in VARIANT_MIME_TYPES if x in mime_types]
+
+
+def get_variant(image: Image, mime_types: list):
+    """Get most preferred variant of image within mime_types, returns None if there is none"""
+    if len(mime_types) == 0 or image.variant_of_id is not None:
+        return None
+
+    variants = {x.mime_type: x for x in image.variants.filter(mime_type__in=mime_types)}
+    for mime_type in mime_types:
+        if mime_type in variants:
+            return variants[mime_type]
+    return None
+
+
+def exclude_variants(images) -> list:
+    """Leave out the variants, these are never listed as image source"""
+    return [x for x in images if x.variant_of_id is None]
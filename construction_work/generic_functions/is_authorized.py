@@ -7,6 +7,9 @@
     @isAuthorized
     def example(request):
         <method body>
+
+    The same checks are available as DRF authentication classes (AESTokenAuthentication, ManagerTokenAuthentication).
+    The request.META keys of the auth headers are computed once, when decorating or defining the class.
 """
 
 import functools
@@ -18,63 +21,89 @@ from django.conf import settings
 from django.http import HttpRequest
 from django.http.response import HttpResponseForbidden
 from jwt.exceptions import ExpiredSignatureError, InvalidSignatureError
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
 
 from construction_work.generic_functions.aes_cipher import AESCipher, AESException
 from construction_work.generic_functions.generic_logger import Logger
+from construction_work.generic_functions.token_cache import MISSING, TokenCache
 from construction_work.models.project_manager import ProjectManager
 
 logger = Logger()
 
 AES_SECRET = os.getenv("AES_SECRET")
 
+# Headers of the app (device) and ETL (ingest) token, and of the project manager token
+DEVICE_AUTH_HEADERS = ["IngestAuthorization", "DeviceAuthorization"]
+MANAGER_AUTH_HEADERS = ["UserAuthorization"]
 
-def get_token_from_request(request: HttpRequest, auth_headers=[]):
-    """Get the AES encrypted token from the request"""
+# Decrypted tokens (UUIDs) by ciphertext, None if not a valid token
+decrypted_tokens = TokenCache()
+
+
+def get_meta_keys(auth_headers) -> list:
+    """Get request.META keys of headers"""
+    return [f"HTTP_{x.upper()}" for x in auth_headers]
 
-    auth_token = None
-    for k, v in request.META.items():
-        if k in [f"HTTP_{x.upper()}" for x in auth_headers]:
-            auth_token = v
-            break
 
-    if auth_token is None:
-        for k, v in request.META.get("headers", {}).items():
-            if k in auth_headers:
-                auth_token = v
+def get_token_from_request(request: HttpRequest, auth_headers=[], meta_keys=None):
+    """Get the AES encrypted token from the request, meta_keys are the META keys of auth_headers (see get_meta_keys)"""
+    if meta_keys is None:
+        meta_keys = get_meta_keys(auth_headers)
+
+    for key in meta_keys:
+        auth_token = request.META.get(key)
+        if auth_token is not None:
+            return auth_token
+
+    auth_token = None
+    headers = request.META.get("headers", {})
+    for header in auth_headers:
+        if header in headers:
+            auth_token = headers[header]
 
     return auth_token
 
 
+def decrypt_token(encrypted_token):
+    """Decrypt AES encrypted UUID, returns None if the token is invalid. Repeated tokens are served from the cache"""
+    decrypted_token = decrypted_tokens.get(encrypted_token)
+    if decrypted_token is not MISSING:
+        return decrypted_token
+
+    try:
+        decrypted_token = AESCipher(encrypted_token, AES_SECRET).decrypt()
+        # Check if token is valid UUID, if not ValueError will be thrown
+        UUID(decrypted_token, version=4)
+    except AESException as e:
+        logger.error(e)
+        decrypted_token = None
+    except ValueError as e:
+        logger.error(e)
+        decrypted_token = None
+
+    decrypted_tokens.set(encrypted_token, decrypted_token)
+    return decrypted_token
+
+
 class IsAuthorized:
     """Is authorized"""
 
     def __init__(self, func):
         functools.update_wrapper(self, func)
         self.func = func
+        self.meta_keys = get_meta_keys(DEVICE_AUTH_HEADERS)
 
     @staticmethod
     def is_valid_auth_token(encrypted_token):
         """Test is ingest token is valid"""
-        try:
-            decrypted_token = AESCipher(encrypted_token, AES_SECRET).decrypt()
-            # Check if token is valid UUID, if not ValueError will be thrown
-            UUID(decrypted_token, version=4)
-            return True
-        except AESException as e:
-            logger.error(e)
-            return False
-        except ValueError as e:
-            logger.error(e)
-            return False
+        return decrypt_token(encrypted_token) is not None
 
     def __call__(self, *args, **kwargs):
         request = args[0]
-
-        auth_headers = [
-            "IngestAuthorization",
-            "DeviceAuthorization",
-        ]
-        auth_token = get_token_from_request(request, auth_headers)
+        auth_token = get_token_from_request(
+            request, DEVICE_AUTH_HEADERS, self.meta_keys
+        )
 
         if auth_token is None or self.is_valid_auth_token(auth_token) is False:
             return HttpResponseForbidden()
@@ -88,32 +117,22 @@ class ManagerAuthorized:
     def __init__(self, func):
         functools.update_wrapper(self, func)
         self.func = func
+        self.meta_keys = get_meta_keys(MANAGER_AUTH_HEADERS)
 
     @staticmethod
     def is_valid_manager_key(encrypted_token):
         """Test is ingest token is valid"""
-        try:
-            decrypted_token = AESCipher(encrypted_token, AES_SECRET).decrypt()
-            # Check if token is valid UUID, if not ValueError will be thrown
-            UUID(decrypted_token, version=4)
-            # Decrypted token is project manager key, check if it exists
-            project_manager = ProjectManager.objects.filter(
-                manager_key=decrypted_token
-            ).first()
-            if project_manager is None:
-                return False
-            return True
-        except AESException as e:
-            logger.error(e)
-            return False
-        except ValueError as e:
-            logger.error(e)
+        decrypted_token = decrypt_token(encrypted_token)
+        if decrypted_token is None:
             return False
+        # Decrypted token is project manager key, check if it (still) exists
+        return ProjectManager.objects.filter(manager_key=decrypted_token).exists()
 
     def __call__(self, *args, **kwargs):
         request = args[0]
-        auth_headers = ["UserAuthorization"]
-        auth_token = get_token_from_request(request, auth_headers)
+        auth_token = get_token_from_request(
+            request, MANAGER_AUTH_HEADERS, self.meta_keys
+        )
 
         if auth_token is None or self.is_valid_manager_key(auth_token) is False:
             return HttpResponseForbidden()
@@ -121,6 +140,69 @@ class ManagerAuthorized:
         return self.func(*args, **kwargs)
 
 
+class TokenUser:
+    """Authenticated user of an AES token: the app, the ETL or a project manager"""
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, project_manager=None):
+        self.project_manager = project_manager
+
+
+class AESTokenAuthentication(BaseAuthentication):
+    """DRF authentication of the app (device) and ETL (ingest) token, like IsAuthorized
+
+    Usage:
+
+    @api_view(["GET"])
+    @authentication_classes([AESTokenAuthentication])
+    @permission_classes([IsAuthenticated])
+    def example(request):
+        <method body>
+    """
+
+    auth_headers = DEVICE_AUTH_HEADERS
+    meta_keys = get_meta_keys(DEVICE_AUTH_HEADERS)
+
+    def authenticate(self, request):
+        auth_token = get_token_from_request(request, self.auth_headers, self.meta_keys)
+        if auth_token is None:
+            return None
+
+        user = self.get_user(auth_token)
+        if user is None:
+            raise AuthenticationFailed()
+        return (user, auth_token)
+
+    def get_user(self, auth_token):
+        """Get user of a token, None if the token is invalid"""
+        if decrypt_token(auth_token) is None:
+            return None
+        return TokenUser()
+
+
+class ManagerTokenAuthentication(AESTokenAuthentication):
+    """DRF authentication of the project manager token, like ManagerAuthorized. The project manager is available
+    as request.user.project_manager
+    """
+
+    auth_headers = MANAGER_AUTH_HEADERS
+    meta_keys = get_meta_keys(MANAGER_AUTH_HEADERS)
+
+    def get_user(self, auth_token):
+        """Get user of a token, None if the token is invalid or its project manager does not exist"""
+        decrypted_token = decrypt_token(auth_token)
+        if decrypted_token is None:
+            return None
+        project_manager = ProjectManager.objects.filter(
+            manager_key=decrypted_token
+        ).first()
+        if project_manager is None:
+            return None
+        return TokenUser(project_manager)
+
+
 class JWTAuthorized:
     """JWT authorized"""
 
@@ -11,9 +11,8 @@
     Introduction:
 
     The class provided in this repository can be imported into your project and used as a decorator
-    for any method. It has the ability to cache the output of a function provided that the
-    method takes at least one argument (read: argument, not keyword argument!). The _first_
-    argument is used as a key for storing the cache into a dictionary.
+    for any method. It caches the output of a function, keyed on all of its arguments and keyword
+    arguments (or on the result of a custom `key_func`). Lookups, inserts and evictions are O(1).
 
     Example usage:
 
@@ -24,7 +23,6 @@
 
     memoize = Memoize(ttl=300, max_items=100)
 
-    @api_view(['GET'])
     @memoize
     def students(year, age=None):
         query = {'year': year}
@@ -32,38 +30,59 @@
             query['age'] = age
         _students = list(Student.objects.objects.filter(**query).all())
         ...
-        return Response(result)
+        return result
 
-    @api_view(['GET'])
-    @memoize(ttl=5)
-    def in_classroom(building):
-        query = {'building': building}
+    @memoize(ttl=5, key_func=lambda request: request.GET.get('building'))
+    def in_classroom(request):
+        query = {'building': request.GET.get('building')}
         _students = list(InClassRoom.objects.objects.filter(**query).all())
         ...
-        return Response(result)
+        return result
 
     In above example you can use the memoize decorator with a predefined `ttl` in seconds or override
-    the `ttl` for a specific use case.
+    the `ttl` and `key_func` for a specific use case.
 
     Behaviour:
 
-    - When the `ttl` has expired for a cached item, the cache is invalid and will be cleared on next call.
-    - When the amount of items exceeds the `max_items`, items with will be purged by ttl until `max_items` are
-      present in the cache
-    - `ttl` can be overriden for a specific use case by setting the `ttl` in the decorator as a `kwarg`
+    - Items are kept in least-recently-used order. When the amount of items exceeds `max_items`, the least
+      recently used item is evicted.
+    - Expired items are removed lazily, when they are requested.
+    - The cache key is built from all args and kwargs of the call, prefixed with the decorated function (two
+      functions sharing one Memoize instance never collide). Calls with unhashable arguments are not cached.
+      A `key_func(*args, **kwargs)` replaces the args/kwargs part of the key.
+    - With `stale_while_revalidate=True` an expired item is still returned (for at most `stale_ttl` seconds
+      after expiring) while a background thread refreshes it.
+    - `stats()` returns the hit, miss, eviction and refresh counters of the instance.
     - `max_items` and `ttl` are set to a chosen value on class initialization, when omitted they default to
       `ttl:` 300 seconds and `max_items:` 128 items.
+    - The cache is thread-safe. The decorated function itself is executed outside the lock.
 
     Dependencies:
 
-    Memoize depends on the python build-ins `time` and `functools`
+    Memoize depends on the python build-ins `collections`, `functools`, `threading` and `time`
 """
 import functools
+import threading
 import time
+from collections import OrderedDict
+
+from construction_work.generic_functions.generic_logger import Logger
 
 TTL = 300
 MAX_ITEMS = 128
 
+logger = Logger()
+
+# Separates args from kwargs in a key, unlike any argument value (see functools._make_key)
+_KWD_MARK = (object(),)
+
+
+def make_key(*args, **kwargs):
+    """Default cache key, all args and kwargs of the call"""
+    if not kwargs:
+        return args
+    return args + _KWD_MARK + tuple(sorted(kwargs.items()))
+
 
 class Memoize:
     """Example usage:
@@ -79,71 +98,147 @@ class Memoize:
         ...
         return result
 
-    @memoize(ttl=5)
-    def signed_in(building):
-        query = {'building': building}
-        _students = list(SignedIn.objects.objects.filter(**query).all())
+    @memoize(ttl=5, key_func=lambda request: request.GET.get('building'))
+    def in_classroom(request):
+        query = {'building': request.GET.get('building')}
+        _students = list(InClassRoom.objects.objects.filter(**query).all())
         ...
         return result
+
+    Clear a cached item by the key of its call, as returned by the key function:
+
+    memoize.clear_cache_by_key(make_key(2023, age=18))  # students(2023, age=18)
+    memoize.clear_cache_by_key('building-a')  # in_classroom of building-a
     """
 
-    def __init__(self, ttl=TTL, max_items=MAX_ITEMS):
-        self.memoize_cache = {}
+    def __init__(
+        self,
+        ttl=TTL,
+        max_items=MAX_ITEMS,
+        key_func=make_key,
+        stale_while_revalidate=False,
+        stale_ttl=None,
+    ):
+        # key -> (expiry, value), ordered from least to most recently used
+        self.memoize_cache = OrderedDict()
         self.ttl = ttl
         self.max_items = max_items
+        self.key_func = key_func
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_ttl = ttl if stale_ttl is None else stale_ttl
+        self.lock = threading.Lock()
+        self.refreshing = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
 
     def _add_cache(self, key, value, ttl):
-        """Store cache item"""
-        self.memoize_cache[key] = (time.time() + ttl, value)
-
-    def _clean_cache(self):
-        """Clear expired cached items"""
-        now = time.time()
-        self.memoize_cache = {
-            key: value for key, value in self.memoize_cache.items() if now <= value[0]
-        }
-
-        # Remove all items more than self.max_items by cache-age
-        sorted_cache = sorted(
-            self.memoize_cache.items(), key=lambda x: x[1][0], reverse=False
-        )
-        for key, value in sorted_cache:
-            if len(self.memoize_cache) - self.max_items <= 0:
-                break
+        """Store cache item, evict least recently used items above max_items"""
+        with self.lock:
+            self.memoize_cache[key] = (time.monotonic() + ttl, value)
+            self.memoize_cache.move_to_end(key)
+            while len(self.memoize_cache) > self.max_items:
+                self.memoize_cache.popitem(last=False)
+                self.evictions += 1
+
+    def _get_cache(self, key):
+        """Get cache item as (found, stale, value)"""
+        with self.lock:
+            item = self.memoize_cache.get(key)
+            if item is None:
+                self.misses += 1
+                return False, False, None
+
+            expiry, value = item
+            now = time.monotonic()
+            if now < expiry:
+                self.memoize_cache.move_to_end(key)
+                self.hits += 1
+                return True, False, value
+
+            if self.stale_while_revalidate and now < expiry + self.stale_ttl:
+                self.hits += 1
+                return True, True, value
+
+            # Remove expired key
             del self.memoize_cache[key]
+            self.misses += 1
+            return False, False, None
+
+    def _refresh(self, key, func, ttl, args, kwargs):
+        """Recompute a stale cache item in the background"""
+        try:
+            self._add_cache(key, func(*args, **kwargs), ttl)
+            with self.lock:
+                self.refreshes += 1
+        except Exception as error:
+            logger.error(f"Memoize failed to refresh {func.__qualname__}: {error}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def _start_refresh(self, key, func, ttl, args, kwargs):
+        """Start a single background refresh per key"""
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        thread = threading.Thread(
+            target=self._refresh, args=(key, func, ttl, args, kwargs), daemon=True
+        )
+        thread.start()
+
+    def stats(self):
+        """Cache statistics"""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "refreshes": self.refreshes,
+                "items": len(self.memoize_cache),
+            }
 
     def clear_all_cache(self):
         """Clear all cache"""
-        self.memoize_cache = {}
+        with self.lock:
+            self.memoize_cache.clear()
 
     def clear_cache_by_key(self, key):
-        """Clear cache by key"""
-        self.memoize_cache.pop(key, None)
+        """Clear cache by key (as returned by key_func, e.g. make_key) for every decorated function"""
+        with self.lock:
+            for cache_key in [x for x in self.memoize_cache if x[1] == key]:
+                del self.memoize_cache[cache_key]
 
-    def __call__(self, func=None, ttl=None):
+    def __call__(self, func=None, ttl=None, key_func=None):
         if func is None:
-            return functools.partial(self.__call__, ttl=ttl)
+            return functools.partial(self.__call__, ttl=ttl, key_func=key_func)
+
+        # Set ttl and key function for this decorated function
+        _ttl = self.ttl if ttl is None else ttl
+        _key_func = self.key_func if key_func is None else key_func
+        func_id = f"{func.__module__}.{func.__qualname__}"
 
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            # Set ttl for this cache item
-            _ttl = self.ttl if ttl is None else ttl
-
-            # Check if key in cache
-            if args[0] in self.memoize_cache:
-                # if key is not expired, return result
-                if time.time() - self.memoize_cache[args[0]][0] <= _ttl:
-                    result = self.memoize_cache[args[0]][1]
-                    self._clean_cache()
-                    return result
-
-                # Remove expired key
-                del self.memoize_cache[args[0]]
+            key = (func_id, _key_func(*args, **kwargs))
+            try:
+                hash(key)
+            except TypeError:
+                # Unhashable arguments can not be cached
+                return func(*args, **kwargs)
+
+            found, stale, result = self._get_cache(key)
+            if found:
+                if stale:
+                    self._start_refresh(key, func, _ttl, args, kwargs)
+                return result
 
             # Cache miss, execute the function and fill the cache
             result = func(*args, **kwargs)
-            self._add_cache(args[0], result, _ttl)
-            self._clean_cache()
+            self._add_cache(key, result, _ttl)
             return result
 
         return wrapper
@@ -3,10 +3,56 @@
 from datetime import datetime, timedelta
 from typing import Type
 
+from django.db.models import CharField, F, Prefetch, QuerySet, Value
 from rest_framework.serializers import ModelSerializer
 
 from construction_work.generic_functions.model_utils import create_id_dict
-from construction_work.models import Article, Project, WarningMessage
+from construction_work.models import Article, Project, WarningImage, WarningMessage
+
+RECENT_ARTICLES_ATTR = "recent_articles_prefetched"
+RECENT_WARNING_MESSAGES_ATTR = "recent_warning_messages_prefetched"
+
+
+def get_recent_date_range(article_max_age: int) -> tuple[datetime, datetime]:
+    """Get publication date range of recent articles"""
+    datetime_now = datetime.now().astimezone()
+
+    # Set end_date one day from now, this makes sure warning messages that are just made are taken into account too.
+    # The reason is that "publication_date = models.DateTimeField(auto_now_add=True)" is set in the model.
+    start_date = datetime_now - timedelta(days=int(article_max_age))
+    end_date = datetime_now + timedelta(days=1)
+    return start_date, end_date
+
+
+def get_warning_images_prefetch() -> Prefetch:
+    """Prefetch warning images and their image metadata (the image data is deferred by Image.objects)"""
+    return Prefetch(
+        "warningimage_set",
+        queryset=WarningImage.objects.prefetch_related("images"),
+    )
+
+
+def prefetch_recent_articles(queryset: QuerySet, article_max_age: int) -> QuerySet:
+    """Prefetch recent articles and warning messages (including images) of the projects in queryset.
+    get_recent_articles_of_project uses the prefetched objects instead of querying per project.
+    """
+    start_date, end_date = get_recent_date_range(article_max_age)
+    return queryset.prefetch_related(
+        Prefetch(
+            "article_set",
+            queryset=Article.objects.filter(
+                publication_date__range=[start_date, end_date]
+            ),
+            to_attr=RECENT_ARTICLES_ATTR,
+        ),
+        Prefetch(
+            "warningmessage_set",
+            queryset=WarningMessage.objects.filter(
+                publication_date__range=[start_date, end_date]
+            ).prefetch_related(get_warning_images_prefetch()),
+            to_attr=RECENT_WARNING_MESSAGES_ATTR,
+        ),
+    )
 
 
 def get_recent_articles_of_project(
@@ -18,22 +64,22 @@ def get_recent_articles_of_project(
     """Combine articles and warning for a single project limited to max age"""
     all_articles = []
 
-    datetime_now = datetime.now().astimezone()
-
-    # Set end_date one day from now, this makes sure warning messages that are just made are taken into account too.
-    # The reason is that "publication_date = models.DateTimeField(auto_now_add=True)" is set in the model.
-    start_date = datetime_now - timedelta(days=int(article_max_age))
-    end_date = datetime_now + timedelta(days=1)
+    start_date, end_date = get_recent_date_range(article_max_age)
 
-    articles = project.article_set.filter(
-        publication_date__range=[start_date, end_date]
-    ).all()
+    # Use objects prefetched by prefetch_recent_articles, if available
+    articles = getattr(project, RECENT_ARTICLES_ATTR, None)
+    if articles is None:
+        articles = project.article_set.filter(
+            publication_date__range=[start_date, end_date]
+        ).all()
     article_serializer = article_serializer_class(articles, many=True)
     all_articles.extend(article_serializer.data)
 
-    warning_messages = project.warningmessage_set.filter(
-        publication_date__range=[start_date, end_date]
-    ).all()
+    warning_messages = getattr(project, RECENT_WARNING_MESSAGES_ATTR, None)
+    if warning_messages is None:
+        warning_messages = project.warningmessage_set.filter(
+            publication_date__range=[start_date, end_date]
+        ).all()
     warning_message_serializer = warning_serializer_class(warning_messages, many=True)
     all_articles.extend(warning_message_serializer.data)
 
@@ -41,7 +87,12 @@ def get_recent_articles_of_project(
 
 
 def create_project_news_lookup(projects: list[Project], article_max_age):
-    """Create lookup table to quickly find articles by project id"""
+    """Create lookup table to quickly find articles by project id
+
+    Articles and warning messages of the given projects are fetched in a single UNION query, which is restricted to
+    the project ids by their (indexed) project foreign keys. The cost therefore depends on the amount of news of the
+    given projects, not on the total amount of news in the database.
+    """
     # Prefetch articles and warning messages within date range
     datetime_now = datetime.now().astimezone()
     start_date = datetime_now - timedelta(days=int(article_max_age))
@@ -49,24 +100,42 @@ def create_project_news_lookup(projects: list[Project], article_max_age):
 
     # Setup lookup table
     project_news_mapping = {x.pk: [] for x in projects}
-
-    def pre_fetch_news(model, project_id_key):
-        pre_fetched_qs = model.objects.filter(
-            publication_date__range=[start_date, end_date]
-        ).values("id", "modification_date", project_id_key)
-        pre_fetched = list(pre_fetched_qs)
-
-        # Remap articles to lookup table with project id as key
-        for obj in pre_fetched:
-            # Keep in sync with ArticleMinimalSerializer
-            news_dict = {
-                "meta_id": create_id_dict(model, obj["id"]),
-                "modification_date": str(obj["modification_date"]),
-            }
-            if obj[project_id_key] in [x.pk for x in projects]:
-                project_news_mapping[obj[project_id_key]].append(news_dict)
-
-    pre_fetch_news(Article, "projects")
-    pre_fetch_news(WarningMessage, "project")
+    if len(project_news_mapping) == 0:
+        return project_news_mapping
+
+    project_ids = list(project_news_mapping.keys())
+
+    # Both sides of the union must select the same columns, in the same order
+    articles = Article.projects.through.objects.filter(
+        project_id__in=project_ids,
+        article__publication_date__range=[start_date, end_date],
+    ).values(
+        news_project_id=F("project_id"),
+        news_id=F("article_id"),
+        news_modification_date=F("article__modification_date"),
+        news_type=Value("article", output_field=CharField()),
+    )
+    warning_messages = WarningMessage.objects.filter(
+        project_id__in=project_ids,
+        publication_date__range=[start_date, end_date],
+    ).values(
+        news_project_id=F("project_id"),
+        news_id=F("id"),
+        news_modification_date=F("modification_date"),
+        news_type=Value("warning", output_field=CharField()),
+    )
+    news_models = {"article": Article, "warning": WarningMessage}
+
+    # Articles before warning messages, like the ArticleMinimalSerializer / WarningMessageMinimalSerializer output
+    all_news = articles.union(warning_messages, all=True).order_by(
+        "news_type", "news_id"
+    )
+    for obj in all_news:
+        # Keep in sync with ArticleMinimalSerializer
+        news_dict = {
+            "meta_id": create_id_dict(news_models[obj["news_type"]], obj["news_id"]),
+            "modification_date": str(obj["news_modification_date"]),
+        }
+        project_news_mapping[obj["news_project_id"]].append(news_dict)
 
     return project_news_mapping
@@ -0,0 +1,74 @@
+""" Response cache for the projects listing (/projects and /projects_jwt). The cache is shared by all uWSGI workers
+    through the Django cache framework (see CACHES in settings).
+
+    Only the device independent part of the listing is cached, as ranked lists of project ids:
+
+    - the project ids ordered by most recent article
+    - the project ids ranked by distance, per location cell (lat/lon rounded to LOCATION_CELL_DECIMALS)
+
+    The projects followed by a device are looked up on every request and merged in by the view, so (un)following a
+    project is visible immediately. The view only fetches and serializes the projects of the requested page.
+
+    Every key contains a version. The version is replaced whenever a project, article or warning message changes,
+    which invalidates the cached listing for all workers at once.
+"""
+
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from construction_work.models import Article, Project, WarningMessage
+
+CACHE_TTL = 300
+LOCATION_CELL_DECIMALS = 3  # ~110 x 70 meters in Amsterdam
+VERSION_KEY = "projects:version"
+
+
+def get_version() -> str:
+    """Get current cache version"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Another worker might set the version at the same time, keep whichever came first
+        cache.add(VERSION_KEY, uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    """Invalidate all cached listings"""
+    cache.set(VERSION_KEY, uuid4().hex, None)
+
+
+def get_or_set(version, name, func):
+    """Get cached value by name, or compute and cache it"""
+    key = f"projects:{version}:{name}"
+    value = cache.get(key)
+    if value is None:
+        value = func()
+        cache.set(key, value, CACHE_TTL)
+    return value
+
+
+def quantize_location(lat, lon) -> tuple[float, float]:
+    """Snap location to the center of its cell"""
+    return (
+        round(float(lat), LOCATION_CELL_DECIMALS),
+        round(float(lon), LOCATION_CELL_DECIMALS),
+    )
+
+
+@receiver([post_save, post_delete], sender=Project)
+@receiver([post_save, post_delete], sender=Article)
+@receiver([post_save, post_delete], sender=WarningMessage)
+def invalidate_on_change(sender, **kwargs):
+    """Invalidate cached listings after projects, articles or warnings changed"""
+    invalidate()
+
+
+@receiver(m2m_changed, sender=Article.projects.through)
+def invalidate_on_article_projects_change(sender, action, **kwargs):
+    """Invalidate cached listings after articles were (un)linked from projects"""
+    if action in ["post_add", "post_remove", "post_clear"]:
+        invalidate()
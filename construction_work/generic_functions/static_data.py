@@ -6,6 +6,18 @@ ARTICLE_MAX_AGE_PARAM = "article_max_age"
 
 DEFAULT_WARNING_MESSAGE_EMAIL = "redactieprojecten@amsterdam.nl"
 DEFAULT_NOTIFICATION_BATCH_SIZE = 500
+# Batches sent at the same time, each batch is sent by firebase_admin with a thread per token
+DEFAULT_NOTIFICATION_WORKERS = 4
+# Messages per second, well within the FCM quota of 600k messages per minute
+DEFAULT_NOTIFICATION_RATE = 5000
+DEFAULT_NOTIFICATION_RETRIES = 3
+
+# Decrypted auth tokens kept per process, and the seconds they are kept (see token_cache)
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 300
+
+# Images never change once stored, clients and proxies may cache them for a year
+IMAGE_CACHE_MAX_AGE = 365 * 24 * 60 * 60
 
 
 # NOTE: clean up. not SOLID.
@@ -0,0 +1,70 @@
+""" Cache of decrypted auth tokens
+
+    The app token is the same for every device, so the same ciphertext is decrypted over and over. The decrypted
+    tokens are kept in a bounded LRU cache per process, a repeated token skips the key derivation and the AES
+    decryption. Tokens that could not be decrypted are kept as well (as None).
+
+    The cache is keyed by the HMAC-SHA256 of the ciphertext with a random key per process, the ciphertexts are not
+    kept. Entries expire after ttl seconds.
+"""
+
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from construction_work.generic_functions.static_data import (
+    TOKEN_CACHE_SIZE,
+    TOKEN_CACHE_TTL,
+)
+
+# Returned by get() for a token that is not cached, None is a cached value
+MISSING = object()
+
+
+class TokenCache:
+    """Bounded LRU cache of ciphertext to value, shared by the threads of a process"""
+
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_key(self, token) -> bytes:
+        """Get cache key of token"""
+        return hmac.new(self._key, str(token).encode(), hashlib.sha256).digest()
+
+    def get(self, token):
+        """Get cached value of token, MISSING if not cached or expired"""
+        key = self._get_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, token, value):
+        """Cache value of token, the least recently used token is removed when full"""
+        key = self._get_key(token)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all tokens"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
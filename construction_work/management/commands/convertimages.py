@@ -0,0 +1,63 @@
+""" Background image conversion worker """
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from construction_work.generic_functions import image_jobs
+
+POLL_INTERVAL = 1.0
+
+
+class Command(BaseCommand):
+    """Convert uploaded warning images"""
+
+    help = "Convert uploaded warning images in the background"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=min(4, os.cpu_count() or 1),
+            help="Number of conversion processes, 0 converts in this process",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=POLL_INTERVAL,
+            help="Seconds to wait for new jobs when idle",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when there are no pending jobs left",
+        )
+
+    def handle(self, *args, **options):
+        processes = options["processes"]
+        executor = None
+        if processes > 0:
+            # Forked processes must not share the database connections of this process
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=processes)
+
+        count = 0
+        try:
+            while True:
+                claimed = image_jobs.run_jobs(
+                    limit=max(processes, 1), executor=executor
+                )
+                count += claimed
+                if claimed == 0:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Processed {count} image conversion jobs")
+        )
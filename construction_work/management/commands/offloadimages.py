@@ -0,0 +1,47 @@
+""" Move image data from the database to the image storage """
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from construction_work.generic_functions import image_storage
+from construction_work.models import Image
+
+BATCH_SIZE = 100
+
+
+class Command(BaseCommand):
+    """Move image data from the database to the image storage"""
+
+    help = "Move image data from the database to the image storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Number of images loaded into memory at once",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        image_ids = list(
+            Image.objects.filter(content_hash__isnull=True, data__isnull=False)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+        count = 0
+        for i in range(0, len(image_ids), batch_size):
+            batch = Image.objects.filter(
+                pk__in=image_ids[i : i + batch_size], content_hash__isnull=True
+            ).values_list("pk", "data")
+            for pk, data in batch.iterator():
+                with transaction.atomic():
+                    content_hash = image_storage.save(bytes(data))
+                    # Data is stored before the row is updated, a failure never leaves a row without data
+                    count += Image.objects.filter(
+                        pk=pk, content_hash__isnull=True
+                    ).update(content_hash=content_hash, data=None)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Moved {count} images to the image storage")
+        )
@@ -0,0 +1,31 @@
+""" Project follower count reconciliation """
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from construction_work.models import Device, Project
+
+
+class Command(BaseCommand):
+    """Recount followers of projects"""
+
+    help = "Recount followers of projects and fix follower counts that are out of sync"
+
+    def handle(self, *args, **options):
+        follows = (
+            Device.followed_projects.through.objects.filter(project_id=OuterRef("pk"))
+            .order_by()
+            .values("project_id")
+            .annotate(count=Count("*"))
+            .values("count")
+        )
+        actual_count = Coalesce(
+            Subquery(follows, output_field=IntegerField()),
+            0,
+        )
+        count = Project.objects.filter(~Q(follower_count=actual_count)).update(
+            follower_count=actual_count
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Fixed follower count of {count} projects")
+        )
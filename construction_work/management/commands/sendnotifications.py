@@ -0,0 +1,58 @@
+""" Background push notification worker """
+import time
+
+from django.core.management.base import BaseCommand
+
+from construction_work.generic_functions.static_data import (
+    DEFAULT_NOTIFICATION_RATE,
+    DEFAULT_NOTIFICATION_WORKERS,
+)
+from construction_work.push_notifications import dispatcher
+
+POLL_INTERVAL = 1.0
+
+
+class Command(BaseCommand):
+    """Send posted notifications"""
+
+    help = "Send posted notifications to the subscribed devices in the background"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=DEFAULT_NOTIFICATION_WORKERS,
+            help="Number of batches sent at the same time",
+        )
+        parser.add_argument(
+            "--rate",
+            type=int,
+            default=DEFAULT_NOTIFICATION_RATE,
+            help="Maximum number of messages per second, 0 is unlimited",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=POLL_INTERVAL,
+            help="Seconds to wait for new notifications when idle",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when there are no pending notifications left",
+        )
+
+    def handle(self, *args, **options):
+        count = 0
+        while True:
+            # One notification at a time, its batches are sent concurrently
+            claimed = dispatcher.run_notifications(
+                limit=1, max_workers=options["workers"], rate=options["rate"]
+            )
+            count += claimed
+            if claimed == 0:
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+
+        self.stdout.write(self.style.SUCCESS(f"Sent {count} notifications"))
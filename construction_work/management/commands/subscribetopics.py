@@ -0,0 +1,16 @@
+""" FCM topic subscriptions of the followers of projects """
+from django.core.management.base import BaseCommand
+
+from construction_work.push_notifications import topics
+
+
+class Command(BaseCommand):
+    """Subscribe followers to topics"""
+
+    help = "Subscribe the devices following projects to the FCM topics of these projects and their districts"
+
+    def handle(self, *args, **options):
+        count = topics.subscribe_followers()
+        self.stdout.write(
+            self.style.SUCCESS(f"Subscribed the followers of {count} projects")
+        )
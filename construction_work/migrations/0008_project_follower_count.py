@@ -0,0 +1,30 @@
+# Generated by Django 4.2.4 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("construction_work", "0007_delete_asset"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="follower_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE construction_work_project AS project
+                SET follower_count = followers.count
+                FROM (
+                    SELECT project_id, COUNT(*) AS count
+                    FROM construction_work_device_followed_projects
+                    GROUP BY project_id
+                ) AS followers
+                WHERE followers.project_id = project.id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.4 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("construction_work", "0008_project_follower_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="content_hash",
+            field=models.CharField(
+                blank=True, db_index=True, default=None, max_length=64, null=True
+            ),
+        ),
+        migrations.AlterField(
+            model_name="image",
+            name="data",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.4 on 2026-10-18 09:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("construction_work", "0009_image_content_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="creation_date",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
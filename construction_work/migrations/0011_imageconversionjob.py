@@ -0,0 +1,59 @@
+# Generated by Django 4.2.4 on 2026-10-18 09:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("construction_work", "0010_image_creation_date"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImageConversionJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("content_hash", models.CharField(max_length=64)),
+                (
+                    "description",
+                    models.CharField(
+                        blank=True, default=None, max_length=1000, null=True
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        db_index=True,
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0)),
+                ("error", models.TextField(blank=True, default=None, null=True)),
+                ("creation_date", models.DateTimeField(auto_now_add=True)),
+                ("modification_date", models.DateTimeField(auto_now=True)),
+                (
+                    "warning_image",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="construction_work.warningimage",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.4 on 2026-10-18 11:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("construction_work", "0011_imageconversionjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="variant_of",
+            field=models.ForeignKey(
+                blank=True,
+                default=None,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="variants",
+                to="construction_work.image",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.4 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("construction_work", "0012_image_variant_of"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="article",
+            name="content_hash",
+            field=models.CharField(blank=True, default=None, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="content_hash",
+            field=models.CharField(blank=True, default=None, max_length=64, null=True),
+        ),
+    ]
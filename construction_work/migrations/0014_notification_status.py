@@ -0,0 +1,72 @@
+# Generated by Django 4.2.4 on 2026-10-18 15:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("construction_work", "0013_article_content_hash_project_content_hash"),
+    ]
+
+    operations = [
+        # Existing notifications were sent within their request, they must not be picked up by the dispatcher
+        migrations.AddField(
+            model_name="notification",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("running", "Running"),
+                    ("done", "Done"),
+                    ("failed", "Failed"),
+                ],
+                db_index=True,
+                default="done",
+                max_length=10,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="notification",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("running", "Running"),
+                    ("done", "Done"),
+                    ("failed", "Failed"),
+                ],
+                db_index=True,
+                default="pending",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="error",
+            field=models.TextField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="token_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="sent_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="failed_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="modification_date",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.4 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("construction_work", "0014_notification_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="pruned_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="failure_counts",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="duration",
+            field=models.FloatField(blank=True, default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.4 on 2026-10-18 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("construction_work", "0015_notification_delivery_statistics"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="device",
+            index=models.Index(
+                condition=models.Q(("firebase_token__isnull", False)),
+                fields=["id", "firebase_token"],
+                name="device_with_token_idx",
+            ),
+        ),
+        # The followers of a project in order of device, the through table of Device.followed_projects has no Meta
+        migrations.RunSQL(
+            sql="""
+                CREATE INDEX device_followed_projects_project_device_idx
+                ON construction_work_device_followed_projects (project_id, device_id)
+            """,
+            reverse_sql="DROP INDEX device_followed_projects_project_device_idx",
+        ),
+    ]
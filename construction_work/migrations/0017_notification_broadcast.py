@@ -0,0 +1,39 @@
+# Generated by Django 4.2.4 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("construction_work", "0016_device_with_token_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="district_id",
+            field=models.IntegerField(blank=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="projects",
+            field=models.ManyToManyField(blank=True, to="construction_work.project"),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="use_topics",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="district_id",
+            field=models.IntegerField(
+                blank=True, db_index=True, default=None, null=True
+            ),
+        ),
+        # Unchanged ETL payloads are skipped (see bulk_ingest), every project is written again to get its district
+        migrations.RunSQL(
+            sql="UPDATE construction_work_project SET content_hash = NULL",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
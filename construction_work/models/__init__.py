@@ -4,4 +4,9 @@ from .device import Device
 from .image import Image
 from .project import Project
 from .project_manager import ProjectManager
-from .warning_and_notification import Notification, WarningImage, WarningMessage
+from .warning_and_notification import (
+    ImageConversionJob,
+    Notification,
+    WarningImage,
+    WarningMessage,
+)
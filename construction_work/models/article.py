@@ -37,6 +37,8 @@ class Article(models.Model):
     )  # If no date is provided use the current date
     publication_date = models.DateTimeField(default=None, null=True)
     expiration_date = models.DateTimeField(default=None, null=True)
+    # Hash of the last ingested ETL payload, unchanged payloads are not written again (see bulk_ingest)
+    content_hash = models.CharField(max_length=64, blank=True, null=True, default=None)
 
     def get_id_dict(self):
         """Get id dict"""
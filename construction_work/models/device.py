@@ -2,6 +2,9 @@
 
 from django.db import IntegrityError
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import m2m_changed, pre_delete
+from django.dispatch import receiver
 
 from construction_work.models.project import Project
 
@@ -25,6 +28,14 @@ class Device(models.Model):
                 | ~models.Q(firebase_token=""),
             ),
         ]
+        indexes = [
+            # Devices that can receive push notifications, in the order their tokens are streamed
+            models.Index(
+                fields=["id", "firebase_token"],
+                name="device_with_token_idx",
+                condition=models.Q(firebase_token__isnull=False),
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if (
@@ -35,3 +46,49 @@ class Device(models.Model):
         ):
             raise IntegrityError("The 'firebase_token' field must be unique or null.")
         super().save(*args, **kwargs)
+
+
+@receiver(m2m_changed, sender=Device.followed_projects.through)
+def update_follower_count(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep Project.follower_count in sync with Device.followed_projects
+
+    Both device.followed_projects and project.device_set are handled. Removals are counted before the rows are
+    deleted (pre_*), because pk_set may contain projects or devices that were not linked in the first place.
+    """
+    if action == "post_add":
+        # pk_set only contains newly added links at this point
+        if reverse:
+            Project.objects.filter(pk=instance.pk).update(
+                follower_count=F("follower_count") + len(pk_set)
+            )
+        else:
+            Project.objects.filter(pk__in=pk_set).update(
+                follower_count=F("follower_count") + 1
+            )
+    elif action == "pre_remove":
+        if reverse:
+            removed = sender.objects.filter(
+                project_id=instance.pk, device_id__in=pk_set
+            ).count()
+            Project.objects.filter(pk=instance.pk).update(
+                follower_count=F("follower_count") - removed
+            )
+        else:
+            Project.objects.filter(pk__in=pk_set, device=instance).update(
+                follower_count=F("follower_count") - 1
+            )
+    elif action == "pre_clear":
+        if reverse:
+            Project.objects.filter(pk=instance.pk).update(follower_count=0)
+        else:
+            Project.objects.filter(device=instance).update(
+                follower_count=F("follower_count") - 1
+            )
+
+
+@receiver(pre_delete, sender=Device)
+def decrease_follower_count(sender, instance, **kwargs):
+    """Unfollow projects of a deleted device, the cascaded delete of the links does not send m2m_changed"""
+    Project.objects.filter(device=instance).update(
+        follower_count=F("follower_count") - 1
+    )
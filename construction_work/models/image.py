@@ -1,14 +1,41 @@
 """ Assets and Images db models """
 
-from django.db import models
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from construction_work.generic_functions import image_storage
+
+
+class ImageManager(models.Manager):
+    """Image manager, defers the image data
+
+    Only the image view needs the data, every other use only needs metadata. The data is loaded when it is accessed
+    or explicitly selected (e.g. values_list("data")). This manager is also used by related managers, such as
+    WarningImage.images, and their prefetches.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().defer("data")
 
 
 class Image(models.Model):
     """Model for storing an image
     Images are identified by their identifier field created from a hash (md5) of its origin
+
+    The image data is either stored in the data field, or in the image storage (see image_storage). In the latter
+    case content_hash is set and data is empty.
+
+    A variant (e.g. WebP) of an image has variant_of set to that image, it is only served to clients accepting its
+    mime type (see image_variants).
     """
 
-    data = models.BinaryField(blank=False, null=False)
+    data = models.BinaryField(blank=True, null=True)
+    content_hash = models.CharField(
+        max_length=64, blank=True, null=True, default=None, db_index=True
+    )
     description = models.CharField(max_length=1000, blank=True, null=True, default=None)
     width = models.IntegerField()
     height = models.IntegerField()
@@ -16,3 +43,44 @@ class Image(models.Model):
     # coordinates format: {"lat": 0.0, "lon": 0.0}
     coordinates = models.JSONField(blank=True, null=True, default=None)
     mime_type = models.CharField(max_length=100, blank=False, default="image/jpg")
+    creation_date = models.DateTimeField(
+        default=timezone.now
+    )  # If no date is provided use the current date
+    variant_of = models.ForeignKey(
+        "self",
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        default=None,
+        related_name="variants",
+    )
+
+    objects = ImageManager()
+
+
+def delete_stored_data_if_unused(content_hash: str):
+    """Delete stored image data, unless an image or the upload of an unfinished conversion job still refers to it"""
+    # Defined after this model (see warning_and_notification)
+    image_conversion_job = apps.get_model("construction_work", "ImageConversionJob")
+
+    with transaction.atomic():
+        # Wait for a transaction that saved the same data to commit the row referring to it
+        image_storage.lock(content_hash)
+        if Image.objects.filter(content_hash=content_hash).exists():
+            return
+        unfinished = image_conversion_job.objects.filter(
+            content_hash=content_hash
+        ).exclude(status__in=[image_conversion_job.DONE, image_conversion_job.FAILED])
+        if unfinished.exists():
+            return
+        image_storage.delete(content_hash)
+
+
+@receiver(post_delete, sender=Image)
+def remove_stored_image_data(sender, instance, **kwargs):
+    """Delete stored image data once nothing refers to it anymore"""
+    content_hash = instance.content_hash
+    if content_hash is None:
+        return
+
+    transaction.on_commit(lambda: delete_stored_data_if_unused(content_hash))
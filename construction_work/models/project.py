@@ -31,6 +31,14 @@ class Project(models.Model):
     )  # If no date is provided use the current date
     publication_date = models.DateTimeField(default=None, null=True)
     expiration_date = models.DateTimeField(default=None, null=True)
+    # City district of the project (see StaticData.districts), used to notify the followers of a district
+    district_id = models.IntegerField(
+        blank=True, null=True, default=None, db_index=True
+    )
+    # Maintained by signals on Device.followed_projects, see models/device.py
+    follower_count = models.IntegerField(default=0)
+    # Hash of the last ingested ETL payload, unchanged payloads are not written again (see bulk_ingest)
+    content_hash = models.CharField(max_length=64, blank=True, null=True, default=None)
 
     class Meta:
         ordering = ["title"]
@@ -38,9 +46,21 @@ class Project(models.Model):
     def save(self, *args, **kwargs):
         self.active = True
         self.last_seen = timezone.now()
+        self._exclude_follower_count(kwargs)
         super(Project, self).save(*args, **kwargs)
 
     def deactivate(self, *args, **kwargs):
         """Deactivate & save"""
         self.active = False
+        self._exclude_follower_count(kwargs)
         super(Project, self).save(*args, **kwargs)
+
+    def _exclude_follower_count(self, kwargs):
+        """Never write back a (possibly outdated) follower count when updating an existing project"""
+        if self._state.adding or kwargs.get("update_fields") is not None:
+            return
+        kwargs["update_fields"] = [
+            field.name
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.name != "follower_count"
+        ]
@@ -1,15 +1,15 @@
 # pylint: disable=cyclic-import
 """ Model for Warning message """
 
-from django.db import models
-from django.db.models.signals import pre_delete
+from django.db import models, transaction
+from django.db.models.signals import post_delete, pre_delete
 from django.dispatch import receiver
 
 from construction_work.generic_functions.model_utils import create_id_dict
 from construction_work.generic_functions.static_data import (
     DEFAULT_WARNING_MESSAGE_EMAIL,
 )
-from construction_work.models.image import Image
+from construction_work.models.image import Image, delete_stored_data_if_unused
 from construction_work.models.project import Project
 
 from .project_manager import ProjectManager
@@ -55,8 +55,53 @@ def remove_images_for_warning_message(sender, instance, **kwargs):
         image.delete()
 
 
+class ImageConversionJob(models.Model):
+    """Conversion of an uploaded image into the images of a warning image, run in the background (see image_jobs)"""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    warning_image = models.ForeignKey(WarningImage, on_delete=models.CASCADE)
+    # The uploaded image, kept in the image storage
+    content_hash = models.CharField(max_length=64)
+    description = models.CharField(max_length=1000, blank=True, null=True, default=None)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True
+    )
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True, null=True, default=None)
+    creation_date = models.DateTimeField(auto_now_add=True)
+    modification_date = models.DateTimeField(auto_now=True)
+
+
+@receiver(post_delete, sender=ImageConversionJob)
+def remove_stored_upload(sender, instance, **kwargs):
+    """Delete the stored upload of a deleted job (e.g. with its warning) once nothing refers to it anymore"""
+    content_hash = instance.content_hash
+    transaction.on_commit(lambda: delete_stored_data_if_unused(content_hash))
+
+
 class Notification(models.Model):
-    """Notifications db model"""
+    """Notifications db model, the push notifications are sent in the background (see push_notifications.dispatcher)"""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
 
     title = models.CharField(max_length=1000, blank=False, null=False)
     body = models.TextField(blank=True, null=True)
@@ -64,3 +109,24 @@ class Notification(models.Model):
         WarningMessage, on_delete=models.CASCADE, blank=False, null=False
     )
     publication_date = models.DateTimeField(auto_now_add=True, blank=True)
+    # Broadcast to the followers of these projects instead of those of the warning's project
+    projects = models.ManyToManyField(Project, blank=True)
+    # Broadcast to the followers of the projects in this district (see StaticData.districts)
+    district_id = models.IntegerField(blank=True, null=True, default=None)
+    # Sent to FCM topics instead of the tokens of the followers (see push_notifications.topics)
+    use_topics = models.BooleanField(default=False)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True
+    )
+    error = models.TextField(blank=True, null=True, default=None)
+    # Delivery progress and statistics
+    token_count = models.IntegerField(default=0)
+    sent_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    # Dead tokens removed from their devices
+    pruned_count = models.IntegerField(default=0)
+    # Failures by error class, e.g. {"unregistered": 3}
+    failure_counts = models.JSONField(blank=True, default=dict)
+    # Seconds it took to send the notification
+    duration = models.FloatField(blank=True, null=True, default=None)
+    modification_date = models.DateTimeField(auto_now=True)
@@ -0,0 +1,95 @@
+""" Background dispatch of push notifications
+
+    A posted notification is stored as pending, the request does not wait for the push notifications to be sent. The
+    sendnotifications management command claims pending notifications and sends them (see NotificationService). The
+    delivery statistics (token_count, sent_count, failed_count, pruned_count, failure_counts) are written to the
+    notification after each batch, the duration once it is done.
+
+    A notification that was running when its worker died is marked as failed instead of being sent again, resending
+    would notify part of the devices twice.
+"""
+
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from construction_work.generic_functions.generic_logger import Logger
+from construction_work.models import Notification
+from construction_work.push_notifications.send_notification import NotificationService
+
+logger = Logger()
+
+# A notification running longer than this without progress is assumed to be lost (e.g. the worker was killed)
+STALE_NOTIFICATION_TIMEOUT = timedelta(minutes=10)
+
+
+def claim_notifications(limit: int) -> list:
+    """Claim pending notifications, other workers skip the claimed notifications"""
+    stale = timezone.now() - STALE_NOTIFICATION_TIMEOUT
+    Notification.objects.filter(
+        status=Notification.RUNNING, modification_date__lt=stale
+    ).update(status=Notification.FAILED, error="Interrupted")
+
+    with transaction.atomic():
+        notifications = list(
+            Notification.objects.filter(status=Notification.PENDING)
+            .order_by("pk")
+            .select_for_update(skip_locked=True)[:limit]
+        )
+        Notification.objects.filter(pk__in=[x.pk for x in notifications]).update(
+            status=Notification.RUNNING, modification_date=timezone.now()
+        )
+    return notifications
+
+
+def update_progress(notification: Notification, notification_service):
+    """Store delivery statistics of the batches sent so far"""
+    Notification.objects.filter(pk=notification.pk).update(
+        sent_count=notification_service.sent_count,
+        failed_count=len(notification_service.failed_tokens),
+        pruned_count=notification_service.pruned_count,
+        failure_counts=notification_service.failure_counts,
+        modification_date=timezone.now(),
+    )
+
+
+def finish(notification: Notification, status: str, start: float, error=None):
+    """Set final status and duration of notification"""
+    Notification.objects.filter(pk=notification.pk).update(
+        status=status,
+        error=error,
+        duration=round(time.monotonic() - start, 3),
+        modification_date=timezone.now(),
+    )
+
+
+def send(notification: Notification, **service_kwargs):
+    """Send push notifications of a claimed notification"""
+    start = time.monotonic()
+    try:
+        notification_service = NotificationService(notification, **service_kwargs)
+        if notification_service.setup() is False:
+            finish(notification, Notification.DONE, start)
+            return
+
+        Notification.objects.filter(pk=notification.pk).update(
+            token_count=notification_service.token_count
+        )
+        notification_service.send_multicast_and_handle_errors(
+            on_progress=lambda x: update_progress(notification, x)
+        )
+    except Exception as error:
+        logger.error(f"Notification {notification.pk} failed: {error!r}")
+        finish(notification, Notification.FAILED, start, repr(error))
+        return
+    finish(notification, Notification.DONE, start)
+
+
+def run_notifications(limit: int, **service_kwargs) -> int:
+    """Claim and send notifications, returns the number of claimed notifications"""
+    notifications = claim_notifications(limit)
+    for notification in notifications:
+        send(notification, **service_kwargs)
+    return len(notifications)
@@ -0,0 +1,15 @@
+""" Firebase app used to send push notifications and to manage topic subscriptions """
+
+import firebase_admin
+from django.conf import settings
+from firebase_admin import credentials
+
+
+def initialize_firebase_app():
+    """Initialize the default firebase app, once per process"""
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(
+            "{base_dir}/fcm_credentials.json".format(base_dir=settings.BASE_DIR)
+        )
+        return firebase_admin.initialize_app(cred)
+    return firebase_admin.get_app()
@@ -1,33 +1,182 @@
-""" Send pushnotification """
-import firebase_admin
-from django.conf import settings
-from firebase_admin import credentials, messaging
+""" Send pushnotification
+
+    A notification is sent to the followers of the project of its warning message, a broadcast to the followers of
+    its projects or of the projects in its district (see get_target_projects). A device following several of these
+    projects is sent to once.
+
+    The tokens of the subscribed devices are streamed in batches of batch_size tokens, in order of device. Each batch
+    is read with a keyset query (device id greater than the last one of the previous batch) on the indexed follow
+    table, so reading a batch does not depend on how many batches came before it and tokens pruned in the meantime
+    do not shift the batches. Batches are read as the senders need them. Up to max_workers batches are sent at the
+    same time, the rate limiter spreads the messages over time (messages per second). A batch failing as a whole on
+    a transient error (e.g. FCM unavailable or quota exceeded) is retried with exponential backoff, as are the tokens
+    of a batch failing on a transient error.
+
+    The failures are counted by error class (see classify_error). Tokens that are unregistered are removed from their
+    devices (pruned), so later notifications no longer send to them. An invalid argument is only counted, FCM also
+    returns it for an invalid message (e.g. a payload that is too large), which fails on every token.
+
+    A broadcast with use_topics is sent as a single message to the FCM topics of its projects or district instead
+    (see push_notifications.topics).
+"""
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from firebase_admin import exceptions, messaging
 
 from construction_work.generic_functions.generic_logger import Logger
 from construction_work.generic_functions.static_data import (
     DEFAULT_NOTIFICATION_BATCH_SIZE,
+    DEFAULT_NOTIFICATION_RATE,
+    DEFAULT_NOTIFICATION_RETRIES,
+    DEFAULT_NOTIFICATION_WORKERS,
 )
+from construction_work.models import Device, Project
+from construction_work.push_notifications import topics
+from construction_work.push_notifications.firebase import initialize_firebase_app
 
 logger = Logger()
 
+# Errors of a whole multicast request that are worth retrying
+TRANSIENT_ERRORS = (
+    exceptions.UnavailableError,
+    exceptions.InternalError,
+    exceptions.DeadlineExceededError,
+    exceptions.ResourceExhaustedError,
+)
+RETRY_BACKOFF = 1.0
+
+# Error classes of a single token
+UNREGISTERED = "unregistered"
+INVALID_ARGUMENT = "invalid-argument"
+QUOTA_EXCEEDED = "quota-exceeded"
+UNAVAILABLE = "unavailable"
+UNKNOWN = "unknown"
+# The token will never be valid again, it is removed from its device
+DEAD_TOKEN_ERRORS = [UNREGISTERED]
+# The token is sent to again, until the retries are exhausted
+RETRYABLE_ERRORS = [QUOTA_EXCEEDED, UNAVAILABLE]
+
+NO_SUBSCRIBED_DEVICES = "No subscribed devices found"
+
+
+def classify_error(error) -> str:
+    """Get error class of a failed token"""
+    # A token of another sender (app) is as dead as an unregistered one
+    if isinstance(
+        error, (messaging.UnregisteredError, messaging.SenderIdMismatchError)
+    ):
+        return UNREGISTERED
+    if isinstance(error, exceptions.InvalidArgumentError):
+        return INVALID_ARGUMENT
+    if isinstance(error, exceptions.ResourceExhaustedError):
+        return QUOTA_EXCEEDED
+    if isinstance(error, TRANSIENT_ERRORS):
+        return UNAVAILABLE
+    return UNKNOWN
+
+
+def has_subscribed_devices(project) -> bool:
+    """Check if any device with a firebase token follows the project"""
+    return project.device_set.exclude(firebase_token=None).exists()
+
+
+def get_target_projects(notification):
+    """Get projects of which the followers are notified"""
+    if notification.district_id is not None:
+        return Project.objects.filter(district_id=notification.district_id)
+    if notification.projects.exists():
+        return notification.projects.all()
+    return Project.objects.filter(pk=notification.warning.project_id)
+
+
+def get_subscribed_tokens(projects):
+    """Get (device id, firebase token) of the devices following any of the projects, once per device, in order of
+    device. The projects (a queryset) are a subquery, the tokens are read by a single query.
+    """
+    return (
+        Device.followed_projects.through.objects.filter(
+            project__in=projects, device__firebase_token__isnull=False
+        )
+        .order_by("device_id")
+        .values_list("device_id", "device__firebase_token")
+        .distinct()
+    )
+
+
+def stream_token_batches(projects, batch_size):
+    """Generate batches of the firebase tokens of the devices following any of the projects"""
+    tokens = get_subscribed_tokens(projects)
+    last_device_id = 0
+    while True:
+        batch = list(tokens.filter(device_id__gt=last_device_id)[:batch_size])
+        if len(batch) == 0:
+            return
+        last_device_id = batch[-1][0]
+        yield [token for _, token in batch]
+
+
+class RateLimiter:
+    """Spread messages over time, shared by the sending threads"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self, count=1):
+        """Wait until count messages may be sent"""
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + count / self.rate
+        if start > now:
+            time.sleep(start - now)
+
 
 class NotificationService:
-    """Send notification through the firebase network (google)"""
+    """Send notification through the firebase network (google)
+
+    send_multicast sends a MulticastMessage and returns its BatchResponse, send_message sends a Message (to topics),
+    by default through FCM. Other implementations (e.g. a fake FCM) are used as is, without initializing firebase.
+    """
 
-    def __init__(self, notification_object, batch_size=DEFAULT_NOTIFICATION_BATCH_SIZE):
+    def __init__(
+        self,
+        notification_object,
+        batch_size=DEFAULT_NOTIFICATION_BATCH_SIZE,
+        send_multicast=None,
+        send_message=None,
+        max_workers=DEFAULT_NOTIFICATION_WORKERS,
+        rate=DEFAULT_NOTIFICATION_RATE,
+        retries=DEFAULT_NOTIFICATION_RETRIES,
+        retry_backoff=RETRY_BACKOFF,
+    ):
         self.notification_object = notification_object
         self.batch_size = batch_size
-        if not firebase_admin._apps:
-            cred = credentials.Certificate(
-                "{base_dir}/fcm_credentials.json".format(base_dir=settings.BASE_DIR)
-            )
-            self.default_app = firebase_admin.initialize_app(cred)
-        else:
-            self.default_app = firebase_admin.get_app()
+        if send_multicast is None and send_message is None:
+            self.default_app = initialize_firebase_app()
+        self.send_multicast = send_multicast or messaging.send_each_for_multicast
+        self.send_message = send_message or messaging.send
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(rate)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
 
+        self.target_projects = None
+        self.topic_condition = None
         self.subscribed_device_batches = None
         self.firebase_notification = None
         self.setup_result = None
+        self.token_count = 0
+        self.sent_count = 0
+        self.failed_tokens = []
+        self.pruned_count = 0
+        self.failure_counts = {}
 
     def setup(self):
         """Init subscribers"""
@@ -35,44 +184,162 @@ class NotificationService:
             title=self.notification_object.title, body=self.notification_object.body
         )
 
-        self.subscribed_device_batches = self._create_subscribed_device_batches()
-        if len(self.subscribed_device_batches) == 0:
-            self.setup_result = "No subscribed devices found"
+        self.target_projects = get_target_projects(self.notification_object)
+        self.token_count = get_subscribed_tokens(self.target_projects).count()
+        if self.token_count == 0:
+            self.setup_result = NO_SUBSCRIBED_DEVICES
             return False
+        if self.notification_object.use_topics:
+            self.topic_condition = self._get_topic_condition()
+        else:
+            self.subscribed_device_batches = self._create_subscribed_device_batches()
         return True
 
     def _create_subscribed_device_batches(self):
-        """Create batches of subscribers"""
-        firebase_tokens = self.notification_object.warning.project.device_set.exclude(
+        """Create batches of subscribers, read lazily"""
+        if self.target_projects is None:
+            self.target_projects = get_target_projects(self.notification_object)
+        return stream_token_batches(self.target_projects, self.batch_size)
+
+    def _get_topic_condition(self):
+        """Get FCM condition of the topics of the notification"""
+        if self.notification_object.district_id is not None:
+            return topics.get_condition(
+                [topics.district_topic(self.notification_object.district_id)]
+            )
+        return topics.get_condition(
+            sorted(
+                topics.project_topic(x)
+                for x in self.target_projects.values_list("pk", flat=True)
+            )
+        )
+
+    def _get_data(self):
+        """Get data of the message, the app opens the warning message"""
+        return {
+            "linkSourceid": str(self.notification_object.warning_id),
+            "type": "ProjectWarningCreatedByProjectManager",
+        }
+
+    def _create_message(self, registration_tokens):
+        """Create message for a batch of subscribers"""
+        return messaging.MulticastMessage(
+            data=self._get_data(),
+            notification=self.firebase_notification,
+            tokens=registration_tokens,
+        )
+
+    def _send_to_topics(self):
+        """Send a single message to the topic condition, retried on a transient error"""
+        message = messaging.Message(
+            data=self._get_data(),
+            notification=self.firebase_notification,
+            condition=self.topic_condition,
+        )
+        attempt = 0
+        while True:
+            try:
+                self.send_message(message)
+                return
+            except TRANSIENT_ERRORS:
+                if attempt >= self.retries:
+                    raise
+            time.sleep(self.retry_backoff * 2**attempt)
+            attempt += 1
+
+    def _send_batch(self, registration_tokens):
+        """Send message to a batch of subscribers, the tokens failing on a transient error are sent again
+
+        Returns the number of sent messages, the failed tokens, the dead tokens (a subset of the failed tokens) and
+        the number of failures by error class.
+        """
+        result = {"sent": 0, "failed": [], "dead": [], "errors": Counter()}
+
+        def add_failure(token, error_class):
+            result["failed"].append(token)
+            result["errors"][error_class] += 1
+            if error_class in DEAD_TOKEN_ERRORS:
+                result["dead"].append(token)
+
+        attempt = 0
+        pending = registration_tokens
+        while True:
+            self.rate_limiter.acquire(len(pending))
+            retry = []
+            try:
+                response = self.send_multicast(self._create_message(pending))
+            except TRANSIENT_ERRORS as error:
+                retry = [(x, classify_error(error)) for x in pending]
+            else:
+                # The order of responses corresponds to the order of the registration tokens.
+                for token, resp in zip(pending, response.responses):
+                    if resp.success:
+                        result["sent"] += 1
+                        continue
+                    error_class = classify_error(resp.exception)
+                    if error_class in RETRYABLE_ERRORS:
+                        retry.append((token, error_class))
+                    else:
+                        add_failure(token, error_class)
+
+            if len(retry) == 0:
+                break
+            if attempt >= self.retries:
+                logger.error(
+                    f"Sending to {len(retry)} tokens failed after {attempt + 1} attempts"
+                )
+                for token, error_class in retry:
+                    add_failure(token, error_class)
+                break
+
+            time.sleep(self.retry_backoff * 2**attempt)
+            attempt += 1
+            pending = [token for token, _ in retry]
+
+        return result
+
+    def _prune_tokens(self, dead_tokens) -> int:
+        """Remove dead tokens from their devices, returns the number of devices"""
+        if len(dead_tokens) == 0:
+            return 0
+        return Device.objects.filter(firebase_token__in=dead_tokens).update(
             firebase_token=None
-        ).values_list("firebase_token", flat=True)
-        if not firebase_tokens.exists():
-            return []
-        return [
-            firebase_tokens[x : x + self.batch_size]
-            for x in range(0, len(firebase_tokens), self.batch_size)
-        ]
-
-    def send_multicast_and_handle_errors(self):
-        """Send message to subscribers"""
-        failed_tokens = []
-        for registration_tokens in self.subscribed_device_batches:
-            message = messaging.MulticastMessage(
-                data={
-                    "linkSourceid": str(self.notification_object.warning.pk),
-                    "type": "ProjectWarningCreatedByProjectManager",
-                },
-                notification=self.firebase_notification,
-                tokens=registration_tokens,
+        )
+
+    def _handle_result(self, result, on_progress):
+        """Add the result of a batch"""
+        self.sent_count += result["sent"]
+        self.failed_tokens += result["failed"]
+        self.pruned_count += self._prune_tokens(result["dead"])
+        for error_class, count in result["errors"].items():
+            self.failure_counts[error_class] = (
+                self.failure_counts.get(error_class, 0) + count
             )
+        if on_progress is not None:
+            on_progress(self)
+
+    def send_multicast_and_handle_errors(self, on_progress=None):
+        """Send message to subscribers, on_progress(notification_service) is called after each batch"""
+        if self.topic_condition is not None:
+            self._send_to_topics()
+            # FCM sends the message to the subscribed devices, the followers are assumed to be subscribed
+            self.sent_count = self.token_count
+            if on_progress is not None:
+                on_progress(self)
+            return
 
-            response = messaging.send_each_for_multicast(message)
-            if response.failure_count > 0:
-                responses = response.responses
-                for idx, resp in enumerate(responses):
-                    if not resp.success:
-                        # The order of responses corresponds to the order of the registration tokens.
-                        failed_tokens.append(registration_tokens[idx])
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # The tokens are read by this thread, the sending threads do not use the database. A batch is read once
+            # one of the batches that are queued is sent, results are collected in order of the batches.
+            futures = deque()
+            for registration_tokens in self.subscribed_device_batches:
+                futures.append(executor.submit(self._send_batch, registration_tokens))
+                if len(futures) >= self.max_workers * 2:
+                    self._handle_result(futures.popleft().result(), on_progress)
+            while len(futures) > 0:
+                self._handle_result(futures.popleft().result(), on_progress)
 
         # Log result
-        logger.error("List of tokens that caused failures: {0}".format(failed_tokens))
+        logger.error(
+            "List of tokens that caused failures: {0}".format(self.failed_tokens)
+        )
@@ -0,0 +1,143 @@
+""" FCM topic subscriptions of the devices following projects
+
+    With settings.FCM_TOPICS enabled, the firebase token of a device is subscribed to the topic of each project it
+    follows (project-<id>) and to the topic of the district of these projects (district-<id>). Following or
+    unfollowing a project and registering another token update the subscriptions, once the transaction is committed.
+    The subscribetopics management command subscribes the devices that followed projects before, it is run again
+    once the ETL sets the district of projects that are already followed.
+
+    A broadcast to a district, or to at most MAX_CONDITION_TOPICS projects, is then sent as a single message to a
+    topic condition. FCM sends it to the subscribed devices, once per device.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed, pre_save
+from django.dispatch import receiver
+from firebase_admin import exceptions, messaging
+
+from construction_work.generic_functions.generic_logger import Logger
+from construction_work.models import Device, Project
+from construction_work.push_notifications.firebase import initialize_firebase_app
+
+logger = Logger()
+
+# Topics of a single FCM condition
+MAX_CONDITION_TOPICS = 5
+# Tokens of a single (un)subscribe request
+TOPIC_BATCH_SIZE = 1000
+
+
+def project_topic(project_id) -> str:
+    """Get topic of the followers of a project"""
+    return f"project-{project_id}"
+
+
+def district_topic(district_id) -> str:
+    """Get topic of the followers of the projects in a district"""
+    return f"district-{district_id}"
+
+
+def get_condition(topics) -> str:
+    """Get FCM condition matching the devices subscribed to any of the topics"""
+    return " || ".join(f"'{topic}' in topics" for topic in topics)
+
+
+def get_topics(projects) -> set:
+    """Get topics of projects, a queryset of Project"""
+    topics = set()
+    for project_id, district_id in projects.values_list("pk", "district_id"):
+        topics.add(project_topic(project_id))
+        if district_id is not None:
+            topics.add(district_topic(district_id))
+    return topics
+
+
+def update_subscriptions(tokens, subscribe=(), unsubscribe=()):
+    """Subscribe tokens to and unsubscribe tokens from topics, failures are logged"""
+    initialize_firebase_app()
+    requests = [(messaging.subscribe_to_topic, x) for x in subscribe]
+    requests += [(messaging.unsubscribe_from_topic, x) for x in unsubscribe]
+    for update, topic in requests:
+        for x in range(0, len(tokens), TOPIC_BATCH_SIZE):
+            try:
+                response = update(tokens[x : x + TOPIC_BATCH_SIZE], topic)
+            except exceptions.FirebaseError as error:
+                logger.error(
+                    f"Updating subscriptions of topic {topic} failed: {error!r}"
+                )
+                continue
+            if response.failure_count > 0:
+                reasons = [error.reason for error in response.errors]
+                logger.error(
+                    f"Updating subscriptions of topic {topic} failed for tokens: {reasons}"
+                )
+
+
+def update_subscriptions_on_commit(token, subscribe=(), unsubscribe=()):
+    """Update the subscriptions of a token once the transaction is committed"""
+    subscribe = sorted(subscribe)
+    unsubscribe = sorted(unsubscribe)
+    if token is None or len(subscribe) + len(unsubscribe) == 0:
+        return
+    transaction.on_commit(lambda: update_subscriptions([token], subscribe, unsubscribe))
+
+
+@receiver(m2m_changed, sender=Device.followed_projects.through)
+def update_follower_topics(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep the topic subscriptions in sync with device.followed_projects
+
+    Only the device side is handled (device.followed_projects), like the follow and unfollow views do.
+    """
+    if not settings.FCM_TOPICS or reverse:
+        return
+
+    if action == "post_add":
+        topics = get_topics(Project.objects.filter(pk__in=pk_set))
+        update_subscriptions_on_commit(instance.firebase_token, subscribe=topics)
+    elif action in ["pre_remove", "pre_clear"]:
+        followed_projects = Project.objects.filter(device=instance)
+        if action == "pre_remove":
+            removed = get_topics(followed_projects.filter(pk__in=pk_set))
+            # A district topic is kept as long as another followed project is in that district
+            removed -= get_topics(followed_projects.exclude(pk__in=pk_set))
+        else:
+            removed = get_topics(followed_projects)
+        update_subscriptions_on_commit(instance.firebase_token, unsubscribe=removed)
+
+
+@receiver(pre_save, sender=Device)
+def move_topics_to_new_token(sender, instance, **kwargs):
+    """Move the topic subscriptions of a device to its new firebase token"""
+    if not settings.FCM_TOPICS or instance.pk is None:
+        return
+
+    old_token = (
+        Device.objects.filter(pk=instance.pk)
+        .values_list("firebase_token", flat=True)
+        .first()
+    )
+    if old_token == instance.firebase_token:
+        return
+
+    topics = get_topics(Project.objects.filter(device=instance))
+    update_subscriptions_on_commit(old_token, unsubscribe=topics)
+    update_subscriptions_on_commit(instance.firebase_token, subscribe=topics)
+
+
+def subscribe_followers() -> int:
+    """Subscribe the tokens of all following devices to the topics of their projects, returns the number of projects"""
+    projects = Project.objects.filter(device__firebase_token__isnull=False).distinct()
+    project_count = 0
+    for project_id, district_id in projects.values_list("pk", "district_id"):
+        tokens = list(
+            Device.objects.filter(
+                followed_projects=project_id, firebase_token__isnull=False
+            ).values_list("firebase_token", flat=True)
+        )
+        topics = [project_topic(project_id)]
+        if district_id is not None:
+            topics.append(district_topic(district_id))
+        update_subscriptions(tokens, subscribe=topics)
+        project_count += 1
+    return project_count
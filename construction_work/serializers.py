@@ -4,6 +4,7 @@ from ast import List
 from rest_framework import serializers
 
 from construction_work.generic_functions.gps_utils import get_distance
+from construction_work.generic_functions.image_variants import exclude_variants
 from construction_work.generic_functions.project_utils import (
     get_recent_articles_of_project,
 )
@@ -50,6 +51,14 @@ class ProjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Project
         fields = "__all__"
+        read_only_fields = ["follower_count", "content_hash"]
+
+
+class ProjectIngestSerializer(ProjectSerializer):
+    """Project bulk ingest serializer, an existing foreign_id is updated by the upsert (see bulk_ingest)"""
+
+    class Meta(ProjectSerializer.Meta):
+        extra_kwargs = {"foreign_id": {"validators": []}}
 
 
 class ProjectListSerializer(serializers.ModelSerializer):
@@ -78,6 +87,11 @@ class ProjectListSerializer(serializers.ModelSerializer):
         if obj is None:
             return None
 
+        # Use distances computed in bulk by the view, if available
+        project_distances = self.context.get("project_distances")
+        if project_distances is not None and obj.pk in project_distances:
+            return project_distances[obj.pk]
+
         cords_1 = lat, lon
         project_coordinates = obj.coordinates
         if project_coordinates is None:
@@ -130,7 +144,8 @@ class ProjectDetailsSerializer(ProjectListSerializer):
 
     class Meta:
         model = Project
-        fields = "__all__"
+        # Exposed as followers
+        exclude = ["follower_count", "content_hash", "district_id"]
 
     def get_field_names(self, *args, **kwargs):
         """Get field names"""
@@ -141,7 +156,7 @@ class ProjectDetailsSerializer(ProjectListSerializer):
 
     def get_followers(self, obj: Project) -> int:
         """Get amount of followers of project"""
-        return obj.device_set.count()
+        return obj.follower_count
 
     def get_recent_articles(self, obj: Project) -> list:
         """Get recent articles"""
@@ -157,6 +172,17 @@ class ArticleCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Article
         fields = "__all__"
+        read_only_fields = ["content_hash"]
+
+
+class ArticleIngestSerializer(serializers.ModelSerializer):
+    """Article bulk ingest serializer, the projects are resolved in bulk (see bulk_ingest)"""
+
+    class Meta:
+        model = Article
+        exclude = ["projects"]
+        read_only_fields = ["content_hash"]
+        extra_kwargs = {"foreign_id": {"validators": []}}
 
 
 class ArticleSerializer(serializers.ModelSerializer):
@@ -166,7 +192,7 @@ class ArticleSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Article
-        exclude = ["type"]
+        exclude = ["type", "content_hash"]
 
 
 class ArticleMinimalSerializer(ArticleSerializer):
@@ -259,13 +285,21 @@ class WarningMessagePublicSerializer(serializers.ModelSerializer):
 
         images = []
         for warning_image in warning_images:
+            # Evaluate once, this uses the prefetched images if available (see get_warning_images_prefetch)
+            warning_image_images = list(warning_image.images.all())
+            if len(warning_image_images) == 0:
+                # Conversion of the uploaded image is still pending (see image_jobs)
+                continue
+
             context = {"base_url": base_url}
             image_serializer = ImagePublicSerializer(
-                instance=warning_image.images.all(), many=True, context=context
+                instance=exclude_variants(warning_image_images),
+                many=True,
+                context=context,
             )
             sources = image_serializer.data
 
-            first_image = warning_image.images.first()
+            first_image = min(warning_image_images, key=lambda image: image.pk)
             image = {
                 "main": warning_image.is_main,
                 "sources": sources,
@@ -292,7 +326,35 @@ class NotificationSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Notification
-        fields = "__all__"
+        # The delivery progress is exposed by NotificationStatusSerializer
+        fields = ["id", "title", "body", "warning", "publication_date"]
+
+
+class NotificationStatusSerializer(serializers.ModelSerializer):
+    """Notification delivery progress"""
+
+    notification_id = serializers.IntegerField(source="pk")
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Notification
+        fields = [
+            "notification_id",
+            "status",
+            "token_count",
+            "sent_count",
+            "failed_count",
+            "pruned_count",
+            "failure_counts",
+            "duration",
+            "progress",
+        ]
+
+    def get_progress(self, obj: Notification) -> float:
+        """Get fraction of the tokens handled (sent or failed)"""
+        if obj.token_count == 0:
+            return 1.0 if obj.status == Notification.DONE else 0.0
+        return round((obj.sent_count + obj.failed_count) / obj.token_count, 3)
 
 
 class DeviceSerializer(serializers.ModelSerializer):
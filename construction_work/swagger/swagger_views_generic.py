@@ -19,7 +19,10 @@ as_image = {
     "methods": ["get"],
     "manual_parameters": [header_device_authorization, query_id],
     "responses": {
-        200: openapi.Response("Binary data"),
+        200: openapi.Response(
+            "Binary data, a WebP/AVIF variant if listed in the Accept header (e.g. Accept: image/webp, */*)"
+        ),
+        304: openapi.Response("Not modified (If-None-Match / If-Modified-Since)"),
         400: openapi.Response(
             "application/json",
             examples={"application/json": messages.invalid_query},
@@ -29,3 +32,16 @@ as_image = {
     },
     "tags": ["Generic"],
 }
+
+as_image_auth = {
+    # /api/v1/image/auth swagger_auto_schema
+    "methods": ["get"],
+    "manual_parameters": [header_device_authorization],
+    "responses": {
+        204: openapi.Response(
+            "Authorized, used by nginx before serving a cached image"
+        ),
+        403: forbidden_403,
+    },
+    "tags": ["Generic"],
+}
@@ -1,12 +1,36 @@
 """ Swagger definitions used in the views_*_.py decorators '@swagger_auto_schema(**object)'. """
 from drf_yasg import openapi
 
+from construction_work.api_messages import Messages
 from construction_work.serializers import ArticleSerializer, ProjectSerializer
 from construction_work.swagger.swagger_generic_objects import (
     forbidden_403,
     header_ingest_authorization,
 )
 
+messages = Messages()
+
+#
+# Query parameters
+#
+
+query_since = openapi.Parameter(
+    "since",
+    openapi.IN_QUERY,
+    description="Only items modified after this datetime (ISO 8601)",
+    type=openapi.TYPE_STRING,
+    format="date-time",
+    required=False,
+)
+
+query_output = openapi.Parameter(
+    "output",
+    openapi.IN_QUERY,
+    description="<json|ndjson> (default: json), ndjson streams one object per line",
+    type=openapi.TYPE_STRING,
+    required=False,
+)
+
 #
 # Re-usable snippets
 #
@@ -48,6 +72,49 @@ serializer_error = openapi.Schema(
     },
 )
 
+content_hashes = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    description="SHA-256 of the item as canonical JSON (sorted keys, separators ',' and ':', no ASCII escaping)",
+    properties={"foreign_id": openapi.Schema(type=openapi.TYPE_STRING)},
+)
+
+changed_foreign_ids = openapi.Schema(
+    type=openapi.TYPE_ARRAY,
+    description="Foreign ids that are new or changed",
+    items=openapi.Schema(type=openapi.TYPE_INTEGER),
+)
+
+bulk_ingest_result = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        "created": openapi.Schema(type=openapi.TYPE_INTEGER),
+        "updated": openapi.Schema(type=openapi.TYPE_INTEGER),
+        "unchanged": openapi.Schema(type=openapi.TYPE_INTEGER),
+        "invalid": openapi.Schema(type=openapi.TYPE_INTEGER),
+        "results": openapi.Schema(
+            type=openapi.TYPE_ARRAY,
+            description="Result per item, in order of the payload",
+            items=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "index": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "foreign_id": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "status": openapi.Schema(
+                        type=openapi.TYPE_STRING,
+                        description="<created|updated|unchanged|invalid>",
+                    ),
+                    "errors": serializer_error,
+                    "unknown_project_ids": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        description="Articles only, project ids that were not found",
+                        items=openapi.Schema(type=openapi.TYPE_INTEGER),
+                    ),
+                },
+            ),
+        ),
+    },
+)
+
 
 #
 # OpenAPI definitions
@@ -83,7 +150,7 @@ as_garbage_collector = {
 
 as_etl_get = {
     "methods": ["get"],
-    "manual_parameters": [header_ingest_authorization],
+    "manual_parameters": [header_ingest_authorization, query_since, query_output],
     "responses": {
         200: openapi.Response(
             "application/json",
@@ -91,9 +158,17 @@ as_etl_get = {
             examples={
                 "application/json": {
                     "155581": {"modification_date": "2023-10-11 11:36:00+00:00"}
-                }
+                },
+                "application/x-ndjson": {
+                    "foreign_id": 155581,
+                    "modification_date": "2023-10-11 11:36:00+00:00",
+                },
             },
         ),
+        400: openapi.Response(
+            "application/json",
+            examples={"application/json": messages.invalid_query},
+        ),
         403: forbidden_403,
     },
     "tags": ["Ingestion"],
@@ -261,3 +336,136 @@ as_etl_article_post = {
     },
     "tags": ["Ingestion"],
 }
+
+
+as_etl_projects_post = {
+    "methods": ["POST"],
+    "operation_description": "Batch of projects as JSON array, or as NDJSON (Content-Type: application/x-ndjson)",
+    "manual_parameters": [header_ingest_authorization],
+    "request_body": openapi.Schema(
+        type=openapi.TYPE_ARRAY,
+        items=openapi.Schema(
+            type=openapi.TYPE_OBJECT, description="Project, as posted to ingest/project"
+        ),
+    ),
+    "responses": {
+        200: openapi.Response(
+            "application/json",
+            bulk_ingest_result,
+            examples={
+                "application/json": {
+                    "created": 1,
+                    "updated": 1,
+                    "unchanged": 0,
+                    "invalid": 1,
+                    "results": [
+                        {"index": 0, "foreign_id": 1293650, "status": "created"},
+                        {"index": 1, "foreign_id": 1293651, "status": "updated"},
+                        {
+                            "index": 2,
+                            "foreign_id": None,
+                            "status": "invalid",
+                            "errors": {"foreign_id": ["This field may not be null."]},
+                        },
+                    ],
+                }
+            },
+        ),
+        400: openapi.Response(
+            "application/json",
+            examples={"application/json": messages.invalid_parameters},
+        ),
+        403: forbidden_403,
+    },
+    "tags": ["Ingestion"],
+}
+
+
+as_etl_articles_post = {
+    "methods": ["POST"],
+    "operation_description": "Batch of articles as JSON array, or as NDJSON (Content-Type: application/x-ndjson)",
+    "manual_parameters": [header_ingest_authorization],
+    "request_body": openapi.Schema(
+        type=openapi.TYPE_ARRAY,
+        items=openapi.Schema(
+            type=openapi.TYPE_OBJECT, description="Article, as posted to ingest/article"
+        ),
+    ),
+    "responses": {
+        200: openapi.Response(
+            "application/json",
+            bulk_ingest_result,
+            examples={
+                "application/json": {
+                    "created": 1,
+                    "updated": 0,
+                    "unchanged": 0,
+                    "invalid": 1,
+                    "results": [
+                        {
+                            "index": 0,
+                            "foreign_id": 165556,
+                            "status": "created",
+                            "unknown_project_ids": [1293652],
+                        },
+                        {
+                            "index": 1,
+                            "foreign_id": 165557,
+                            "status": "invalid",
+                            "unknown_project_ids": [1293653],
+                            "errors": {"projectIds": ["No known project ids"]},
+                        },
+                    ],
+                }
+            },
+        ),
+        400: openapi.Response(
+            "application/json",
+            examples={"application/json": messages.invalid_parameters},
+        ),
+        403: forbidden_403,
+    },
+    "tags": ["Ingestion"],
+}
+
+
+as_etl_projects_diff = {
+    "methods": ["POST"],
+    "operation_description": "Get the projects that need to be posted, by comparing content hashes",
+    "manual_parameters": [header_ingest_authorization],
+    "request_body": content_hashes,
+    "responses": {
+        200: openapi.Response(
+            "application/json",
+            changed_foreign_ids,
+            examples={"application/json": [1293650]},
+        ),
+        400: openapi.Response(
+            "application/json",
+            examples={"application/json": messages.invalid_parameters},
+        ),
+        403: forbidden_403,
+    },
+    "tags": ["Ingestion"],
+}
+
+
+as_etl_articles_diff = {
+    "methods": ["POST"],
+    "operation_description": "Get the articles that need to be posted, by comparing content hashes",
+    "manual_parameters": [header_ingest_authorization],
+    "request_body": content_hashes,
+    "responses": {
+        200: openapi.Response(
+            "application/json",
+            changed_foreign_ids,
+            examples={"application/json": [165556]},
+        ),
+        400: openapi.Response(
+            "application/json",
+            examples={"application/json": messages.invalid_parameters},
+        ),
+        403: forbidden_403,
+    },
+    "tags": ["Ingestion"],
+}
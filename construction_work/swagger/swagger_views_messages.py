@@ -61,6 +61,45 @@ image = openapi.Schema(
 
 images = openapi.Schema(type=openapi.TYPE_ARRAY, items=image)
 
+notification_status = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        "notification_id": openapi.Schema(type=openapi.TYPE_INTEGER),
+        "status": openapi.Schema(
+            type=openapi.TYPE_STRING, description="<pending|running|done|failed>"
+        ),
+        "token_count": openapi.Schema(type=openapi.TYPE_INTEGER),
+        "sent_count": openapi.Schema(type=openapi.TYPE_INTEGER),
+        "failed_count": openapi.Schema(type=openapi.TYPE_INTEGER),
+        "pruned_count": openapi.Schema(
+            type=openapi.TYPE_INTEGER, description="Dead tokens removed from devices"
+        ),
+        "failure_counts": openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            description="Failures by error class "
+            "<unregistered|invalid-argument|quota-exceeded|unavailable|unknown>",
+        ),
+        "duration": openapi.Schema(
+            type=openapi.TYPE_NUMBER, description="Seconds, once done"
+        ),
+        "progress": openapi.Schema(
+            type=openapi.TYPE_NUMBER, description="Fraction of the tokens handled"
+        ),
+    },
+)
+
+notification_status_example = {
+    "notification_id": 1,
+    "status": "pending",
+    "token_count": 0,
+    "sent_count": 0,
+    "failed_count": 0,
+    "pruned_count": 0,
+    "failure_counts": {},
+    "duration": None,
+    "progress": 0.0,
+}
+
 as_warning_message_get = {
     # /api/v1/notification/messages/warning/get
     "methods": ["GET"],
@@ -277,7 +316,94 @@ as_notification_post = {
     "responses": {
         200: openapi.Response(
             "application/json",
-            examples={"application/json": "Push notifications sent"},
+            examples={"application/json": "No subscribed devices found"},
+        ),
+        202: openapi.Response(
+            "application/json",
+            notification_status,
+            examples={"application/json": notification_status_example},
+        ),
+        400: openapi.Response(
+            "application/json",
+            examples={"application/json": message.invalid_query},
+        ),
+        403: forbidden_403,
+        404: not_found_404,
+    },
+    "tags": ["Notifications"],
+}
+
+as_notification_broadcast_post = {
+    # /api/v1/notification/broadcast
+    "methods": ["POST"],
+    "manual_parameters": [header_user_authorization],
+    "request_body": openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            "title": openapi.Schema(
+                type=openapi.TYPE_STRING, description="Title of notification"
+            ),
+            "body": openapi.Schema(
+                type=openapi.TYPE_STRING, description="Body of notification"
+            ),
+            "warning_id": openapi.Schema(
+                type=openapi.TYPE_INTEGER, description="Warning identifier"
+            ),
+            "project_ids": openapi.Schema(
+                type=openapi.TYPE_ARRAY,
+                items=openapi.Schema(type=openapi.TYPE_INTEGER),
+                description="Project identifiers, or district_id",
+            ),
+            "district_id": openapi.Schema(
+                type=openapi.TYPE_INTEGER,
+                description="District identifier (see districts), or project_ids",
+            ),
+            "topics": openapi.Schema(
+                type=openapi.TYPE_BOOLEAN,
+                description="Send a single message to the FCM topics of the district or of at most 5 projects",
+            ),
+        },
+    ),
+    "responses": {
+        200: openapi.Response(
+            "application/json",
+            examples={"application/json": "No subscribed devices found"},
+        ),
+        202: openapi.Response(
+            "application/json",
+            notification_status,
+            examples={"application/json": notification_status_example},
+        ),
+        400: openapi.Response(
+            "application/json",
+            examples={"application/json": message.invalid_parameters},
+        ),
+        403: forbidden_403,
+        404: not_found_404,
+    },
+    "tags": ["Notifications"],
+}
+
+as_notification_status_get = {
+    # /api/v1/notification/status
+    "methods": ["GET"],
+    "manual_parameters": [header_user_authorization, query_id],
+    "responses": {
+        200: openapi.Response(
+            "application/json",
+            notification_status,
+            examples={
+                "application/json": {
+                    **notification_status_example,
+                    "status": "running",
+                    "token_count": 5000,
+                    "sent_count": 998,
+                    "failed_count": 2,
+                    "pruned_count": 1,
+                    "failure_counts": {"unregistered": 1, "unavailable": 1},
+                    "progress": 0.2,
+                }
+            },
         ),
         400: openapi.Response(
             "application/json",
@@ -319,14 +445,14 @@ as_warning_message_image_post = {
     ),
     "responses": {
         200: openapi.Response(
-            "application/json",
+            "application/json (images is empty until the upload is converted in the background)",
             WarningImageSerializer,
             examples={
                 "application/json": {
                     "id": 234,
                     "is_main": False,
                     "warning": 3245,
-                    "images": [34, 35, 36],
+                    "images": [],
                 }
             },
         ),
@@ -336,6 +462,7 @@ as_warning_message_image_post = {
                 "application/json": [
                     message.invalid_query,
                     message.unsupported_image_format,
+                    message.image_too_large,
                 ]
             },
         ),
@@ -1,4 +1,11 @@
 """ Unittest mock functions (prevent calling actual 3th parties ) """
+import struct
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from firebase_admin import exceptions, messaging
 
 
 def firebase_admin_messaging_send_multicast(args):
@@ -9,6 +16,7 @@ def firebase_admin_messaging_send_multicast(args):
 
         def __init__(self, success):
             self.success = success
+            self.exception = None
 
     class Response:
         """Mock (outer) response class"""
@@ -24,3 +32,91 @@ def firebase_admin_messaging_send_multicast(args):
                     self.responses.append(response(True))
 
     return Response(args)
+
+
+class FakeFCM:
+    """Fake FCM, used as send_multicast of NotificationService
+
+    Tokens in failing_tokens fail (unregistered), tokens in quota_tokens fail once on an exceeded quota. Every token
+    fails on an invalid argument if invalid_argument is set (e.g. a message that is too large). The first
+    unavailable_count requests fail as a whole. Every request takes delay seconds, the highest number of requests
+    handled at the same time is kept in max_concurrency.
+    """
+
+    def __init__(
+        self,
+        failing_tokens=(),
+        unavailable_count=0,
+        delay=0.0,
+        quota_tokens=(),
+        invalid_argument=False,
+    ):
+        self.invalid_argument = invalid_argument
+        self.failing_tokens = set(failing_tokens)
+        self.quota_tokens = set(quota_tokens)
+        self.unavailable_count = unavailable_count
+        self.delay = delay
+        self.requests = []
+        self.max_concurrency = 0
+        self._concurrency = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, multicast_message):
+        with self._lock:
+            self.requests.append(list(multicast_message.tokens))
+            if self.unavailable_count > 0:
+                self.unavailable_count -= 1
+                raise exceptions.UnavailableError("FCM unavailable")
+            self._concurrency += 1
+            self.max_concurrency = max(self.max_concurrency, self._concurrency)
+
+        if self.delay > 0:
+            time.sleep(self.delay)
+        responses = []
+        for token in multicast_message.tokens:
+            if self.invalid_argument:
+                error = exceptions.InvalidArgumentError("Message is too big")
+                responses.append(messaging.SendResponse(None, error))
+            elif token in self.failing_tokens:
+                error = messaging.UnregisteredError("Requested entity was not found.")
+                responses.append(messaging.SendResponse(None, error))
+            elif token in self.quota_tokens:
+                with self._lock:
+                    self.quota_tokens.discard(token)
+                error = messaging.QuotaExceededError("Quota exceeded.")
+                responses.append(messaging.SendResponse(None, error))
+            else:
+                responses.append(
+                    messaging.SendResponse({"name": f"fake/{token}"}, None)
+                )
+
+        with self._lock:
+            self._concurrency -= 1
+        return messaging.BatchResponse(responses)
+
+
+def image_storage_settings(location):
+    """STORAGES setting with the image storage at a temporary location"""
+    return {
+        **settings.STORAGES,
+        "images": {
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+            "OPTIONS": {"location": location},
+        },
+    }
+
+
+def png_header(width, height):
+    """Png image data with a header only, the image claims width x height pixels without having any pixel data"""
+
+    def chunk(chunk_type, data):
+        crc = zlib.crc32(chunk_type + data)
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", crc)
+
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", ihdr)
+        + chunk(b"IDAT", zlib.compress(b""))
+        + chunk(b"IEND", b"")
+    )
@@ -1,7 +1,11 @@
 """ unit_tests """
 from django.test import TestCase
 
-from construction_work.generic_functions.aes_cipher import AESCipher, AESException
+from construction_work.generic_functions.aes_cipher import (
+    AESCipher,
+    AESException,
+    get_key_iv,
+)
 
 
 class TestHashing(TestCase):
@@ -27,3 +31,14 @@ class TestHashing(TestCase):
         aes = AESCipher(b"", "secret")
         with self.assertRaises(AESException):
             aes.decrypt()
+
+    def test_key_derivation_memoized(self):
+        """test the key and IV of a salt are derived once"""
+        encrypted = AESCipher("test string", "secret").encrypt()
+        get_key_iv.cache_clear()
+
+        for _ in range(3):
+            self.assertEqual(AESCipher(encrypted, "secret").decrypt(), "test string")
+
+        self.assertEqual(get_key_iv.cache_info().misses, 1)
+        self.assertEqual(get_key_iv.cache_info().hits, 2)
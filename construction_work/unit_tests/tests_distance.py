@@ -1,7 +1,12 @@
 """ unit_tests"""
+import math
+
 from django.test import TestCase
 
-from construction_work.generic_functions.gps_utils import get_distance
+from construction_work.generic_functions.distance_ranking import ProjectCoordinates
+from construction_work.generic_functions.gps_utils import get_distance, get_distances
+from construction_work.models import Project
+from construction_work.unit_tests.mock_data import TestData
 
 
 class TestDistance(TestCase):
@@ -18,3 +23,73 @@ class TestDistance(TestCase):
         meter, strides = get_distance(("a", "b"), ("c", "d"))
         self.assertEqual(meter, None)
         self.assertEqual(strides, None)
+
+    def test_distances_equal_to_geodesic(self):
+        """Test vectorized distances equal the geodesic distance of single pairs"""
+        origin = (52.379158791458494, 4.899904339167326)
+        lats = [52.3731077480929, 52.36002292836369, 0.0, -33.9, 52.379158791458494]
+        lons = [4.891371824969558, 4.8852016757845345, 0.0, 151.2, 4.899904339167326]
+
+        meters = get_distances(origin, lats, lons)
+        for lat, lon, meter in zip(lats, lons, meters):
+            expected_meter, _ = get_distance(origin, (lat, lon))
+            self.assertEqual(int(meter), expected_meter)
+
+    def test_distances_invalid(self):
+        """Test vectorized distances with missing coordinates"""
+        meters = get_distances((0.0, 0.0), [float("nan"), 1.0], [1.0, 1.0])
+        self.assertTrue(math.isnan(meters[0]))
+        self.assertEqual(int(meters[1]), 156899)
+
+
+class TestProjectCoordinates(TestCase):
+    """Test ranking projects by distance"""
+
+    def setUp(self):
+        self.data = TestData()
+        self.origin = (52.379158791458494, 4.899904339167326)
+
+    def create_project(self, foreign_id, coordinates):
+        """Create project at coordinates"""
+        project_data = self.data.projects[0]
+        project_data["foreign_id"] = foreign_id
+        project_data["coordinates"] = coordinates
+        return Project.objects.create(**project_data)
+
+    def test_rank_by_distance(self):
+        """Test projects ranked near to far, projects without coordinates last"""
+        far = self.create_project(1, {"lat": 52.358155575937595, "lon": 4.88118919})
+        unknown = self.create_project(2, None)
+        near = self.create_project(3, {"lat": 52.3731077480929, "lon": 4.8913718})
+        zero = self.create_project(4, {"lat": 0, "lon": 0})
+
+        table = ProjectCoordinates()
+        project_ids = [far.pk, unknown.pk, near.pk, zero.pk]
+        ranked_ids, distances = table.rank_by_distance(*self.origin, project_ids)
+
+        self.assertEqual(ranked_ids, [near.pk, far.pk, unknown.pk, zero.pk])
+        self.assertEqual(
+            distances[near.pk],
+            get_distance(self.origin, (52.3731077480929, 4.8913718)),
+        )
+        self.assertEqual(distances[unknown.pk], (None, None))
+        self.assertEqual(distances[zero.pk], (None, None))
+
+    def test_table_picks_up_changes(self):
+        """Test table is rebuilt for new and changed projects"""
+        table = ProjectCoordinates()
+        project = self.create_project(1, None)
+        _, distances = table.rank_by_distance(*self.origin, [project.pk])
+        self.assertEqual(distances[project.pk], (None, None))
+
+        # New project, unknown to the table
+        new_project = self.create_project(2, {"lat": 52.37, "lon": 4.89})
+        _, distances = table.rank_by_distance(*self.origin, [new_project.pk])
+        self.assertIsNotNone(distances[new_project.pk][0])
+
+        # Changed coordinates
+        project.coordinates = {"lat": 52.37, "lon": 4.89}
+        project.save()
+        table.invalidate()
+        _, distances = table.rank_by_distance(*self.origin, [project.pk])
+        self.assertIsNotNone(distances[project.pk][0])
@@ -1,10 +1,18 @@
 """ unit_tests """
 import base64
+import io
 import os
 
 from django.test import TestCase
+from PIL import Image, ImageChops, ImageStat
 
-from construction_work.generic_functions.image_conversion import ImageConversion
+from construction_work.generic_functions.image_conversion import (
+    EXIF_ORIENTATION,
+    MAX_PIXELS,
+    ImageConversion,
+    ImageTooLarge,
+)
+from construction_work.unit_tests.mock_functions import png_header
 
 
 class TestImageConversion(TestCase):
@@ -93,3 +101,105 @@ class TestImageConversion(TestCase):
         self.assertEqual(image_conversion.height, 1)
         self.assertEqual(image_conversion.width, 1)
         self.assertDictEqual(image_conversion.gps_info, {"lat": None, "lon": None})
+
+    def test_cascade_matches_direct_scaling(self):
+        """Test cascaded scaling yields the same sizes, and nearly the same pixels, as scaling from the original"""
+        stream = io.BytesIO()
+        Image.linear_gradient("L").resize((4000, 3000)).convert("RGB").save(
+            stream, format="JPEG"
+        )
+        image_data = stream.getvalue()
+
+        direct = ImageConversion(image_data, "gradient.jpg", cascade=False)
+        direct.run()
+        cascade = ImageConversion(image_data, "gradient.jpg", cascade=True)
+        cascade.run()
+
+        keys = ["320x240", "768x576", "1280x960", "1920x1440", "original"]
+        self.assertEqual(list(direct.images), keys)
+        self.assertEqual(list(cascade.images), keys)
+
+        for key in keys[:-1]:
+            direct_image = Image.open(io.BytesIO(direct.images[key]["data"]))
+            cascade_image = Image.open(io.BytesIO(cascade.images[key]["data"]))
+            self.assertEqual(cascade_image.size, direct_image.size)
+            self.assertEqual(cascade.images[key]["width"], direct_image.width)
+            difference = ImageChops.difference(direct_image, cascade_image)
+            self.assertLess(max(ImageStat.Stat(difference).mean), 2)
+
+    def test_variants(self):
+        """Test scaled images are also encoded in the variant formats"""
+        stream = io.BytesIO()
+        Image.linear_gradient("L").resize((1280, 960)).save(stream, format="JPEG")
+        image_conversion = ImageConversion(
+            stream.getvalue(), "gradient.jpg", variant_formats=["WEBP"]
+        )
+        image_conversion.run()
+
+        self.assertEqual(
+            list(image_conversion.images),
+            ["320x240", "768x576", "1280x960", "original"],
+        )
+        self.assertEqual(
+            list(image_conversion.variants),
+            ["320x240-webp", "768x576-webp", "1280x960-webp"],
+        )
+
+        variant = image_conversion.variants["768x576-webp"]
+        self.assertEqual(variant["variant_of"], "768x576")
+        self.assertEqual(variant["mime_type"], "image/webp")
+        self.assertEqual(variant["width"], 768)
+        self.assertEqual(variant["height"], 576)
+        self.assertEqual(variant["filename"], "768x576-webp-gradient.jpg")
+        self.assertEqual(Image.open(io.BytesIO(variant["data"])).format, "WEBP")
+
+    def test_heic_metadata(self):
+        """Test reading dimensions and gps data of a heic image without decoding it"""
+        path = "{cwd}/construction_work/unit_tests/image_data/landscape.HEIC".format(
+            cwd=os.getcwd()
+        )
+        image_conversion = ImageConversion(self.read_file(path), "landscape.HEIC")
+
+        self.assertTrue(image_conversion.read_metadata())
+        self.assertIsNone(image_conversion.raw_data)
+        self.assertEqual(image_conversion.image_format, "heic")
+        self.assertEqual(image_conversion.width, 4032)
+        self.assertEqual(image_conversion.height, 3024)
+        self.assertEqual(image_conversion.landscape, True)
+        self.assertAlmostEqual(image_conversion.gps_info["lat"], 52.144405, places=5)
+        self.assertAlmostEqual(image_conversion.gps_info["lon"], 6.182547, places=5)
+
+    def test_exif_orientation(self):
+        """Test images stored rotated are scaled and returned upright"""
+        image = Image.new("RGB", (2000, 1000))
+        exif = image.getexif()
+        exif[EXIF_ORIENTATION] = 6  # Rotated 90 degrees clockwise for display
+        stream = io.BytesIO()
+        image.save(stream, format="JPEG", exif=exif)
+
+        image_conversion = ImageConversion(stream.getvalue(), "rotated.jpg")
+        image_conversion.run()
+
+        self.assertEqual(image_conversion.landscape, False)
+        self.assertEqual(image_conversion.images["original"]["width"], 1000)
+        self.assertEqual(image_conversion.images["original"]["height"], 2000)
+        for key in ["90x180", "216x432", "360x720", "540x1080"]:
+            scaled_image = Image.open(io.BytesIO(image_conversion.images[key]["data"]))
+            self.assertEqual(f"{scaled_image.width}x{scaled_image.height}", key)
+
+    def test_too_large(self):
+        """Test images with too many pixels are rejected by their header"""
+        side = int(MAX_PIXELS**0.5) + 1
+        image_conversion = ImageConversion(png_header(side, side), "large.png")
+
+        with self.assertRaises(ImageTooLarge):
+            image_conversion.read_metadata()
+        with self.assertRaises(ImageTooLarge):
+            image_conversion.run()
+        self.assertDictEqual(image_conversion.images, {})
+
+    def test_malformed(self):
+        """Test images with a malformed header are rejected"""
+        image_conversion = ImageConversion(b"\xff\xd8\xff\xe0foobar", "foobar.jpg")
+        self.assertFalse(image_conversion.read_metadata())
+        self.assertFalse(image_conversion.run())
@@ -1,16 +1,34 @@
 """ unit_tests """
 
 import os
+import time
+from unittest.mock import patch
+from uuid import uuid4
 
 from django.contrib.auth import get_user_model
 from django.test import RequestFactory, TestCase
+from rest_framework.decorators import (
+    api_view,
+    authentication_classes,
+    permission_classes,
+)
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
 
 from construction_work.generic_functions.aes_cipher import AESCipher
 from construction_work.generic_functions.is_authorized import (
+    DEVICE_AUTH_HEADERS,
+    AESTokenAuthentication,
     IsAuthorized,
     JWTAuthorized,
     ManagerAuthorized,
+    ManagerTokenAuthentication,
+    decrypted_tokens,
+    get_meta_keys,
+    get_token_from_request,
 )
+from construction_work.generic_functions.token_cache import MISSING, TokenCache
 from construction_work.models import ProjectManager
 from construction_work.unit_tests.mock_data import TestData
 
@@ -135,3 +153,152 @@ class TestIsAuthorized(TestCase):
         request = self.factory.post("/", headers=headers)
         result = a_view(request)
         self.assertEqual(result.reason_phrase, "Forbidden")
+
+    def test_repeated_token_not_decrypted_again(self):
+        """Test a repeated token is served from the cache, valid or not"""
+
+        @IsAuthorized
+        def a_view(request):
+            return "success"
+
+        token = AESCipher(os.getenv("APP_TOKEN"), os.getenv("AES_SECRET")).encrypt()
+        valid_request = self.factory.post("/", headers={"DeviceAuthorization": token})
+        invalid_request = self.factory.post(
+            "/", headers={"DeviceAuthorization": "bogus"}
+        )
+
+        decrypted_tokens.clear()
+        with patch.object(
+            AESCipher, "decrypt", autospec=True, side_effect=AESCipher.decrypt
+        ) as mocked_decrypt:
+            for _ in range(3):
+                self.assertEqual(a_view(valid_request), "success")
+                self.assertEqual(a_view(invalid_request).status_code, 403)
+
+        self.assertEqual(len(mocked_decrypt.call_args_list), 2)
+
+    def test_cached_manager_token_checks_manager(self):
+        """Test a cached manager token is no longer valid once its manager is removed"""
+
+        @ManagerAuthorized
+        def a_view(request):
+            return "success"
+
+        project_manager = ProjectManager.objects.first()
+        token = AESCipher(
+            str(project_manager.manager_key), os.getenv("AES_SECRET")
+        ).encrypt()
+        request = self.factory.post("/", headers={"UserAuthorization": token})
+
+        self.assertEqual(a_view(request), "success")
+        project_manager.delete()
+        self.assertEqual(a_view(request).status_code, 403)
+
+
+class TestTokenCache(TestCase):
+    """Unittest for the cache of decrypted tokens"""
+
+    def test_least_recently_used_removed(self):
+        """Test the least recently used token is removed when full"""
+        token_cache = TokenCache(maxsize=2)
+        token_cache.set("a", "1")
+        token_cache.set("b", None)
+        token_cache.get("a")
+        token_cache.set("c", "3")
+
+        self.assertEqual(len(token_cache), 2)
+        self.assertEqual(token_cache.get("a"), "1")
+        self.assertIs(token_cache.get("b"), MISSING)
+        self.assertEqual(token_cache.get("c"), "3")
+
+    def test_expired(self):
+        """Test a token expires after the ttl"""
+        token_cache = TokenCache(ttl=60)
+        token_cache.set("a", None)
+        self.assertIsNone(token_cache.get("a"))
+
+        with patch("time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIs(token_cache.get("a"), MISSING)
+
+    def test_tokens_not_kept(self):
+        """Test the cache is keyed by HMAC instead of the tokens"""
+        token_cache = TokenCache()
+        token_cache.set("secret token", "1")
+
+        self.assertNotIn("secret token", token_cache._entries)
+        self.assertEqual(len(next(iter(token_cache._entries))), 32)
+
+
+class TestTokenAuthentication(TestCase):
+    """Unittest for the DRF authentication classes"""
+
+    def setUp(self):
+        """Setup project manager and views"""
+        self.factory = APIRequestFactory()
+        self.data = TestData()
+        self.project_manager = ProjectManager.objects.create(
+            **self.data.project_managers[0]
+        )
+        self.aes_secret = os.getenv("AES_SECRET")
+
+        @api_view(["GET"])
+        @authentication_classes([AESTokenAuthentication])
+        @permission_classes([IsAuthenticated])
+        def device_view(request):
+            return Response("success")
+
+        @api_view(["GET"])
+        @authentication_classes([ManagerTokenAuthentication])
+        @permission_classes([IsAuthenticated])
+        def manager_view(request):
+            return Response(str(request.user.project_manager.manager_key))
+
+        self.device_view = device_view
+        self.manager_view = manager_view
+
+    def test_device_token(self):
+        """Test a view authenticated by app token"""
+        token = AESCipher(os.getenv("APP_TOKEN"), self.aes_secret).encrypt()
+        for header in ["DeviceAuthorization", "IngestAuthorization"]:
+            request = self.factory.get("/", headers={header: token})
+            result = self.device_view(request)
+            self.assertEqual(result.status_code, 200)
+            self.assertEqual(result.data, "success")
+
+    def test_manager_token(self):
+        """Test the project manager of a manager token is available"""
+        manager_key = str(self.project_manager.manager_key)
+        token = AESCipher(manager_key, self.aes_secret).encrypt()
+        request = self.factory.get("/", headers={"UserAuthorization": token})
+
+        result = self.manager_view(request)
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.data, manager_key)
+
+        # Not a device token
+        result = self.device_view(request)
+        self.assertEqual(result.status_code, 403)
+
+    def test_invalid_token(self):
+        """Test an invalid or missing token is forbidden"""
+        for headers in [{"DeviceAuthorization": "bogus"}, {}]:
+            request = self.factory.get("/", headers=headers)
+            self.assertEqual(self.device_view(request).status_code, 403)
+
+        token = AESCipher(str(uuid4()), self.aes_secret).encrypt()
+        request = self.factory.get("/", headers={"UserAuthorization": token})
+        self.assertEqual(self.manager_view(request).status_code, 403)
+
+    def test_token_in_headers(self):
+        """Test the token is found in META["headers"] as well"""
+        token = AESCipher(os.getenv("APP_TOKEN"), self.aes_secret).encrypt()
+        request = self.factory.get("/")
+        request.META["headers"] = {"DeviceAuthorization": token}
+
+        self.assertEqual(self.device_view(request).status_code, 200)
+        self.assertEqual(
+            get_token_from_request(
+                request, DEVICE_AUTH_HEADERS, get_meta_keys(DEVICE_AUTH_HEADERS)
+            ),
+            token,
+        )
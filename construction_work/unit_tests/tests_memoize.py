@@ -0,0 +1,187 @@
+""" unit_tests """
+import threading
+import time
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from construction_work.generic_functions.memoize import Memoize, make_key
+
+
+class TestMemoize(TestCase):
+    """Test memoize decorator"""
+
+    def setUp(self):
+        self.calls = []
+
+    def make_function(self, memoize, **kwargs):
+        """Create memoized function that records its calls"""
+
+        @memoize(**kwargs)
+        def func(a, b=None):
+            self.calls.append((a, b))
+            return f"{a}-{b}-{len(self.calls)}"
+
+        return func
+
+    def test_all_arguments_are_part_of_the_key(self):
+        """Test args and kwargs are part of the cache key"""
+        memoize = Memoize()
+        func = self.make_function(memoize)
+
+        self.assertEqual(func(1, b=2), "1-2-1")
+        self.assertEqual(func(1, b=2), "1-2-1")
+        self.assertEqual(func(1, b=3), "1-3-2")
+        self.assertEqual(func(2, b=2), "2-2-3")
+        self.assertEqual(memoize.stats()["hits"], 1)
+        self.assertEqual(memoize.stats()["misses"], 3)
+
+    def test_args_and_kwargs_do_not_collide(self):
+        """Test keyword arguments can not be mistaken for positional arguments"""
+        memoize = Memoize()
+
+        @memoize
+        def func(*args, **kwargs):
+            return args, kwargs
+
+        self.assertEqual(func(1, None, ("a", 2)), ((1, None, ("a", 2)), {}))
+        self.assertEqual(func(1, a=2), ((1,), {"a": 2}))
+        self.assertEqual(memoize.stats()["misses"], 2)
+
+    def test_clear_cache_by_default_key(self):
+        """Test clearing an item by the key of its call"""
+        memoize = Memoize()
+        func = self.make_function(memoize)
+
+        self.assertEqual(func(1, b=2), "1-2-1")
+        self.assertEqual(func(2, b=2), "2-2-2")
+        memoize.clear_cache_by_key(make_key(1, b=2))
+        self.assertEqual(func(1, b=2), "1-2-3")
+        self.assertEqual(func(2, b=2), "2-2-2")
+
+    def test_functions_do_not_share_keys(self):
+        """Test two functions decorated by the same instance do not collide"""
+        memoize = Memoize()
+
+        @memoize
+        def one(a):
+            return 1
+
+        @memoize
+        def two(a):
+            return 2
+
+        self.assertEqual(one("x"), 1)
+        self.assertEqual(two("x"), 2)
+
+    def test_key_func(self):
+        """Test custom key function"""
+        memoize = Memoize()
+        func = self.make_function(memoize, key_func=lambda a, b=None: a)
+
+        self.assertEqual(func(1, b=2), "1-2-1")
+        self.assertEqual(func(1, b=3), "1-2-1")
+
+        memoize.clear_cache_by_key(1)
+        self.assertEqual(func(1, b=3), "1-3-2")
+
+    def test_unhashable_arguments_are_not_cached(self):
+        """Test unhashable arguments bypass the cache"""
+        memoize = Memoize()
+        func = self.make_function(memoize)
+
+        func([1])
+        func([1])
+        self.assertEqual(len(self.calls), 2)
+
+    def test_least_recently_used_is_evicted(self):
+        """Test LRU eviction above max_items"""
+        memoize = Memoize(max_items=2)
+        func = self.make_function(memoize)
+
+        func(1)
+        func(2)
+        func(1)  # 2 is now least recently used
+        func(3)
+
+        self.assertEqual(memoize.stats()["evictions"], 1)
+        self.assertEqual(memoize.stats()["items"], 2)
+        func(1)
+        self.assertEqual(len(self.calls), 3)
+        func(2)
+        self.assertEqual(len(self.calls), 4)
+
+    def test_ttl_expiry(self):
+        """Test expired items are recomputed"""
+        memoize = Memoize(ttl=10)
+        func = self.make_function(memoize)
+
+        with patch("time.monotonic", return_value=100.0):
+            func(1)
+            func(1)
+        with patch("time.monotonic", return_value=109.0):
+            func(1)
+        self.assertEqual(len(self.calls), 1)
+
+        with patch("time.monotonic", return_value=111.0):
+            func(1)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_ttl_override(self):
+        """Test ttl set on decorator"""
+        memoize = Memoize(ttl=10)
+        func = self.make_function(memoize, ttl=1)
+
+        with patch("time.monotonic", return_value=100.0):
+            func(1)
+        with patch("time.monotonic", return_value=102.0):
+            func(1)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_stale_while_revalidate(self):
+        """Test stale item is returned while it is refreshed in the background"""
+        memoize = Memoize(ttl=10, stale_while_revalidate=True)
+        refreshed = threading.Event()
+
+        @memoize
+        def func(a):
+            self.calls.append(a)
+            if len(self.calls) > 1:
+                refreshed.set()
+            return len(self.calls)
+
+        self.assertEqual(func(1), 1)
+
+        # Expire the item
+        key = next(iter(memoize.memoize_cache))
+        _, value = memoize.memoize_cache[key]
+        memoize.memoize_cache[key] = (time.monotonic() - 1, value)
+
+        self.assertEqual(func(1), 1)
+        self.assertTrue(refreshed.wait(timeout=5))
+        for _ in range(50):
+            if memoize.stats()["refreshes"] == 1:
+                break
+            time.sleep(0.01)
+        self.assertEqual(func(1), 2)
+        self.assertEqual(memoize.stats()["refreshes"], 1)
+
+    def test_concurrent_access(self):
+        """Test cache stays consistent with concurrent threads"""
+        memoize = Memoize(max_items=10)
+
+        @memoize
+        def func(a):
+            return a * 2
+
+        def worker():
+            for i in range(1000):
+                self.assertEqual(func(i % 20), (i % 20) * 2)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(memoize.stats()["items"], 10)
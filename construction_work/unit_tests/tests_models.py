@@ -1,8 +1,10 @@
 """ unit_tests """
 import uuid
 from datetime import datetime
+from io import StringIO
 
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.db import IntegrityError
 from django.test import TestCase
 
@@ -72,6 +74,12 @@ class TestImageModel(TestCase):
         self.assertEqual(image_object.coordinates, {"lat": 0.0, "lon": 0.0})
         self.assertEqual(image_object.mime_type, "image/jpg")
 
+    def test_image_data_deferred(self):
+        """Test image data is only loaded when accessed"""
+        image_object = Image.objects.all().first()
+        self.assertEqual(image_object.get_deferred_fields(), {"data"})
+        self.assertEqual(image_object.data, b"")
+
     def test_image_does_not_exist(self):
         """test not exist"""
         image = Image.objects.filter(pk=999).first()
@@ -151,6 +159,7 @@ class TestProjectModel(TestCase):
 
         device = Device.objects.create(**self.data.devices[0])
         device.followed_projects.add(project)
+        project.refresh_from_db()
 
         lat_lon_amstel_1 = (52.36763697623352, 4.89940424884927)
 
@@ -626,3 +635,68 @@ class TestDeviceModel(TestCase):
         device.followed_projects.remove(project)
 
         self.assertEqual(len(device.followed_projects.all()), 0)
+
+    def test_follower_count(self):
+        """Test follower count of project follows devices (un)following it"""
+        project = Project.objects.create(**self.data.projects[0])
+        other_project = Project.objects.create(**self.data.projects[1])
+        device1 = Device.objects.create(**self.data.devices[0])
+        device2 = Device.objects.create(**self.data.devices[1])
+
+        def follower_count():
+            project.refresh_from_db()
+            return project.follower_count
+
+        device1.followed_projects.add(project)
+        device1.followed_projects.add(project)
+        self.assertEqual(follower_count(), 1)
+
+        project.device_set.add(device2)
+        self.assertEqual(follower_count(), 2)
+
+        device1.followed_projects.remove(project, other_project)
+        self.assertEqual(follower_count(), 1)
+        other_project.refresh_from_db()
+        self.assertEqual(other_project.follower_count, 0)
+
+        device1.followed_projects.add(project, other_project)
+        device1.followed_projects.clear()
+        self.assertEqual(follower_count(), 1)
+
+        device1.followed_projects.add(project)
+        device2.delete()
+        self.assertEqual(follower_count(), 1)
+
+        project.device_set.clear()
+        self.assertEqual(follower_count(), 0)
+
+    def test_project_save_keeps_follower_count(self):
+        """Test saving an outdated project instance does not overwrite the follower count"""
+        project = Project.objects.create(**self.data.projects[0])
+        device = Device.objects.create(**self.data.devices[0])
+        device.followed_projects.add(project)
+
+        project.title = "new title"
+        project.save()
+
+        project.refresh_from_db()
+        self.assertEqual(project.title, "new title")
+        self.assertEqual(project.follower_count, 1)
+
+    def test_reconcile_followers(self):
+        """Test reconciliation of follower counts"""
+        project = Project.objects.create(**self.data.projects[0])
+        other_project = Project.objects.create(**self.data.projects[1])
+        for device_data in self.data.devices:
+            device = Device.objects.create(**device_data)
+            device.followed_projects.add(project)
+        Project.objects.update(follower_count=5)
+
+        out = StringIO()
+        call_command("reconcilefollowers", stdout=out)
+        self.assertIn("Fixed follower count of 2 projects", out.getvalue())
+
+        project.refresh_from_db()
+        other_project.refresh_from_db()
+        self.assertEqual(project.follower_count, 2)
+        self.assertEqual(other_project.follower_count, 0)
@@ -2,7 +2,9 @@
 
 from datetime import timedelta
 
+from django.db import DEFAULT_DB_ALIAS, connections
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from construction_work.generic_functions.model_utils import create_id_dict
@@ -199,3 +201,71 @@ class TestCreateProjectNewsLookup(TestProjectUtilsBase):
                 d.pop("modification_date")
 
         self.assertDictEqual(project_news_mapping, expected_project_map)
+
+    def test_single_query(self):
+        """Test articles and warnings are fetched in a single query"""
+        project2 = Project.objects.create(**self.data.projects[1])
+        self.create_article(10, timezone.now() - timedelta(days=1), self.project)
+        self.create_article(20, timezone.now() - timedelta(days=1), project2)
+        self.create_warning(timezone.now() - timedelta(days=1), project2)
+
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+            project_news_mapping = create_project_news_lookup(
+                projects=[self.project, project2], article_max_age=30
+            )
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertEqual(len(project_news_mapping[self.project.pk]), 1)
+        self.assertEqual(len(project_news_mapping[project2.pk]), 2)
+
+    def test_no_projects(self):
+        """Test no query without projects"""
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+            project_news_mapping = create_project_news_lookup(
+                projects=[], article_max_age=30
+            )
+        self.assertEqual(len(queries.captured_queries), 0)
+        self.assertDictEqual(project_news_mapping, {})
+
+    def test_news_read_by_project_index(self):
+        """Test only news of the requested projects is read: the query plan looks the news up by project id, instead of
+        scanning all news in the date range"""
+        other_project = Project.objects.create(**self.data.projects[1])
+        for foreign_id in range(10):
+            self.create_article(
+                foreign_id, timezone.now() - timedelta(days=1), other_project
+            )
+        self.create_article(100, timezone.now() - timedelta(days=1))
+        self.create_warning(timezone.now() - timedelta(days=1))
+
+        connection = connections[DEFAULT_DB_ALIAS]
+        with CaptureQueriesContext(connection) as queries:
+            create_project_news_lookup(projects=[self.project], article_max_age=30)
+        self.assertEqual(len(queries.captured_queries), 1)
+
+        def get_nodes(plan):
+            yield plan
+            for sub_plan in plan.get("Plans", []):
+                yield from get_nodes(sub_plan)
+
+        with connection.cursor() as cursor:
+            # The tables are tiny, without this the planner reads them sequentially whatever the query
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(
+                f"EXPLAIN (FORMAT JSON) {queries.captured_queries[0]['sql']}"
+            )
+            plan = cursor.fetchone()[0][0]["Plan"]
+
+        # Tables read through an index on project_id, a bitmap scan has the index condition as recheck condition
+        index_scans = {
+            x["Relation Name"]
+            for x in get_nodes(plan)
+            if "Relation Name" in x
+            and "project_id" in x.get("Index Cond", x.get("Recheck Cond", ""))
+        }
+        self.assertSetEqual(
+            index_scans,
+            {
+                Article.projects.through._meta.db_table,
+                WarningMessage._meta.db_table,
+            },
+        )
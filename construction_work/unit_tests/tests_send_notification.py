@@ -1,8 +1,14 @@
 """ unit_tests """
 import logging
-from unittest.mock import call, patch
+from io import StringIO
+from unittest.mock import Mock, call, patch
 
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from firebase_admin import messaging
 
 from construction_work.api_messages import Messages
 from construction_work.models import (
@@ -12,9 +18,11 @@ from construction_work.models import (
     WarningMessage,
 )
 from construction_work.models.device import Device
+from construction_work.push_notifications import dispatcher, topics
 from construction_work.push_notifications.send_notification import NotificationService
 from construction_work.unit_tests.mock_data import TestData
 from construction_work.unit_tests.mock_functions import (
+    FakeFCM,
     firebase_admin_messaging_send_multicast,
 )
 
@@ -69,7 +77,7 @@ class TestNotificationService(TestCase):
     def test_create_token_batches_for_followed_project(self):
         """Test if batches are created as expected with a followed project"""
         ns = NotificationService(self.notification_with_followers, 1)
-        created_batch = ns._create_subscribed_device_batches()
+        created_batch = list(ns._create_subscribed_device_batches())
         expected_tokens = [[x["firebase_token"]] for x in self.data.devices]
 
         self.assertEqual(len(created_batch), 2)
@@ -78,7 +86,7 @@ class TestNotificationService(TestCase):
     def test_create_token_batches_for_non_followed_project(self):
         """Test if batches are created as expected with a project without followers"""
         ns = NotificationService(self.notification_without_followers, 1)
-        created_batch = ns._create_subscribed_device_batches()
+        created_batch = list(ns._create_subscribed_device_batches())
 
         self.assertEqual(len(created_batch), 0)
         self.assertEqual(created_batch, [])
@@ -94,7 +102,7 @@ class TestNotificationService(TestCase):
         """Test if setup creates batches and therefor returns true"""
         ns = NotificationService(self.notification_with_followers, 1)
         setup_result = ns.setup()
-        created_batch = ns.subscribed_device_batches
+        created_batch = list(ns.subscribed_device_batches)
         expected_tokens = [[x["firebase_token"]] for x in self.data.devices]
 
         self.assertEqual(len(created_batch), 2)
@@ -132,5 +140,379 @@ class TestNotificationService(TestCase):
             assert mocked_log.call_args_list == [
                 call("List of tokens that caused failures: ['foobar_token1']")
             ]
-            self.assertEqual(len(ns.subscribed_device_batches), 1)
-            self.assertEqual(len(ns.subscribed_device_batches[0]), 2)
+            self.assertEqual(ns.token_count, 2)
+            self.assertEqual(ns.sent_count, 1)
+
+
+class TestNotificationDispatcher(TestCase):
+    """Test background dispatch of notifications against a fake FCM"""
+
+    def setUp(self) -> None:
+        """Setup project with following devices and a pending notification"""
+        self.data = TestData()
+        project = Project.objects.create(**self.data.projects[0])
+        project_manager = ProjectManager.objects.create(**self.data.project_managers[0])
+        warning_message = WarningMessage.objects.create(
+            title="title",
+            project=project,
+            project_manager=project_manager,
+            body={"preface": "short text", "content": "long text"},
+        )
+        self.notification = Notification.objects.create(
+            title="title", body="text", warning=warning_message
+        )
+
+        self.tokens = [f"token{i}" for i in range(10)]
+        for token in self.tokens:
+            device = Device.objects.create(device_id=token, firebase_token=token)
+            device.followed_projects.add(project)
+
+    def test_batches_sent_concurrently(self):
+        """Test all batches are sent, at the same time, and the progress is stored"""
+        fake_fcm = FakeFCM(failing_tokens=["token3"], delay=0.05)
+
+        claimed = dispatcher.run_notifications(
+            limit=10, send_multicast=fake_fcm, batch_size=2, max_workers=4
+        )
+
+        self.assertEqual(claimed, 1)
+        self.assertEqual(len(fake_fcm.requests), 5)
+        self.assertCountEqual(
+            [x for request in fake_fcm.requests for x in request], self.tokens
+        )
+        self.assertGreater(fake_fcm.max_concurrency, 1)
+        self.assertLessEqual(fake_fcm.max_concurrency, 4)
+
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, Notification.DONE)
+        self.assertEqual(self.notification.token_count, 10)
+        self.assertEqual(self.notification.sent_count, 9)
+        self.assertEqual(self.notification.failed_count, 1)
+        self.assertIsNotNone(self.notification.duration)
+
+        # Not sent again
+        self.assertEqual(dispatcher.run_notifications(limit=10), 0)
+
+    def test_retry_unavailable(self):
+        """Test a batch is retried when FCM is unavailable"""
+        fake_fcm = FakeFCM(unavailable_count=2)
+
+        dispatcher.run_notifications(
+            limit=1, send_multicast=fake_fcm, retry_backoff=0.001
+        )
+
+        self.assertEqual(len(fake_fcm.requests), 3)
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.sent_count, 10)
+
+    def test_retries_exhausted(self):
+        """Test the tokens of a batch fail once its retries are exhausted"""
+        fake_fcm = FakeFCM(unavailable_count=10)
+
+        dispatcher.run_notifications(
+            limit=1, send_multicast=fake_fcm, retries=1, retry_backoff=0.001
+        )
+
+        self.assertEqual(len(fake_fcm.requests), 2)
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, Notification.DONE)
+        self.assertEqual(self.notification.failed_count, 10)
+        self.assertEqual(self.notification.failure_counts, {"unavailable": 10})
+        self.assertEqual(self.notification.pruned_count, 0)
+
+    def test_dead_tokens_pruned(self):
+        """Test unregistered tokens are removed from their devices"""
+        fake_fcm = FakeFCM(failing_tokens=["token3", "token7"])
+
+        dispatcher.run_notifications(limit=1, send_multicast=fake_fcm, batch_size=5)
+
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.sent_count, 8)
+        self.assertEqual(self.notification.failed_count, 2)
+        self.assertEqual(self.notification.pruned_count, 2)
+        self.assertEqual(self.notification.failure_counts, {"unregistered": 2})
+        self.assertEqual(
+            Device.objects.filter(firebase_token=None).count(),
+            2,
+        )
+        self.assertIsNone(Device.objects.get(device_id="token3").firebase_token)
+
+    def test_batches_read_by_device_id(self):
+        """Test a batch is read by a single query, starting after the last device of the previous batch"""
+        notification_service = NotificationService(
+            self.notification, batch_size=4, send_multicast=FakeFCM()
+        )
+        batches = notification_service._create_subscribed_device_batches()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(next(batches), self.tokens[:4])
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(next(batches), self.tokens[4:8])
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotIn("OFFSET", context.captured_queries[0]["sql"])
+        self.assertEqual(list(batches), [self.tokens[8:]])
+
+    def test_pruned_tokens_do_not_shift_batches(self):
+        """Test no token is skipped when tokens of earlier batches are pruned while sending"""
+        fake_fcm = FakeFCM(failing_tokens=self.tokens[:4])
+
+        dispatcher.run_notifications(
+            limit=1, send_multicast=fake_fcm, batch_size=2, max_workers=1
+        )
+
+        self.assertEqual(
+            [x for request in fake_fcm.requests for x in request], self.tokens
+        )
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.sent_count, 6)
+        self.assertEqual(self.notification.pruned_count, 4)
+
+    def test_invalid_message_not_pruned(self):
+        """Test tokens are kept when every token fails on an invalid argument (an invalid message)"""
+        fake_fcm = FakeFCM(invalid_argument=True)
+
+        dispatcher.run_notifications(limit=1, send_multicast=fake_fcm, batch_size=5)
+
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.sent_count, 0)
+        self.assertEqual(self.notification.failed_count, 10)
+        self.assertEqual(self.notification.pruned_count, 0)
+        self.assertEqual(self.notification.failure_counts, {"invalid-argument": 10})
+        self.assertEqual(Device.objects.filter(firebase_token=None).count(), 0)
+
+    def test_retry_failed_tokens(self):
+        """Test only the tokens failing on a transient error are sent again"""
+        fake_fcm = FakeFCM(quota_tokens=["token1", "token2"])
+
+        dispatcher.run_notifications(
+            limit=1, send_multicast=fake_fcm, retry_backoff=0.001
+        )
+
+        self.assertEqual(fake_fcm.requests[1], ["token1", "token2"])
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.sent_count, 10)
+        self.assertEqual(self.notification.failed_count, 0)
+        self.assertEqual(self.notification.failure_counts, {})
+
+    def test_rate_limit(self):
+        """Test the messages are spread over time"""
+        fake_fcm = FakeFCM()
+
+        with patch("time.sleep") as mocked_sleep:
+            dispatcher.run_notifications(
+                limit=1, send_multicast=fake_fcm, batch_size=5, max_workers=1, rate=5
+            )
+
+        # The second batch of 5 tokens waits about a second
+        self.assertEqual(len(mocked_sleep.call_args_list), 1)
+        self.assertAlmostEqual(mocked_sleep.call_args_list[0].args[0], 1.0, places=1)
+
+    def test_stale_notification_not_sent_again(self):
+        """Test a notification that was running when its worker died is failed instead of sent again"""
+        Notification.objects.filter(pk=self.notification.pk).update(
+            status=Notification.RUNNING
+        )
+        with patch(
+            "django.utils.timezone.now",
+            return_value=timezone.now() + dispatcher.STALE_NOTIFICATION_TIMEOUT * 2,
+        ):
+            claimed = dispatcher.run_notifications(limit=1, send_multicast=FakeFCM())
+
+        self.assertEqual(claimed, 0)
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, Notification.FAILED)
+
+    @patch(
+        "construction_work.push_notifications.send_notification.initialize_firebase_app"
+    )
+    def test_command(self, _):
+        """Test the management command sends pending notifications"""
+        fake_fcm = FakeFCM()
+        with patch("firebase_admin.messaging.send_each_for_multicast", fake_fcm):
+            call_command("sendnotifications", once=True, stdout=StringIO())
+
+        self.assertEqual(len(fake_fcm.requests), 1)
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, Notification.DONE)
+
+
+class TestNotificationBroadcast(TestCase):
+    """Test sending broadcasts to the followers of several projects"""
+
+    def setUp(self) -> None:
+        """Setup projects in a district with overlapping followers"""
+        self.data = TestData()
+        self.projects = [
+            Project.objects.create(**x, district_id=5398) for x in self.data.projects
+        ]
+        project_manager = ProjectManager.objects.create(**self.data.project_managers[0])
+        warning_message = WarningMessage.objects.create(
+            title="title",
+            project=self.projects[0],
+            project_manager=project_manager,
+            body={"preface": "short text", "content": "long text"},
+        )
+        self.notification = Notification.objects.create(
+            title="title", body="text", warning=warning_message
+        )
+
+        # Every device follows both projects, the last one does not have a token
+        self.tokens = [f"token{i}" for i in range(5)]
+        for token in self.tokens + [None]:
+            device = Device.objects.create(device_id=str(token), firebase_token=token)
+            device.followed_projects.add(*self.projects)
+
+    def test_followers_sent_to_once(self):
+        """Test a device following several projects is sent to once"""
+        self.notification.projects.set(self.projects)
+        fake_fcm = FakeFCM()
+
+        dispatcher.run_notifications(limit=1, send_multicast=fake_fcm, batch_size=2)
+
+        self.assertEqual(
+            [x for request in fake_fcm.requests for x in request], self.tokens
+        )
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.token_count, 5)
+        self.assertEqual(self.notification.sent_count, 5)
+
+    def test_district(self):
+        """Test the followers of the projects in the district are sent to"""
+        Notification.objects.filter(pk=self.notification.pk).update(district_id=5398)
+        Project.objects.filter(pk=self.projects[0].pk).update(district_id=None)
+        fake_fcm = FakeFCM()
+
+        dispatcher.run_notifications(limit=1, send_multicast=fake_fcm)
+
+        self.assertEqual(fake_fcm.requests, [self.tokens])
+
+    def test_topics(self):
+        """Test a single message is sent to the topic condition"""
+        Notification.objects.filter(pk=self.notification.pk).update(use_topics=True)
+        self.notification.projects.set(self.projects)
+        send_message = Mock()
+
+        dispatcher.run_notifications(
+            limit=1, send_multicast=FakeFCM(), send_message=send_message
+        )
+
+        self.assertEqual(len(send_message.call_args_list), 1)
+        message = send_message.call_args_list[0].args[0]
+        self.assertEqual(
+            message.condition,
+            " || ".join(
+                f"'{topics.project_topic(x.pk)}' in topics"
+                for x in sorted(self.projects, key=lambda x: x.pk)
+            ),
+        )
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, Notification.DONE)
+        self.assertEqual(self.notification.sent_count, 5)
+
+    def test_district_topic(self):
+        """Test a district broadcast is sent to the district topic"""
+        Notification.objects.filter(pk=self.notification.pk).update(
+            use_topics=True, district_id=5398
+        )
+        send_message = Mock()
+
+        dispatcher.run_notifications(
+            limit=1, send_multicast=FakeFCM(), send_message=send_message
+        )
+
+        message = send_message.call_args_list[0].args[0]
+        self.assertEqual(message.condition, "'district-5398' in topics")
+
+
+@override_settings(FCM_TOPICS=True)
+@patch("construction_work.push_notifications.topics.initialize_firebase_app")
+@patch(
+    "firebase_admin.messaging.unsubscribe_from_topic",
+    return_value=messaging.TopicManagementResponse({"results": [{}]}),
+)
+@patch(
+    "firebase_admin.messaging.subscribe_to_topic",
+    return_value=messaging.TopicManagementResponse({"results": [{}]}),
+)
+class TestTopicSubscriptions(TestCase):
+    """Test topic subscriptions follow device.followed_projects"""
+
+    def setUp(self) -> None:
+        """Setup two projects in a district and one in another district"""
+        self.data = TestData()
+        self.projects = [
+            Project.objects.create(**x, district_id=5398) for x in self.data.projects
+        ]
+        self.other_project = Project.objects.create(
+            **{**self.data.projects[0], "foreign_id": 9999}, district_id=5520
+        )
+        self.device = Device.objects.create(device_id="device", firebase_token="token")
+
+    @staticmethod
+    def get_topics(mocked):
+        """Get topics of the calls of a mocked (un)subscribe"""
+        return [x.args[1] for x in mocked.call_args_list]
+
+    def test_follow(self, subscribe, unsubscribe, _):
+        """Test following a project subscribes to its topic and district topic"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.device.followed_projects.add(self.projects[0])
+
+        self.assertCountEqual(
+            self.get_topics(subscribe),
+            [topics.project_topic(self.projects[0].pk), "district-5398"],
+        )
+        self.assertEqual(subscribe.call_args_list[0].args[0], ["token"])
+        self.assertEqual(unsubscribe.call_args_list, [])
+
+    def test_unfollow(self, subscribe, unsubscribe, _):
+        """Test the district topic is kept while another project in the district is followed"""
+        self.device.followed_projects.add(*self.projects, self.other_project)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.device.followed_projects.remove(self.projects[0], self.other_project)
+
+        self.assertCountEqual(
+            self.get_topics(unsubscribe),
+            [
+                topics.project_topic(self.projects[0].pk),
+                topics.project_topic(self.other_project.pk),
+                "district-5520",
+            ],
+        )
+
+    def test_new_token(self, subscribe, unsubscribe, _):
+        """Test the subscriptions move to a new token"""
+        self.device.followed_projects.add(self.projects[0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.device.firebase_token = "new_token"
+            self.device.save()
+
+        self.assertEqual(unsubscribe.call_args_list[0].args[0], ["token"])
+        self.assertEqual(subscribe.call_args_list[0].args[0], ["new_token"])
+        self.assertCountEqual(
+            self.get_topics(subscribe),
+            [topics.project_topic(self.projects[0].pk), "district-5398"],
+        )
+
+    def test_disabled(self, subscribe, unsubscribe, _):
+        """Test nothing is subscribed while topics are disabled"""
+        with override_settings(FCM_TOPICS=False):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.device.followed_projects.add(self.projects[0])
+
+        self.assertEqual(subscribe.call_args_list, [])
+
+    def test_command(self, subscribe, unsubscribe, _):
+        """Test the management command subscribes the followers of all projects"""
+        with override_settings(FCM_TOPICS=False):
+            self.device.followed_projects.add(*self.projects)
+
+        call_command("subscribetopics", stdout=StringIO())
+
+        self.assertCountEqual(
+            self.get_topics(subscribe),
+            [topics.project_topic(x.pk) for x in self.projects]
+            + ["district-5398", "district-5398"],
+        )
@@ -1,12 +1,22 @@
 """ unit_tests """
 import base64
 import os
+import shutil
+import tempfile
+from io import StringIO
 
+from django.core.management import call_command
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
 
 from construction_work.api_messages import Messages
+from construction_work.generic_functions import image_storage
 from construction_work.generic_functions.aes_cipher import AESCipher
+from construction_work.generic_functions.static_data import IMAGE_CACHE_MAX_AGE
 from construction_work.models import Image
+from construction_work.unit_tests.mock_functions import image_storage_settings
 
 messages = Messages()
 
@@ -24,8 +34,32 @@ class TestApiImage(TestCase):
         token = AESCipher(app_token, aes_secret).encrypt()
         self.headers = {"DeviceAuthorization": token}
 
+        self.storage_location = tempfile.mkdtemp()
+        storage_settings = self.settings(
+            STORAGES=image_storage_settings(self.storage_location)
+        )
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+
+        base64_small_green_square = "iVBORw0KGgoAAAANSUhEUgAAAAoAAAAKCAIAAAACUFjqAAAAE0lEQVR4nGNkaGDAA5jwSY5caQCnUgCUBZU3vQAAAABJRU5ErkJggg=="  # pylint: disable=line-too-long
+        self.binary_data = base64.b64decode(base64_small_green_square)
+
     def tearDown(self) -> None:
         Image.objects.all().delete()
+        shutil.rmtree(self.storage_location, ignore_errors=True)
+
+    def create_image(self, **kwargs):
+        """Create image"""
+        image_data = {
+            "description": "foobar",
+            "width": 10,
+            "height": 10,
+            "aspect_ratio": 1,
+            "coordinates": None,
+            "mime_type": "image/png",
+        }
+        image_data.update(kwargs)
+        return Image.objects.create(**image_data)
 
     def test_get_image(self):
         """Test get image"""
@@ -59,3 +93,172 @@ class TestApiImage(TestCase):
         """Test request image that does not exist"""
         response = self.client.get(self.api_url, {"id": 9999}, headers=self.headers)
         self.assertEqual(response.status_code, 404)
+
+    def test_get_stored_image(self):
+        """Test image data from the image storage is streamed"""
+        content_hash = image_storage.save(self.binary_data)
+        image = self.create_image(content_hash=content_hash)
+
+        response = self.client.get(self.api_url, {"id": image.pk}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(b"".join(response.streaming_content), self.binary_data)
+
+    def test_stored_image_missing(self):
+        """Test image data missing from the image storage"""
+        image = self.create_image(content_hash=image_storage.get_content_hash(b"foo"))
+
+        response = self.client.get(self.api_url, {"id": image.pk}, headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_stored_image_data_is_shared(self):
+        """Test identical images share their data, which is deleted with the last image"""
+        content_hash = image_storage.save(self.binary_data)
+        self.assertEqual(image_storage.save(self.binary_data), content_hash)
+        image1 = self.create_image(content_hash=content_hash)
+        image2 = self.create_image(content_hash=content_hash)
+        storage = image_storage.get_storage()
+        name = image_storage.get_name(content_hash)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image1.delete()
+        self.assertTrue(storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image2.delete()
+        self.assertFalse(storage.exists(name))
+
+    def test_offload_images(self):
+        """Test moving image data from the database to the image storage"""
+        image = self.create_image(data=self.binary_data)
+        stored_image = self.create_image(
+            content_hash=image_storage.save(b"stored image")
+        )
+
+        out = StringIO()
+        call_command("offloadimages", batch_size=1, stdout=out)
+        self.assertIn("Moved 1 images", out.getvalue())
+
+        image.refresh_from_db()
+        self.assertIsNone(image.data)
+        self.assertEqual(
+            image.content_hash, image_storage.get_content_hash(self.binary_data)
+        )
+        stored_image.refresh_from_db()
+        self.assertEqual(
+            stored_image.content_hash, image_storage.get_content_hash(b"stored image")
+        )
+
+        response = self.client.get(self.api_url, {"id": image.pk}, headers=self.headers)
+        self.assertEqual(b"".join(response.streaming_content), self.binary_data)
+
+    def test_image_auth(self):
+        """Test the authorization of (cached) image requests, a made-up token is forbidden"""
+        response = self.client.get(f"{self.api_url}/auth", headers=self.headers)
+        self.assertEqual(response.status_code, 204)
+
+        for headers in [{"DeviceAuthorization": "made-up"}, {}]:
+            response = self.client.get(f"{self.api_url}/auth", headers=headers)
+            self.assertEqual(response.status_code, 403)
+
+    def test_cache_headers(self):
+        """Test image responses can be cached forever"""
+        content_hash = image_storage.save(self.binary_data)
+        image = self.create_image(content_hash=content_hash)
+
+        response = self.client.get(self.api_url, {"id": image.pk}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], f'"{content_hash}"')
+        self.assertEqual(
+            response["Last-Modified"], http_date(image.creation_date.timestamp())
+        )
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("private", response["Cache-Control"])
+        self.assertNotIn("public", response["Cache-Control"])
+        self.assertIn(f"max-age={IMAGE_CACHE_MAX_AGE}", response["Cache-Control"])
+
+    def test_if_none_match(self):
+        """Test conditional request is answered without reading the image data"""
+        content_hash = image_storage.save(self.binary_data)
+        image = self.create_image(content_hash=content_hash)
+        image_storage.delete(content_hash)
+
+        headers = {**self.headers, "If-None-Match": f'"{content_hash}"'}
+        response = self.client.get(self.api_url, {"id": image.pk}, headers=headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], f'"{content_hash}"')
+        self.assertIn("immutable", response["Cache-Control"])
+
+        headers = {**self.headers, "If-None-Match": '"other"'}
+        response = self.client.get(self.api_url, {"id": image.pk}, headers=headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_if_modified_since(self):
+        """Test conditional request by modification date"""
+        image = self.create_image(content_hash=image_storage.save(self.binary_data))
+
+        headers = {
+            **self.headers,
+            "If-Modified-Since": http_date(image.creation_date.timestamp()),
+        }
+        response = self.client.get(self.api_url, {"id": image.pk}, headers=headers)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_of_image_in_database(self):
+        """Test image data still in the database is revalidated without reading the data"""
+        image = self.create_image(data=self.binary_data)
+        etag = f'"{image.pk}-{int(image.creation_date.timestamp())}"'
+
+        response = self.client.get(self.api_url, {"id": image.pk}, headers=self.headers)
+        self.assertEqual(response.content, self.binary_data)
+        self.assertEqual(response["ETag"], etag)
+
+        headers = {**self.headers, "If-None-Match": etag}
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.api_url, {"id": image.pk}, headers=headers)
+        self.assertEqual(response.status_code, 304)
+        for query in context.captured_queries:
+            self.assertNotIn('"construction_work_image"."data"', query["sql"])
+
+    def test_image_variants(self):
+        """Test the most preferred variant accepted by the client is served"""
+        jpeg = self.create_image(
+            content_hash=image_storage.save(b"jpeg"), mime_type="image/jpeg"
+        )
+        webp = self.create_image(
+            content_hash=image_storage.save(b"webp"),
+            mime_type="image/webp",
+            variant_of=jpeg,
+        )
+        self.create_image(
+            content_hash=image_storage.save(b"avif"),
+            mime_type="image/avif",
+            variant_of=jpeg,
+        )
+
+        def get_image(accept):
+            headers = {**self.headers, "Accept": accept}
+            response = self.client.get(self.api_url, {"id": jpeg.pk}, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("Accept", response["Vary"])
+            return response["Content-Type"], b"".join(response.streaming_content)
+
+        self.assertEqual(get_image("*/*"), ("image/jpeg", b"jpeg"))
+        self.assertEqual(get_image("image/*, */*"), ("image/jpeg", b"jpeg"))
+        self.assertEqual(get_image("image/webp, */*;q=0.8"), ("image/webp", b"webp"))
+        self.assertEqual(
+            get_image("image/avif;q=0, image/webp, */*"), ("image/webp", b"webp")
+        )
+        self.assertEqual(
+            get_image("image/avif, image/webp, */*"), ("image/avif", b"avif")
+        )
+
+        # Variants are served as is
+        response = self.client.get(
+            self.api_url,
+            {"id": webp.pk},
+            headers={**self.headers, "Accept": "image/avif, */*"},
+        )
+        self.assertEqual(b"".join(response.streaming_content), b"webp")
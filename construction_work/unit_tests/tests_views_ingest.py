@@ -1,11 +1,18 @@
 """ Test ingest views """
+import copy
 import datetime
+import hashlib
+import json
 import os
+from unittest.mock import patch
 
 import pytz
+from django.db import DEFAULT_DB_ALIAS, connections
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from rest_framework.exceptions import ErrorDetail
 
+from construction_work.generic_functions import etl_snapshot, projects_cache
 from construction_work.generic_functions.aes_cipher import AESCipher
 from construction_work.models import Article, Project
 from construction_work.unit_tests.mock_data import TestData
@@ -23,6 +30,11 @@ class BaseTestIngestViews(TestCase):
         self.content_type = "application/json"
         self.client = Client()
 
+    def get_streamed_json(self, result):
+        """Get JSON of a streamed response"""
+        self.assertTrue(result.streaming)
+        return json.loads(b"".join(result.streaming_content))
+
 
 class TestProjectIngestViews(BaseTestIngestViews):
     """Test project ingest views"""
@@ -88,6 +100,29 @@ class TestProjectIngestViews(BaseTestIngestViews):
         self.assertEqual(updated_project.title, new_title)
         self.assertNotEqual(updated_project.title, initial_title)
 
+    def test_unchanged_project_not_written(self):
+        """Test an unchanged project is not written again"""
+        project = self.test_data.ingest_projects[0]
+        self.client.post(
+            self.api_url,
+            data=project,
+            headers=self.header,
+            content_type="application/json",
+        )
+        Project.objects.update(last_seen=datetime.datetime(2023, 1, 1, tzinfo=pytz.utc))
+
+        result = self.client.post(
+            self.api_url,
+            data=project,
+            headers=self.header,
+            content_type="application/json",
+        )
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.data["foreign_id"], project["foreign_id"])
+        last_seen = Project.objects.get().last_seen
+        self.assertEqual(last_seen, datetime.datetime(2023, 1, 1, tzinfo=pytz.utc))
+
     def test_project_invalid(self):
         """test invalid project"""
         data = {"bogus": "bogus"}
@@ -137,7 +172,210 @@ class TestProjectIngestViews(BaseTestIngestViews):
                 )
             },
         }
-        self.assertDictEqual(result.data, expected_result)
+        self.assertDictEqual(self.get_streamed_json(result), expected_result)
+
+
+class TestSnapshotViews(BaseTestIngestViews):
+    """Test streamed ETL snapshots"""
+
+    def setUp(self):
+        """Setup test data"""
+        self.test_data = TestData()
+        self.api_url = "/api/v1/ingest/project"
+        [Project.objects.create(**x) for x in self.test_data.projects]
+        Project.objects.filter(foreign_id=4096).update(
+            modification_date=datetime.datetime(2023, 6, 1, tzinfo=pytz.utc)
+        )
+        super().setUp()
+
+    def test_since(self):
+        """Test only projects modified after since"""
+        result = self.client.get(
+            self.api_url, {"since": "2023-03-01T00:00:00Z"}, headers=self.header
+        )
+
+        self.assertEqual(result.status_code, 200)
+        self.assertDictEqual(
+            self.get_streamed_json(result),
+            {"4096": {"modification_date": "2023-06-01 00:00:00+00:00"}},
+        )
+
+    def test_invalid_since(self):
+        """Test since must be a datetime"""
+        result = self.client.get(self.api_url, {"since": "bogus"}, headers=self.header)
+
+        self.assertEqual(result.status_code, 400)
+
+    def test_ndjson(self):
+        """Test snapshot as NDJSON, streamed per chunk"""
+        with patch.object(etl_snapshot, "SNAPSHOT_CHUNK_SIZE", 1):
+            result = self.client.get(
+                self.api_url, {"output": "ndjson"}, headers=self.header
+            )
+            chunks = list(result.streaming_content)
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result["Content-Type"], "application/x-ndjson")
+        self.assertEqual(len(chunks), 2)
+        lines = [json.loads(x) for x in b"".join(chunks).splitlines()]
+        self.assertEqual(
+            lines,
+            [
+                {"foreign_id": 2048, "modification_date": "2023-01-20 00:00:00+00:00"},
+                {"foreign_id": 4096, "modification_date": "2023-06-01 00:00:00+00:00"},
+            ],
+        )
+
+
+class TestProjectBulkIngestViews(BaseTestIngestViews):
+    """Test project bulk ingest view"""
+
+    def setUp(self):
+        """Setup test data"""
+        self.test_data = TestData()
+        self.api_url = "/api/v1/ingest/projects"
+
+        super().setUp()
+
+    def create_ingest_projects(self, count):
+        """Create ingest data of count projects"""
+        ingest_projects = []
+        for i in range(count):
+            project = copy.deepcopy(self.test_data.ingest_projects[i % 2])
+            project["foreign_id"] = 10000 + i
+            ingest_projects.append(project)
+        return ingest_projects
+
+    def test_create_and_update(self):
+        """Test new projects are created and existing projects updated"""
+        existing_project = self.test_data.projects[0]
+        existing_project["foreign_id"] = 1337
+        existing_project["follower_count"] = 3
+        Project.objects.create(**existing_project)
+
+        updated, created = copy.deepcopy(self.test_data.ingest_projects)
+        updated["foreign_id"] = 1337
+        updated["title"] = "updated title"
+        invalid = {"title": "no foreign id"}
+
+        result = self.client.post(
+            self.api_url,
+            data=[updated, created, invalid, created],
+            headers=self.header,
+            content_type="application/json",
+        )
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.data["created"], 1)
+        self.assertEqual(result.data["updated"], 1)
+        self.assertEqual(result.data["invalid"], 2)
+        statuses = [(x["foreign_id"], x["status"]) for x in result.data["results"]]
+        self.assertEqual(
+            statuses,
+            [
+                (1337, "updated"),
+                (4096, "created"),
+                (None, "invalid"),
+                (4096, "invalid"),
+            ],
+        )
+        self.assertIn("foreign_id", result.data["results"][2]["errors"])
+
+        self.assertEqual(Project.objects.count(), 2)
+        project = Project.objects.get(foreign_id=1337)
+        self.assertEqual(project.title, "updated title")
+        self.assertEqual(project.url, updated["url"])
+        self.assertEqual(project.follower_count, 3)
+        self.assertTrue(project.active)
+        self.assertEqual(Project.objects.get(foreign_id=4096).title, created["title"])
+
+    def test_ndjson(self):
+        """Test projects posted as NDJSON"""
+        lines = [json.dumps(x) for x in self.test_data.ingest_projects] + ["{bogus"]
+
+        result = self.client.post(
+            self.api_url,
+            data="\n".join(lines),
+            headers=self.header,
+            content_type="application/x-ndjson",
+        )
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.data["created"], 2)
+        self.assertEqual(result.data["invalid"], 1)
+        self.assertEqual(Project.objects.count(), 2)
+
+    def test_not_a_list(self):
+        """Test payload must be a list of projects"""
+        result = self.client.post(
+            self.api_url,
+            data=self.test_data.ingest_projects[0],
+            headers=self.header,
+            content_type="application/json",
+        )
+
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(Project.objects.count(), 0)
+
+    def test_query_count_independent_of_project_count(self):
+        """Test projects are written in bulk"""
+
+        def post_projects(count):
+            with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as context:
+                result = self.client.post(
+                    self.api_url,
+                    data=self.create_ingest_projects(count),
+                    headers=self.header,
+                    content_type="application/json",
+                )
+            self.assertEqual(result.status_code, 200)
+            return len(context.captured_queries)
+
+        # Create, then update
+        self.assertEqual(post_projects(2), post_projects(50))
+        self.assertEqual(post_projects(2), post_projects(50))
+        self.assertEqual(Project.objects.count(), 50)
+
+    def test_unchanged_not_written(self):
+        """Test unchanged projects are not written again"""
+        projects = copy.deepcopy(self.test_data.ingest_projects)
+        self.client.post(
+            self.api_url,
+            data=projects,
+            headers=self.header,
+            content_type="application/json",
+        )
+        Project.objects.update(last_seen=datetime.datetime(2023, 1, 1, tzinfo=pytz.utc))
+        cache_version = projects_cache.get_version()
+
+        projects[1]["title"] = "updated title"
+        result = self.client.post(
+            self.api_url,
+            data=projects,
+            headers=self.header,
+            content_type="application/json",
+        )
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.data["unchanged"], 1)
+        self.assertEqual(result.data["updated"], 1)
+        self.assertEqual(result.data["results"][0]["status"], "unchanged")
+        unchanged = Project.objects.get(foreign_id=projects[0]["foreign_id"])
+        self.assertEqual(
+            unchanged.last_seen, datetime.datetime(2023, 1, 1, tzinfo=pytz.utc)
+        )
+        self.assertNotEqual(projects_cache.get_version(), cache_version)
+
+        # Nothing changed at all, the cached listings stay valid
+        cache_version = projects_cache.get_version()
+        result = self.client.post(
+            self.api_url,
+            data=projects,
+            headers=self.header,
+            content_type="application/json",
+        )
+        self.assertEqual(result.data["unchanged"], 2)
+        self.assertEqual(projects_cache.get_version(), cache_version)
 
 
 class TestArticleIngestViews(BaseTestIngestViews):
@@ -263,7 +501,183 @@ class TestArticleIngestViews(BaseTestIngestViews):
             },
         }
 
-        self.assertDictEqual(result.data, expected_result)
+        self.assertDictEqual(self.get_streamed_json(result), expected_result)
+
+
+class TestArticleBulkIngestViews(BaseTestIngestViews):
+    """Test article bulk ingest view"""
+
+    def setUp(self):
+        """Setup test data"""
+        self.test_data = TestData()
+        [Project.objects.create(**x) for x in self.test_data.projects]
+        super().setUp()
+        self.api_url = "/api/v1/ingest/articles"
+
+    def post_articles(self, articles):
+        """Post batch of articles"""
+        return self.client.post(
+            self.api_url,
+            data=articles,
+            headers=self.header,
+            content_type="application/json",
+        )
+
+    def get_project_foreign_ids(self, article_foreign_id):
+        """Get foreign ids of the projects linked to an article"""
+        article = Article.objects.get(foreign_id=article_foreign_id)
+        return sorted(article.projects.values_list("foreign_id", flat=True))
+
+    def create_ingest_articles(self, count):
+        """Create ingest data of count articles"""
+        ingest_articles = []
+        for i in range(count):
+            article = copy.deepcopy(self.test_data.ingest_articles[i % 2])
+            article["foreign_id"] = 10000 + i
+            article["projectIds"] = [2048, 4096]
+            ingest_articles.append(article)
+        return ingest_articles
+
+    def test_create_and_update(self):
+        """Test new articles are created, existing articles updated and their projects replaced"""
+        updated, created = copy.deepcopy(self.test_data.ingest_articles)
+        self.post_articles([updated])
+
+        updated["title"] = "updated title"
+        updated["projectIds"] = [4096]
+        created["projectIds"] = [2048, 4096]
+        result = self.post_articles([updated, created])
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.data["created"], 1)
+        self.assertEqual(result.data["updated"], 1)
+        self.assertEqual(Article.objects.count(), 2)
+        self.assertEqual(Article.objects.get(foreign_id=128).title, "updated title")
+        self.assertEqual(self.get_project_foreign_ids(128), [4096])
+        self.assertEqual(self.get_project_foreign_ids(256), [2048, 4096])
+
+    def test_unknown_project_ids(self):
+        """Test unknown project ids are reported per article"""
+        partly_known, unknown = copy.deepcopy(self.test_data.ingest_articles)
+        no_list = copy.deepcopy(partly_known)
+        partly_known["projectIds"] = [2048, 9999]
+        unknown["projectIds"] = [9999]
+        no_list["foreign_id"] = 512
+        no_list["projectIds"] = 2048
+
+        result = self.post_articles([partly_known, unknown, no_list])
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.data["created"], 1)
+        self.assertEqual(result.data["invalid"], 2)
+        results = result.data["results"]
+        self.assertEqual(results[0]["status"], "created")
+        self.assertEqual(results[0]["unknown_project_ids"], [9999])
+        self.assertEqual(results[1]["status"], "invalid")
+        self.assertEqual(results[1]["unknown_project_ids"], [9999])
+        self.assertIn("projectIds", results[2]["errors"])
+        self.assertEqual(self.get_project_foreign_ids(128), [2048])
+        self.assertEqual(Article.objects.count(), 1)
+
+    def test_query_count_independent_of_article_count(self):
+        """Test articles and their projects are written in bulk"""
+
+        def post_articles(count):
+            with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as context:
+                result = self.post_articles(self.create_ingest_articles(count))
+            self.assertEqual(result.status_code, 200)
+            return len(context.captured_queries)
+
+        # Create, then update
+        self.assertEqual(post_articles(2), post_articles(50))
+        self.assertEqual(post_articles(2), post_articles(50))
+        self.assertEqual(Article.objects.count(), 50)
+        self.assertEqual(Article.projects.through.objects.count(), 100)
+
+
+class TestIngestDiffViews(BaseTestIngestViews):
+    """Test ingest diff views"""
+
+    def setUp(self):
+        """Setup test data"""
+        self.test_data = TestData()
+        super().setUp()
+
+    def get_content_hash(self, item):
+        """Content hash as computed by the ETL"""
+        canonical = json.dumps(
+            item, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def test_projects_diff(self):
+        """Test only new and changed projects need to be sent"""
+        unchanged, changed = copy.deepcopy(self.test_data.ingest_projects)
+        self.client.post(
+            "/api/v1/ingest/projects",
+            data=[unchanged, changed],
+            headers=self.header,
+            content_type="application/json",
+        )
+        changed["title"] = "updated title"
+        hashes = {
+            str(unchanged["foreign_id"]): self.get_content_hash(unchanged),
+            str(changed["foreign_id"]): self.get_content_hash(changed),
+            "1337": "new",
+        }
+
+        result = self.client.post(
+            "/api/v1/ingest/projects/diff",
+            data=hashes,
+            headers=self.header,
+            content_type="application/json",
+        )
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.data, [changed["foreign_id"], 1337])
+
+    def test_articles_diff(self):
+        """Test articles of which a project was unknown are sent again"""
+        [Project.objects.create(**x) for x in self.test_data.projects]
+        known, unknown = copy.deepcopy(self.test_data.ingest_articles)
+        unknown["projectIds"].append(9999)
+        self.client.post(
+            "/api/v1/ingest/article",
+            data=known,
+            headers=self.header,
+            content_type="application/json",
+        )
+        self.client.post(
+            "/api/v1/ingest/article",
+            data=unknown,
+            headers=self.header,
+            content_type="application/json",
+        )
+        hashes = {
+            str(known["foreign_id"]): self.get_content_hash(known),
+            str(unknown["foreign_id"]): self.get_content_hash(unknown),
+        }
+
+        result = self.client.post(
+            "/api/v1/ingest/articles/diff",
+            data=hashes,
+            headers=self.header,
+            content_type="application/json",
+        )
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.data, [unknown["foreign_id"]])
+
+    def test_diff_invalid(self):
+        """Test hashes must be an object keyed by foreign id"""
+        for data in [["abc"], {"abc": "abc"}]:
+            result = self.client.post(
+                "/api/v1/ingest/projects/diff",
+                data=data,
+                headers=self.header,
+                content_type="application/json",
+            )
+            self.assertEqual(result.status_code, 400)
 
 
 class TestGarbageCollectionView(BaseTestIngestViews):
@@ -358,3 +772,48 @@ class TestGarbageCollectionView(BaseTestIngestViews):
                 "articles": {"deleted": 1, "count": 1},
             },
         )
+
+    def test_garbage_collector_query_count(self):
+        """Test projects are updated in bulk and the status is counted in a single query"""
+
+        def collect_garbage():
+            data = {"project_ids": [2048], "article_ids": []}
+            with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as context:
+                result = self.client.post(
+                    self.api_url,
+                    data=data,
+                    headers=self.header,
+                    content_type="application/json",
+                )
+            self.assertEqual(result.status_code, 200)
+            count_queries = [
+                x for x in context.captured_queries if "COUNT(" in x["sql"]
+            ]
+            self.assertEqual(len(count_queries), 1)
+            return len(context.captured_queries), result.data
+
+        query_count, gc_status = collect_garbage()
+        article_count = Article.objects.count()
+        self.assertDictEqual(
+            gc_status,
+            {
+                "projects": {"active": 1, "inactive": 1, "deleted": 0, "count": 2},
+                "articles": {"deleted": 0, "count": article_count},
+            },
+        )
+        for i in range(50):
+            project = copy.deepcopy(self.test_data.projects[1])
+            project["foreign_id"] = 10000 + i
+            Project.objects.create(**project)
+
+        query_count_after, gc_status = collect_garbage()
+        self.assertEqual(query_count_after, query_count)
+        self.assertDictEqual(
+            gc_status,
+            {
+                "projects": {"active": 51, "inactive": 1, "deleted": 0, "count": 52},
+                "articles": {"deleted": 0, "count": article_count},
+            },
+        )
+        self.assertEqual(Project.objects.filter(active=True).count(), 51)
+        self.assertFalse(Project.objects.get(foreign_id=2048).active)
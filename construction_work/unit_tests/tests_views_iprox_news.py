@@ -4,7 +4,9 @@ import json
 import os
 from datetime import datetime
 
+from django.db import DEFAULT_DB_ALIAS, connections
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 
 from construction_work.generic_functions.aes_cipher import AESCipher
 from construction_work.generic_functions.date_translation import (
@@ -259,6 +261,43 @@ class TestArticles(TestArticlesBase):
         }
         self.assertDictEqual(result.data[0], expected_data)
 
+    def test_image_data_never_selected(self):
+        """Test news listings only read image metadata, never the image data"""
+        project = Project.objects.filter(
+            foreign_id=self.data.projects[0]["foreign_id"]
+        ).first()
+        # Recent warning, so it is part of the project details too
+        warning = WarningMessage.objects.create(
+            title="recent warning", body="recent warning body", project=project
+        )
+        warning_image = WarningImage.objects.create(warning=warning, is_main=True)
+        for image_data in self.data.images:
+            warning_image.images.add(Image.objects.create(**image_data))
+
+        listings = [
+            (self.api_url, {}),
+            (self.api_url, {"project_ids": project.pk}),
+            ("/api/v1/project/warnings", {}),
+            ("/api/v1/project/warnings", {"project_id": project.pk}),
+            ("/api/v1/project/warning", {"id": warning.pk}),
+            ("/api/v1/project/details", {"id": project.pk}),
+        ]
+        for url, params in listings:
+            with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+                result = self.client.get(
+                    url, params, HTTP_DEVICEID="foobar", **self.headers
+                )
+            self.assertEqual(result.status_code, 200, url)
+
+            image_queries = [
+                x["sql"]
+                for x in queries.captured_queries
+                if '"construction_work_image"' in x["sql"]
+            ]
+            self.assertNotEqual(image_queries, [], url)
+            for sql in image_queries:
+                self.assertNotIn('"construction_work_image"."data"', sql, url)
+
     def test_sort_news_by_publication_date_descending(self):
         """Test getting news sorted by publication date descending"""
         articles = Article.objects.all()
@@ -3,8 +3,10 @@ import json
 import os
 from datetime import datetime
 
+from django.core.cache import cache
 from django.db import DEFAULT_DB_ALIAS, connections
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from freezegun import freeze_time
 
 from construction_work.api_messages import Messages
@@ -14,12 +16,14 @@ from construction_work.generic_functions.date_translation import (
 )
 from construction_work.generic_functions.generic_logger import Logger
 from construction_work.generic_functions.text_search import MIN_QUERY_LENGTH
-from construction_work.models import Project
+from construction_work.models import Image, Project
 from construction_work.models.article import Article
 from construction_work.models.device import Device
-from construction_work.models.warning_and_notification import WarningMessage
+from construction_work.models.warning_and_notification import (
+    WarningImage,
+    WarningMessage,
+)
 from construction_work.unit_tests.mock_data import TestData
-from construction_work.views.views_iprox_projects import memoize
 
 messages = Messages()
 logger = Logger()
@@ -47,8 +51,11 @@ class BaseTestApi(TestCase):
         # Create request client
         self.client = Client()
 
+        # Start without cached projects listings
+        cache.clear()
+
     def tearDown(self) -> None:
-        memoize.clear_all_cache()
+        cache.clear()
 
     def create_project_and_article(self, project_foreign_id, article_pub_date):
         """Create project and article"""
@@ -320,6 +327,72 @@ class TestApiProjects(BaseTestApi):
         self.assertEqual(response.data["page"]["totalPages"], 3)
         self.assertEqual(len(response.data["result"]), 2)
 
+    def test_page_cost_independent_of_project_count(self):
+        """Test only the requested page is fetched and serialized"""
+        device = Device.objects.create(**self.data.devices[0])
+        self.headers["HTTP_DEVICEID"] = device.device_id
+
+        def count_queries(total_projects):
+            Project.objects.all().delete()
+            for i in range(1, total_projects + 1):
+                project_data = self.data.projects[0]
+                project_data["foreign_id"] = i * 10
+                Project.objects.create(**project_data)
+
+            with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+                response = self.client.get(
+                    self.api_url, {"page_size": 3, "page": 2}, **self.headers
+                )
+            self.assertEqual(len(response.data["result"]), 3)
+            self.assertEqual(response.data["page"]["totalElements"], total_projects)
+            return len(queries.captured_queries)
+
+        self.assertEqual(count_queries(6), count_queries(30))
+
+    @freeze_time("2023-01-02")
+    def test_cached_projects_follow_changes(self):
+        """Test cached listing is reused, and refreshed after data changed"""
+        project, _ = self.create_project_and_article(10, "2023-01-01T12:00:00+00:00")
+        device = Device.objects.create(**self.data.devices[0])
+        self.headers["HTTP_DEVICEID"] = device.device_id
+
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as cold:
+            response = self.client.get(self.api_url, **self.headers)
+        self.assertEqual(len(response.data["result"][0]["recent_articles"]), 1)
+
+        # Second request only looks up the device and its followed projects
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as warm:
+            self.client.get(self.api_url, **self.headers)
+        self.assertLess(len(warm.captured_queries), len(cold.captured_queries))
+
+        # New article invalidates the cache
+        self.add_article_to_project(project, 12, "2023-01-01T12:20:00+00:00")
+        response = self.client.get(self.api_url, **self.headers)
+        self.assertEqual(len(response.data["result"][0]["recent_articles"]), 2)
+
+        # Followed state is device specific, and never cached
+        device.followed_projects.add(project)
+        response = self.client.get(self.api_url, **self.headers)
+        self.assertTrue(response.data["result"][0]["followed"])
+
+    def test_cached_projects_per_article_max_age(self):
+        """Test article_max_age is part of the cache key"""
+        project, _ = self.create_project_and_article(10, "2023-01-01T12:00:00+00:00")
+        device = Device.objects.create(**self.data.devices[0])
+        self.headers["HTTP_DEVICEID"] = device.device_id
+
+        with freeze_time("2023-01-10"):
+            response = self.client.get(
+                self.api_url, {"article_max_age": 3}, **self.headers
+            )
+            self.assertEqual(response.data["result"][0]["recent_articles"], [])
+
+            response = self.client.get(
+                self.api_url, {"article_max_age": 30}, **self.headers
+            )
+            self.assertEqual(response.data["result"][0]["id"], project.pk)
+            self.assertEqual(len(response.data["result"][0]["recent_articles"]), 1)
+
 
 class TestApiProjectsSearch(BaseTestApi):
     """Test searching text in project model"""
@@ -498,6 +571,45 @@ class TestApiProjectDetails(BaseTestApi):
         self.assertIsNotNone(response.data)
         self.assertEqual(response.data["id"], project.pk)
 
+    def test_query_count_independent_of_warnings_and_images(self):
+        """Test project details runs a fixed number of queries"""
+        project = Project.objects.create(**self.data.projects[0])
+        device = Device.objects.create(**self.data.devices[0])
+        device.followed_projects.add(project)
+        self.headers["HTTP_DEVICEID"] = device.device_id
+
+        def add_warning_with_images():
+            warning_data = self.data.warning_message
+            warning_data["project"] = project
+            warning = WarningMessage.objects.create(**warning_data)
+            warning_image = WarningImage.objects.create(warning=warning, is_main=True)
+            for image_data in self.data.images:
+                warning_image.images.add(Image.objects.create(**image_data))
+
+        def count_queries():
+            with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+                response = self.client.get(
+                    self.api_url, {"id": project.pk}, **self.headers
+                )
+            self.assertEqual(response.status_code, 200)
+            return len(queries.captured_queries), response.data
+
+        add_warning_with_images()
+        query_count, data = count_queries()
+        self.assertEqual(len(data["recent_articles"]), 1)
+
+        for _ in range(4):
+            add_warning_with_images()
+        self.assertEqual(count_queries()[0], query_count)
+
+        query_count, data = count_queries()
+        self.assertEqual(data["followers"], 1)
+        self.assertEqual(len(data["recent_articles"]), 5)
+        self.assertEqual(
+            len(data["recent_articles"][0]["images"][0]["sources"]),
+            len(self.data.images),
+        )
+
 
 class TestApiProjectFollow(BaseTestApi):
     """Test follow project endpoint"""
@@ -3,7 +3,7 @@ import json
 import os
 from unittest.mock import patch
 
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 
 from construction_work.api_messages import Messages
 from construction_work.generic_functions.aes_cipher import AESCipher
@@ -89,11 +89,34 @@ class TestApiNotification(TestCase):
             content_type=self.content_type,
         )
 
-        self.assertEqual(result.status_code, 200)
-        self.assertEqual(result.data, "Push notifications sent")
-
+        # Sent in the background
+        self.assertEqual(result.status_code, 202)
         notification = Notification.objects.filter(warning=warning_message.pk).first()
         self.assertIsNotNone(notification)
+        self.assertEqual(result.data["notification_id"], notification.pk)
+        self.assertEqual(result.data["status"], Notification.PENDING)
+
+        # Delivery progress
+        result = self.client.get(
+            "/api/v1/notification/status",
+            {"id": notification.pk},
+            headers=headers,
+        )
+        self.assertEqual(result.status_code, 200)
+        self.assertDictEqual(
+            result.data,
+            {
+                "notification_id": notification.pk,
+                "status": Notification.PENDING,
+                "token_count": 0,
+                "sent_count": 0,
+                "failed_count": 0,
+                "pruned_count": 0,
+                "failure_counts": {},
+                "duration": None,
+                "progress": 0.0,
+            },
+        )
 
     @patch(
         "firebase_admin.messaging.send_multicast",
@@ -211,3 +234,111 @@ class TestApiNotification(TestCase):
 
         self.assertEqual(result.status_code, 400)
         self.assertEqual(result.data, messages.invalid_query)
+
+
+class TestApiNotificationBroadcast(TestCase):
+    """Test notification broadcast API view"""
+
+    def setUp(self):
+        """Setup projects in a district, with overlapping followers"""
+        self.data = TestData()
+        self.url = "/api/v1/notification/broadcast"
+        self.content_type = "application/json"
+        self.client = Client()
+
+        self.projects = []
+        for project in self.data.projects:
+            self.projects.append(Project.objects.create(**project, district_id=5398))
+        project_manager = ProjectManager.objects.create(**self.data.project_managers[0])
+        self.warning_message = WarningMessage.objects.create(
+            title="foobar",
+            body="foobar",
+            project=self.projects[0],
+            project_manager=project_manager,
+        )
+
+        # The first device follows both projects
+        for i, device_data in enumerate(self.data.devices):
+            device = Device.objects.create(**device_data)
+            device.followed_projects.add(*self.projects[: len(self.projects) - i])
+
+        token = AESCipher(
+            str(project_manager.manager_key), os.getenv("AES_SECRET")
+        ).encrypt()
+        self.headers = {"UserAuthorization": token}
+
+    def post(self, data):
+        """Post broadcast"""
+        data = {
+            "title": "foobar",
+            "body": "foobar",
+            "warning_id": self.warning_message.pk,
+            **data,
+        }
+        return self.client.post(
+            self.url,
+            json.dumps(data),
+            headers=self.headers,
+            content_type=self.content_type,
+        )
+
+    def test_broadcast_to_projects(self):
+        """Test a broadcast to projects is stored with its projects"""
+        result = self.post({"project_ids": [x.pk for x in self.projects]})
+
+        self.assertEqual(result.status_code, 202)
+        notification = Notification.objects.get(pk=result.data["notification_id"])
+        self.assertCountEqual(notification.projects.all(), self.projects)
+        self.assertIsNone(notification.district_id)
+        self.assertFalse(notification.use_topics)
+
+    def test_broadcast_to_district(self):
+        """Test a broadcast to a district"""
+        result = self.post({"district_id": 5398, "topics": True})
+
+        self.assertEqual(result.status_code, 202)
+        notification = Notification.objects.get(pk=result.data["notification_id"])
+        self.assertEqual(notification.district_id, 5398)
+        self.assertEqual(notification.projects.count(), 0)
+        # Topic subscriptions are not enabled
+        self.assertFalse(notification.use_topics)
+
+    @override_settings(FCM_TOPICS=True)
+    def test_broadcast_to_topics(self):
+        """Test topics are used for at most MAX_CONDITION_TOPICS projects"""
+        result = self.post({"project_ids": [self.projects[0].pk], "topics": True})
+        self.assertEqual(result.status_code, 202)
+        notification = Notification.objects.get(pk=result.data["notification_id"])
+        self.assertTrue(notification.use_topics)
+
+        with patch("construction_work.views.views_messages.MAX_CONDITION_TOPICS", 1):
+            result = self.post(
+                {"project_ids": [x.pk for x in self.projects], "topics": True}
+            )
+        notification = Notification.objects.get(pk=result.data["notification_id"])
+        self.assertFalse(notification.use_topics)
+
+    def test_broadcast_no_subscriptions(self):
+        """Test nothing is stored without followers"""
+        result = self.post({"district_id": 5520})
+
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.data, "No subscribed devices found")
+        self.assertEqual(Notification.objects.count(), 0)
+
+    def test_broadcast_invalid_targets(self):
+        """Test a broadcast needs either projects or a known district"""
+        for data in [
+            {},
+            {"project_ids": [self.projects[0].pk], "district_id": 5398},
+            {"project_ids": []},
+            {"project_ids": ["foobar"]},
+            {"district_id": 1},
+        ]:
+            result = self.post(data)
+            self.assertEqual(result.status_code, 400, data)
+            self.assertEqual(result.data, messages.invalid_parameters)
+
+        result = self.post({"project_ids": [self.projects[0].pk, 9999]})
+        self.assertEqual(result.status_code, 404)
+        self.assertEqual(Notification.objects.count(), 0)
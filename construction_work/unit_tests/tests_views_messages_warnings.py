@@ -3,18 +3,35 @@
 import base64
 import json
 import os
+import shutil
+import tempfile
 import uuid
 from datetime import datetime
+from io import StringIO
 
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import Client, TestCase
 
 from construction_work.api_messages import Messages
+from construction_work.generic_functions import image_jobs, image_storage
 from construction_work.generic_functions.aes_cipher import AESCipher
 from construction_work.generic_functions.date_translation import translate_timezone
-from construction_work.models import Project, ProjectManager, WarningMessage
+from construction_work.generic_functions.image_conversion import MAX_PIXELS
+from construction_work.models import (
+    Image,
+    ImageConversionJob,
+    Project,
+    ProjectManager,
+    WarningImage,
+    WarningMessage,
+)
 from construction_work.serializers import WarningMessagePublicSerializer
 from construction_work.unit_tests.mock_data import TestData
+from construction_work.unit_tests.mock_functions import (
+    image_storage_settings,
+    png_header,
+)
 
 messages = Messages()
 
@@ -57,10 +74,19 @@ class TestApiProjectWarning(TestCase):
         for project_manager in self.data.project_managers:
             ProjectManager.objects.create(**project_manager)
 
+        # Keep uploaded images out of the configured image storage
+        self.storage_location = tempfile.mkdtemp()
+        storage_settings = self.settings(
+            STORAGES=image_storage_settings(self.storage_location)
+        )
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+
     def tearDown(self):
         WarningMessage.objects.all().delete()
         Project.objects.all().delete()
         ProjectManager.objects.all().delete()
+        shutil.rmtree(self.storage_location, ignore_errors=True)
 
     def get_user_auth_header(self, manager_key):
         """Get user auth header"""
@@ -397,6 +423,17 @@ class TestApiProjectWarning(TestCase):
         self.assertEqual(result.status_code, 200)
         # self.assertDictEqual(result.data, {"status": True, "result": "Images stored in database"})
 
+        # Images are added by the background conversion
+        self.assertEqual(result.data["images"], [])
+        job = ImageConversionJob.objects.get(warning_image_id=result.data["id"])
+        self.assertEqual(job.status, ImageConversionJob.PENDING)
+        public_data = WarningMessagePublicSerializer(instance=warning_message).data
+        self.assertEqual(public_data["images"], [])
+
+        call_command("convertimages", once=True, processes=0, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageConversionJob.DONE)
+
         project_obj = Project.objects.filter(foreign_id=2048).first()
         warning_message = WarningMessage.objects.filter(project=project_obj.pk).first()
         self.assertEqual(len(warning_message.warningimage_set.all()), 1)
@@ -409,6 +446,11 @@ class TestApiProjectWarning(TestCase):
         sources = warning_image.get("sources")
         self.assertEqual(len(sources), 5)
 
+        # Image data is kept in the image storage, not in the database
+        for image in warning_message.warningimage_set.first().images.all():
+            self.assertIsNone(image.data)
+            self.assertIsNotNone(image.content_hash)
+
         expected_result = [
             {"url": "http://mock/image?id=1", "width": 135, "height": 180},
             {"url": "http://mock/image?id=2", "width": 324, "height": 432},
@@ -458,6 +500,150 @@ class TestApiProjectWarning(TestCase):
         ).first()
         self.assertEqual(len(warning_message.warningimage_set.all()), 0)
 
+    def test_post_warning_message_image_upload_too_large(self):
+        """test uploading an image with too many pixels is rejected before decoding it"""
+        data = {
+            "title": "title",
+            "body": "Body text",
+            "project_foreign_id": 2048,
+            "project_manager_key": "aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa",
+        }
+        warning_message = self.create_message_from_data(data)
+
+        side = int(MAX_PIXELS**0.5) + 1
+        base64_image_data = base64.b64encode(png_header(side, side)).decode("utf-8")
+
+        image_data = {
+            "image": {
+                "main": "true",
+                "data": base64_image_data,
+                "description": "unittest",
+            },
+            "warning_id": warning_message.pk,
+        }
+
+        headers = self.get_user_auth_header(data["project_manager_key"])
+        result = self.client.post(
+            "{url}/image".format(url=self.url),
+            json.dumps(image_data),
+            headers=headers,
+            content_type=self.content_type,
+        )
+
+        self.assertEqual(result.status_code, 400)
+        self.assertEqual(result.data, messages.image_too_large)
+        self.assertEqual(len(warning_message.warningimage_set.all()), 0)
+        self.assertEqual(ImageConversionJob.objects.count(), 0)
+
+    def test_failed_image_conversion(self):
+        """Test a failing background conversion leaves the warning without images"""
+        data = {
+            "title": "title",
+            "body": "Body text",
+            "project_foreign_id": 2048,
+            "project_manager_key": "aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa",
+        }
+        warning_message = self.create_message_from_data(data)
+        warning_image = WarningImage.objects.create(warning=warning_message)
+        job = image_jobs.enqueue(warning_image, b"0xff", "unittest")
+
+        call_command("convertimages", once=True, processes=0, stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageConversionJob.FAILED)
+        self.assertEqual(job.error, "Unsupported image format")
+        self.assertEqual(job.attempts, 1)
+        public_data = WarningMessagePublicSerializer(instance=warning_message).data
+        self.assertEqual(public_data["images"], [])
+        # The upload is deleted once the job failed
+        with self.assertRaises(FileNotFoundError):
+            image_storage.open_file(job.content_hash)
+
+    def test_upload_shared_with_image(self):
+        """Test deleting an image keeps the stored upload of a pending job with the same data"""
+        data = {
+            "title": "title",
+            "body": "Body text",
+            "project_foreign_id": 2048,
+            "project_manager_key": "aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa",
+        }
+        warning_message = self.create_message_from_data(data)
+        warning_image = WarningImage.objects.create(warning=warning_message)
+        job = image_jobs.enqueue(warning_image, b"upload", "unittest")
+        image = Image.objects.create(
+            content_hash=job.content_hash, width=1, height=1, aspect_ratio=1.0
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        image_storage.open_file(job.content_hash).close()
+
+    def test_upload_deleted_with_warning(self):
+        """Test deleting a warning with a pending job deletes the stored upload"""
+        data = {
+            "title": "title",
+            "body": "Body text",
+            "project_foreign_id": 2048,
+            "project_manager_key": "aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa",
+        }
+        warning_message = self.create_message_from_data(data)
+        warning_image = WarningImage.objects.create(warning=warning_message)
+        job = image_jobs.enqueue(warning_image, b"upload", "unittest")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            warning_message.delete()
+        self.assertFalse(ImageConversionJob.objects.filter(pk=job.pk).exists())
+        with self.assertRaises(FileNotFoundError):
+            image_storage.open_file(job.content_hash)
+
+    def test_reclaimed_image_conversion(self):
+        """Test only the worker that claimed a job last stores its images"""
+        data = {
+            "title": "title",
+            "body": "Body text",
+            "project_foreign_id": 2048,
+            "project_manager_key": "aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa",
+        }
+        warning_message = self.create_message_from_data(data)
+        warning_image = WarningImage.objects.create(warning=warning_message)
+        job = image_jobs.enqueue(warning_image, b"upload", "unittest")
+        result = {
+            "images": [
+                {
+                    "key": 0,
+                    "data": b"image",
+                    "width": 1,
+                    "height": 1,
+                    "mime_type": "image/jpeg",
+                }
+            ],
+            "variants": [],
+            "aspect_ratio": 1.0,
+            "gps_info": None,
+        }
+
+        (stale_job,) = image_jobs.claim_jobs(1)
+        # The job went stale and was claimed again by another worker
+        ImageConversionJob.objects.filter(pk=job.pk).update(
+            status=ImageConversionJob.PENDING
+        )
+        (claimed_job,) = image_jobs.claim_jobs(1)
+
+        image_jobs.finish(stale_job, result)
+        image_jobs.fail(stale_job, "lost")
+        self.assertEqual(warning_image.images.count(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageConversionJob.RUNNING)
+        image_storage.open_file(job.content_hash).close()
+
+        image_jobs.finish(claimed_job, result)
+        self.assertEqual(warning_image.images.count(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageConversionJob.DONE)
+        self.assertEqual(job.attempts, 2)
+        with self.assertRaises(FileNotFoundError):
+            image_storage.open_file(job.content_hash)
+
     def test_post_warning_message_image_upload_no_data(self):
         """test uploading an image without any data"""
         data = {
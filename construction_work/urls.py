@@ -74,9 +74,14 @@ urlpatterns = [
     # Ingestion
     path("ingest/garbagecollector", csrf_exempt(views_ingest.garbage_collector)),
     path("ingest/project", csrf_exempt(views_ingest.etl_project)),
+    path("ingest/projects", csrf_exempt(views_ingest.etl_projects)),
+    path("ingest/projects/diff", csrf_exempt(views_ingest.etl_projects_diff)),
     path("ingest/article", csrf_exempt(views_ingest.etl_article)),
+    path("ingest/articles", csrf_exempt(views_ingest.etl_articles)),
+    path("ingest/articles/diff", csrf_exempt(views_ingest.etl_articles_diff)),
     # Image & Assets
     path("image", csrf_exempt(views_generic.image)),
+    path("image/auth", csrf_exempt(views_generic.image_auth)),
     # Mobile devices (used for C..D devices for push-notifications)
     path("device/register", csrf_exempt(views_mobile_devices.device_register)),
     # Project Manager (used to CRUD a project manager for notifications)
@@ -90,5 +95,7 @@ urlpatterns = [
     ),
     # Notification ('teaser' pointing to news- or warning article)
     path("notification", csrf_exempt(views_messages.notification_post)),
+    path("notification/status", csrf_exempt(views_messages.notification_status)),
+    path("notification/broadcast", csrf_exempt(views_messages.notification_broadcast)),
     path("__debug__/", include("debug_toolbar.urls")),
 ]
@@ -1,18 +1,51 @@
 """ Generic views (images, assets) """
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
 from construction_work.api_messages import Messages
+from construction_work.generic_functions import image_storage
+from construction_work.generic_functions.image_variants import (
+    get_accepted_mime_types,
+    get_variant,
+)
 from construction_work.generic_functions.is_authorized import IsAuthorized
+from construction_work.generic_functions.static_data import IMAGE_CACHE_MAX_AGE
 from construction_work.models import Image
-from construction_work.swagger.swagger_views_generic import as_image
+from construction_work.swagger.swagger_views_generic import as_image, as_image_auth
 
 message = Messages()
 
 
+def set_image_cache_headers(response, etag, last_modified):
+    """Set validators and caching headers of an (immutable) image response"""
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # Private, images need a token. The nginx cache authorizes every request before serving it (see nginx.conf)
+    patch_cache_control(
+        response, private=True, max_age=IMAGE_CACHE_MAX_AGE, immutable=True
+    )
+    # A variant (e.g. WebP) might be served instead, depending on the Accept header
+    patch_vary_headers(response, ["Accept"])
+    return response
+
+
+@swagger_auto_schema(**as_image_auth)
+@api_view(["GET"])
+@IsAuthorized
+def image_auth(request):
+    """Authorize an image request, used by nginx before serving a cached image"""
+    return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+
 @swagger_auto_schema(**as_image)
 @api_view(["GET"])
 @IsAuthorized
@@ -22,10 +55,43 @@ def image(request):
     if image_id is None:
         return Response(message.invalid_query, status=status.HTTP_400_BAD_REQUEST)
 
-    image_obj = Image.objects.filter(pk=image_id).first()
+    image_obj = Image.objects.filter(pk=image_id).defer("data").first()
     if image_obj is None:
         return Response(message.no_record_found, status=status.HTTP_404_NOT_FOUND)
 
-    return HttpResponse(
-        image_obj.data, content_type=image_obj.mime_type, status=status.HTTP_200_OK
+    # Serve the smallest variant the client accepts
+    variant = get_variant(image_obj, get_accepted_mime_types(request))
+    if variant is not None:
+        image_obj = variant
+
+    last_modified = int(image_obj.creation_date.timestamp())
+    if image_obj.content_hash is not None:
+        etag = quote_etag(image_obj.content_hash)
+    else:
+        # Image data not moved to the image storage yet (see management command offloadimages), an image never
+        # changes, so its identity is a validator that does not need the data
+        etag = quote_etag(f"{image_obj.pk}-{last_modified}")
+
+    # Answer If-None-Match / If-Modified-Since with 304, without reading the image data
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
     )
+    if not_modified is not None:
+        return set_image_cache_headers(not_modified, etag, last_modified)
+
+    if image_obj.content_hash is not None:
+        try:
+            image_file = image_storage.open_file(image_obj.content_hash)
+        except FileNotFoundError:
+            return Response(message.no_record_found, status=status.HTTP_404_NOT_FOUND)
+
+        # Streamed by the server (uWSGI wsgi.file_wrapper / offload-threads), never fully read into memory
+        response = FileResponse(
+            image_file, content_type=image_obj.mime_type, status=status.HTTP_200_OK
+        )
+    else:
+        response = HttpResponse(
+            image_obj.data, content_type=image_obj.mime_type, status=status.HTTP_200_OK
+        )
+
+    return set_image_cache_headers(response, etag, last_modified)
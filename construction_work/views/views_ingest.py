@@ -1,4 +1,5 @@
 """ Views for ingestion routes """
+from django.db import transaction
 from django.utils import timezone
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
@@ -6,14 +7,23 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
 from construction_work.api_messages import Messages
+from construction_work.generic_functions import (
+    bulk_ingest,
+    etl_snapshot,
+    projects_cache,
+)
 from construction_work.generic_functions.generic_logger import Logger
 from construction_work.generic_functions.is_authorized import IsAuthorized
 from construction_work.models import Article, Project
 from construction_work.serializers import ArticleCreateSerializer, ProjectSerializer
 from construction_work.swagger.swagger_views_ingestion import (
     as_etl_article_post,
+    as_etl_articles_diff,
+    as_etl_articles_post,
     as_etl_get,
     as_etl_project_post,
+    as_etl_projects_diff,
+    as_etl_projects_post,
     as_garbage_collector,
 )
 
@@ -32,34 +42,43 @@ def garbage_collector(request):
     project_foreign_ids = data.get("project_ids", [])
     article_foreign_ids = data.get("article_ids", [])
 
-    # Update last_seen and active state for all projects
-    projects = Project.objects.all()
-    initial_projects_count = projects.count()
-    for project in projects:
-        if project.foreign_id in project_foreign_ids:
-            project.deactivate()
-        else:
-            project.save()
-
-    # Remove all un-seen articles from database
-    initial_article_count = Article.objects.all().count()
-    Article.objects.filter(foreign_id__in=article_foreign_ids).delete()
-
-    # Cleanup inactive projects
-    five_days_ago = timezone.now() - timezone.timedelta(days=5)
-    Project.objects.filter(last_seen__lt=five_days_ago, active=False).delete()
-
-    # Set status
+    with transaction.atomic():
+        # Deactivate the given projects, all others are (re)activated and seen now (see Project.save)
+        inactive_count = Project.objects.filter(
+            foreign_id__in=project_foreign_ids
+        ).update(active=False)
+        active_count = Project.objects.exclude(
+            foreign_id__in=project_foreign_ids
+        ).update(active=True, last_seen=timezone.now())
+
+        # Remove all un-seen articles from database
+        _, deleted_articles = Article.objects.filter(
+            foreign_id__in=article_foreign_ids
+        ).delete()
+        article_count = Article.objects.count()
+
+        # Cleanup inactive projects
+        five_days_ago = timezone.now() - timezone.timedelta(days=5)
+        _, deleted_projects = Project.objects.filter(
+            last_seen__lt=five_days_ago, active=False
+        ).delete()
+
+    # Bulk updates bypass the post_save signals
+    projects_cache.invalidate()
+
+    # Set status, the project counts are the rows updated and deleted above, only the articles are counted
+    deleted_project_count = deleted_projects.get(Project._meta.label, 0)
+    inactive_count -= deleted_project_count
     gc_status = {
         "projects": {
-            "active": Project.objects.filter(active=True).count(),
-            "inactive": Project.objects.filter(active=False).count(),
-            "deleted": initial_projects_count - Project.objects.all().count(),
-            "count": Project.objects.all().count(),
+            "active": active_count,
+            "inactive": inactive_count,
+            "deleted": deleted_project_count,
+            "count": active_count + inactive_count,
         },
         "articles": {
-            "deleted": initial_article_count - Article.objects.all().count(),
-            "count": Article.objects.all().count(),
+            "deleted": deleted_articles.get(Article._meta.label, 0),
+            "count": article_count,
         },
     }
 
@@ -74,56 +93,96 @@ def garbage_collector(request):
 def etl_project(request):
     """Discriminate on request method"""
     if request.method == "GET":
-        return etl_project_get()
+        return etl_snapshot_get(request, Project)
     if request.method == "POST":
         return etl_project_post(request)
     return Response(data=None, status=status.HTTP_400_BAD_REQUEST)
 
 
-def etl_project_get():
-    """Get all project_id with their modification date"""
-    projects = list(
-        Project.objects.all().values_list("foreign_id", "modification_date")
-    )
-    result = {str(x[0]): {"modification_date": str(x[1])} for x in projects}
-    return Response(result, status=status.HTTP_200_OK)
+def etl_snapshot_get(request, model):
+    """Stream all foreign ids (of projects or articles) with their modification date"""
+    try:
+        since = etl_snapshot.get_since(request.GET.get("since", None))
+    except etl_snapshot.InvalidSince:
+        return Response(message.invalid_query, status=status.HTTP_400_BAD_REQUEST)
+
+    return etl_snapshot.get_response(model, since, request.GET.get("output", None))
 
 
 def etl_project_post(request):
     """Import etl data"""
-    etl_iprox_data = request.data
-
-    foreign_id = etl_iprox_data.get("foreign_id")
-    title = etl_iprox_data.get("title", "")
-    subtitle = etl_iprox_data.get("subtitle", "")
-
-    project_instance = Project.objects.filter(foreign_id=foreign_id).first()
-
-    project_data = {
-        "title": title,
-        "subtitle": subtitle,
-        "sections": etl_iprox_data.get("sections"),
-        "contacts": etl_iprox_data.get("contacts"),
-        "timeline": etl_iprox_data.get("timeline"),
-        "image": etl_iprox_data.get("image"),
-        "images": etl_iprox_data.get("images"),
-        "url": etl_iprox_data.get("url"),
-        "foreign_id": foreign_id,
-        "coordinates": etl_iprox_data.get("coordinates"),
-        "creation_date": etl_iprox_data.get("created"),
-        "modification_date": etl_iprox_data.get("modified"),
-        "publication_date": etl_iprox_data.get("publicationDate"),
-        "expiration_date": etl_iprox_data.get("expirationDate"),
-    }
+    project_data = bulk_ingest.get_project_data(request.data)
+    content_hash = bulk_ingest.get_content_hash(request.data)
+    project_instance = Project.objects.filter(
+        foreign_id=project_data["foreign_id"]
+    ).first()
+
+    # Unchanged since the last import, not written again
+    if project_instance is not None and project_instance.content_hash == content_hash:
+        serializer = ProjectSerializer(instance=project_instance)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     # Use the instance parameter to update the existing article or create a new one
     serializer = ProjectSerializer(instance=project_instance, data=project_data)
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    serializer.save()
+    serializer.save(content_hash=content_hash)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+@swagger_auto_schema(**as_etl_projects_post)
+@api_view(["POST"])
+@IsAuthorized
+def etl_projects(request):
+    """Import a batch of projects (JSON array or NDJSON), new projects are created and existing ones updated"""
+    try:
+        items = bulk_ingest.get_items(request)
+    except bulk_ingest.InvalidPayload:
+        return Response(message.invalid_parameters, status=status.HTTP_400_BAD_REQUEST)
+
+    result = bulk_ingest.upsert_projects(items)
+    return Response(result, status=status.HTTP_200_OK)
+
+
+@swagger_auto_schema(**as_etl_projects_diff)
+@api_view(["POST"])
+@IsAuthorized
+def etl_projects_diff(request):
+    """Get foreign ids of the projects that need to be imported, based on their content hash"""
+    return etl_diff(Project, request.data)
+
+
+@swagger_auto_schema(**as_etl_articles_diff)
+@api_view(["POST"])
+@IsAuthorized
+def etl_articles_diff(request):
+    """Get foreign ids of the articles that need to be imported, based on their content hash"""
+    return etl_diff(Article, request.data)
+
+
+def etl_diff(model, hashes):
+    """Compare content hashes by foreign id with the stored ones"""
+    try:
+        foreign_ids = bulk_ingest.get_changed_foreign_ids(model, hashes)
+    except bulk_ingest.InvalidPayload:
+        return Response(message.invalid_parameters, status=status.HTTP_400_BAD_REQUEST)
+    return Response(foreign_ids, status=status.HTTP_200_OK)
+
+
+@swagger_auto_schema(**as_etl_articles_post)
+@api_view(["POST"])
+@IsAuthorized
+def etl_articles(request):
+    """Import a batch of articles (JSON array or NDJSON), new articles are created and existing ones updated"""
+    try:
+        items = bulk_ingest.get_items(request)
+    except bulk_ingest.InvalidPayload:
+        return Response(message.invalid_parameters, status=status.HTTP_400_BAD_REQUEST)
+
+    result = bulk_ingest.upsert_articles(items)
+    return Response(result, status=status.HTTP_200_OK)
+
+
 @swagger_auto_schema(**as_etl_get)
 @swagger_auto_schema(**as_etl_article_post)
 @IsAuthorized
@@ -131,51 +190,46 @@ def etl_project_post(request):
 def etl_article(request):
     """Discriminate on request method"""
     if request.method == "GET":
-        return etl_article_get()
+        return etl_snapshot_get(request, Article)
     if request.method == "POST":
         return etl_article_post(request)
     return Response(data=None, status=status.HTTP_400_BAD_REQUEST)
 
 
-def etl_article_get():
-    """Get all article_id with their modification date"""
-    articles = list(
-        Article.objects.all().values_list("foreign_id", "modification_date")
-    )
-    result = {str(x[0]): {"modification_date": str(x[1])} for x in articles}
-    return Response(result, status=status.HTTP_200_OK)
-
-
 def etl_article_post(request):
     """Import etl data"""
     iprox_data = request.data
 
     article_foreign_id = iprox_data.get("foreign_id")
-    project_foreign_ids = [
-        Project.objects.get(foreign_id=x) for x in iprox_data.get("projectIds")
-    ]
-    project_ids = [x.pk for x in project_foreign_ids]
+    content_hash = bulk_ingest.get_content_hash(iprox_data)
+
+    # Resolve all projects with a single query, unknown project ids are left out
+    project_foreign_ids = bulk_ingest.get_project_foreign_ids(iprox_data) or []
+    projects = Project.objects.in_bulk(project_foreign_ids, field_name="foreign_id")
+    project_ids = [x.pk for x in projects.values()]
+    if len(projects) < len(set(project_foreign_ids)):
+        # Not stored, so the article is written again once its projects are known
+        content_hash = None
 
     article_instance = Article.objects.filter(foreign_id=article_foreign_id).first()
 
+    # Unchanged since the last import, not written again
+    if (
+        article_instance is not None
+        and content_hash is not None
+        and article_instance.content_hash == content_hash
+    ):
+        serializer = ArticleCreateSerializer(instance=article_instance)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
     article_data = {
-        "foreign_id": article_foreign_id,
+        **bulk_ingest.get_article_data(iprox_data),
         "projects": project_ids,
-        "title": iprox_data.get("title"),
-        "intro": iprox_data.get("intro"),
-        "body": iprox_data.get("body"),
-        "image": iprox_data.get("image"),
-        "type": iprox_data.get("type"),
-        "url": iprox_data.get("url"),
-        "creation_date": iprox_data.get("created"),
-        "modification_date": iprox_data.get("modified"),
-        "publication_date": iprox_data.get("publicationDate"),
-        "expiration_date": iprox_data.get("expirationDate"),
     }
 
     # Use the instance parameter to update the existing article or create a new one
     serializer = ArticleCreateSerializer(instance=article_instance, data=article_data)
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    serializer.save()
+    serializer.save(content_hash=content_hash)
     return Response(serializer.data, status=status.HTTP_200_OK)
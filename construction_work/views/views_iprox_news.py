@@ -5,8 +5,12 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
 from construction_work.api_messages import Messages
+from construction_work.generic_functions.image_variants import exclude_variants
 from construction_work.generic_functions.is_authorized import IsAuthorized
 from construction_work.generic_functions.model_utils import create_id_dict
+from construction_work.generic_functions.project_utils import (
+    get_warning_images_prefetch,
+)
 from construction_work.generic_functions.static_data import StaticData
 from construction_work.models import Article, WarningMessage
 from construction_work.serializers import ArticleSerializer, ImagePublicSerializer
@@ -83,7 +87,7 @@ def articles(request):
     warnings_qs = WarningMessage.objects
     if project_ids:
         warnings_qs = warnings_qs.filter(project__id__in=project_ids)
-    warnings_qs = warnings_qs.prefetch_related("warningimage_set__images")
+    warnings_qs = warnings_qs.prefetch_related(get_warning_images_prefetch())
 
     warnings_list = []
     for warning in warnings_qs:
@@ -91,7 +95,7 @@ def articles(request):
         images = []
         for warning_image in warning_images:
             image_serializer = ImagePublicSerializer(
-                instance=warning_image.images.all(),
+                instance=exclude_variants(warning_image.images.all()),
                 many=True,
                 context=image_serializer_context,
             )
@@ -11,15 +11,17 @@ from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
 from construction_work.api_messages import Messages
-from construction_work.generic_functions.gps_utils import address_to_gps, get_distance
+from construction_work.generic_functions import projects_cache
+from construction_work.generic_functions.distance_ranking import project_coordinates
+from construction_work.generic_functions.gps_utils import address_to_gps
 from construction_work.generic_functions.is_authorized import (
     IsAuthorized,
     JWTAuthorized,
 )
-from construction_work.generic_functions.memoize import Memoize
 from construction_work.generic_functions.project_utils import (
     create_project_news_lookup,
     get_recent_articles_of_project,
+    prefetch_recent_articles,
 )
 from construction_work.generic_functions.static_data import (
     ARTICLE_MAX_AGE_PARAM,
@@ -50,13 +52,20 @@ from construction_work.swagger.swagger_views_iprox_projects import (
 )
 
 message = Messages()
-memoize = Memoize(ttl=300, max_items=300)
 
 
-def _paginate_data(request, data: list) -> dict:
-    """Create pagination of data"""
+def _get_page(request) -> tuple[int, int]:
+    """Get zero based page number and page size from request"""
     page = int(request.GET.get("page", 1)) - 1
     page_size = int(request.GET.get("page_size", 10))
+    return page, page_size
+
+
+def _paginate_data(request, data: list, total_elements=None) -> dict:
+    """Create pagination of data
+    When total_elements is given, data only holds the requested page (already paginated by the caller)
+    """
+    page, page_size = _get_page(request)
 
     # Get uri from request
     absolute_uri = request.build_absolute_uri()
@@ -64,15 +73,19 @@ def _paginate_data(request, data: list) -> dict:
 
     # NOTE: check if pagination does not return double results
     # might be an index + 1 issue?
-    start_index = page * page_size
-    stop_index = page * page_size + page_size
-    paginated_result = data[start_index:stop_index]
-    pages = int(ceil(len(data) / float(page_size)))
+    if total_elements is None:
+        start_index = page * page_size
+        stop_index = page * page_size + page_size
+        paginated_result = data[start_index:stop_index]
+        total_elements = len(data)
+    else:
+        paginated_result = data
+    pages = int(ceil(total_elements / float(page_size)))
 
     pagination = {
         "number": page + 1,
         "size": page_size,
-        "totalElements": len(data),
+        "totalElements": total_elements,
         "totalPages": pages,
     }
 
@@ -163,6 +176,20 @@ def search(model, text, query_fields, return_fields) -> list:
     return result
 
 
+def _get_project_ids_by_latest_article() -> list:
+    """Get project ids sorted by project with most recent article,
+    adding old date for projects without articles
+    """
+    projects_qs = Project.objects.annotate(
+        latest_publication_date=Coalesce(
+            Max("article__publication_date"),
+            Value("1970-01-01"),
+            output_field=DateTimeField(),
+        )
+    ).order_by("-latest_publication_date")
+    return list(projects_qs.values_list("pk", flat=True))
+
+
 def _projects(request):
     """Get a list of all projects in specific order"""
 
@@ -181,109 +208,79 @@ def _projects(request):
         request.GET.get(ARTICLE_MAX_AGE_PARAM, 3)
     )  # Max days since publication date
 
-    # NOTE: cache should be rebuild when any parameter is changed
-    # currently only device id is used as cache key
-    # @memoize
-    def _fetch_projects(_device_id, _article_max_age, _lat, _lon, _address):
-        # Convert address into GPS data. Note: This should never happen, the device should already
-        if _address is not None and (_lat is None or _lon is None):
-            _lat, _lon = address_to_gps(_address)
+    # Convert address into GPS data. Note: This should never happen, the device should already
+    if address is not None and (lat is None or lon is None):
+        lat, lon = address_to_gps(address)
 
-        # If we've never seen this device, create it lookup device in DB and use it...
-        device = Device.objects.filter(device_id=_device_id).first()
-        if device is None:
-            device_serializer = DeviceSerializer(data={"device_id": _device_id})
-            if not device_serializer.is_valid():
-                return Response(
-                    device_serializer.errors, status=status.HTTP_400_BAD_REQUEST
-                )
-            device = device_serializer.save()
-
-        # Sort followed projects by project with most recent article,
-        # adding old date for projects without articles
-        projects_followed_by_device_qs = (
-            device.followed_projects.all()
-            .annotate(
-                latest_publication_date=Coalesce(
-                    Max("article__publication_date"),
-                    Value("1970-01-01"),
-                    output_field=DateTimeField(),
-                )
+    # If we've never seen this device, create it lookup device in DB and use it...
+    device = Device.objects.filter(device_id=device_id).first()
+    if device is None:
+        device_serializer = DeviceSerializer(data={"device_id": device_id})
+        if not device_serializer.is_valid():
+            return Response(
+                device_serializer.errors, status=status.HTTP_400_BAD_REQUEST
             )
-            .order_by("-latest_publication_date")
-        )
-        projects_followed_by_device = list(projects_followed_by_device_qs)
-
-        def calculate_distance(project: Project, _lat, _lon):
-            given_cords = (float(_lat), float(_lon))
-
-            if project.coordinates is not None:
-                project_cords = (
-                    project.coordinates.get("lat"),
-                    project.coordinates.get("lon"),
-                )
-            else:
-                project_cords = (None, None)
-
-            meter, _ = get_distance(given_cords, project_cords)
-            if meter is None:
-                return float("inf")
-            return meter
-
-        all_other_projects_qs = Project.objects.exclude(
-            pk__in=projects_followed_by_device_qs
-        )
+        device = device_serializer.save()
 
-        # If lat and lon are known:
-        # Sort remaining projects by distance from given coordinates
-        if _lat is not None and _lon is not None:
-            all_other_projects = sorted(
-                all_other_projects_qs,
-                key=lambda project: calculate_distance(project, _lat, _lon),
-            )
-        # If lat and lon are not known:
-        # Sort projects by most recent article,
-        # adding old date for projects without articles
-        else:
-            all_other_projects_qs = all_other_projects_qs.annotate(
-                latest_publication_date=Coalesce(
-                    Max("article__publication_date"),
-                    Value("1970-01-01"),
-                    output_field=DateTimeField(),
-                )
-            ).order_by("-latest_publication_date")
-            all_other_projects = list(all_other_projects_qs)
-
-        all_projects = []
-        all_projects.extend(projects_followed_by_device)
-        all_projects.extend(all_other_projects)
-
-        project_news_mapping = create_project_news_lookup(
-            all_projects, _article_max_age
-        )
+    # Device specific: the projects followed by this device
+    followed_project_ids = set(device.followed_projects.values_list("pk", flat=True))
 
-        context = {
-            "device_id": _device_id,
-            "lat": _lat,
-            "lon": _lon,
-            "project_news_mapping": project_news_mapping,
-            "followed_projects": projects_followed_by_device,
-        }
-        serializer = ProjectListSerializer(
-            instance=all_projects, many=True, context=context
+    # Device independent: order of all projects, shared by all workers
+    version = projects_cache.get_version()
+    project_ids_by_latest_article = projects_cache.get_or_set(
+        version, "latest", _get_project_ids_by_latest_article
+    )
+
+    # If lat and lon are known:
+    # Sort projects by distance from given coordinates (location cell)
+    # If lat and lon are not known:
+    # Sort projects by most recent article
+    ordered_project_ids = project_ids_by_latest_article
+    project_distances = None
+    if lat is not None and lon is not None:
+        lat, lon = projects_cache.quantize_location(lat, lon)
+        ordered_project_ids, project_distances = projects_cache.get_or_set(
+            version,
+            f"location:{lat}:{lon}",
+            lambda: project_coordinates.rank_by_distance(
+                lat, lon, list(Project.objects.values_list("pk", flat=True))
+            ),
         )
-        return serializer.data
 
-    # Create context for project list serializer
-    serialized_data = _fetch_projects(device_id, article_max_age, lat, lon, address)
+    # Followed projects first, sorted by most recent article
+    ordered_project_ids = [
+        x for x in project_ids_by_latest_article if x in followed_project_ids
+    ] + [x for x in ordered_project_ids if x not in followed_project_ids]
+
+    # Only fetch and serialize the requested page
+    page, page_size = _get_page(request)
+    page_project_ids = ordered_project_ids[page * page_size : (page + 1) * page_size]
+    projects_by_pk = Project.objects.in_bulk(page_project_ids)
+    page_projects = [projects_by_pk[x] for x in page_project_ids if x in projects_by_pk]
+
+    project_news_mapping = create_project_news_lookup(page_projects, article_max_age)
+
+    context = {
+        "device_id": device_id,
+        "lat": lat,
+        "lon": lon,
+        "project_news_mapping": project_news_mapping,
+        "project_distances": project_distances,
+        "followed_projects": [x for x in page_projects if x.pk in followed_project_ids],
+    }
+    serializer = ProjectListSerializer(
+        instance=page_projects, many=True, context=context
+    )
 
     # Paginate and return data
-    paginated_data = _paginate_data(request, serialized_data)
+    paginated_data = _paginate_data(
+        request, serializer.data, total_elements=len(ordered_project_ids)
+    )
     return Response(data=paginated_data, status=status.HTTP_200_OK)
 
 
 @swagger_auto_schema(**as_projects_aes)
-@api_view(["GET"])  # keep cached result for 5 minutes in memory
+@api_view(["GET"])  # device independent part is cached for 5 minutes
 @IsAuthorized
 def projects_aes(request):
     """Get a list of all projects in specific order"""
@@ -291,7 +288,7 @@ def projects_aes(request):
 
 
 @swagger_auto_schema(**as_projects_jwt)
-@api_view(["GET"])  # keep cached result for 5 minutes in memory
+@api_view(["GET"])  # device independent part is cached for 5 minutes
 @JWTAuthorized
 def projects_jwt(request):
     """Get a list of all projects in specific order"""
@@ -322,19 +319,32 @@ def projects_search(request):
     except NoSuchFieldInModelError as e:
         return Response(data=str(e), status=status.HTTP_400_BAD_REQUEST)
 
-    project_news_mapping = create_project_news_lookup(found_projects, article_max_age)
+    # Only serialize the requested page
+    page, page_size = _get_page(request)
+    page_projects = found_projects[page * page_size : (page + 1) * page_size]
+
+    project_distances = None
+    if lat is not None and lon is not None:
+        _, project_distances = project_coordinates.rank_by_distance(
+            lat, lon, [x.pk for x in page_projects]
+        )
+
+    project_news_mapping = create_project_news_lookup(page_projects, article_max_age)
     context = {
         "lat": lat,
         "lon": lon,
         "article_max_age": article_max_age,
         "project_news_mapping": project_news_mapping,
+        "project_distances": project_distances,
     }
     serializer = ProjectListSerializer(
-        instance=found_projects, many=True, context=context
+        instance=page_projects, many=True, context=context
     )
 
     # Paginate result
-    paginated_data = _paginate_data(request, serializer.data)
+    paginated_data = _paginate_data(
+        request, serializer.data, total_elements=len(found_projects)
+    )
 
     return Response(
         data=paginated_data,
@@ -375,7 +385,10 @@ def project_details(request):
     if address is not None:
         lat, lon = address_to_gps(address)
 
-    project_obj = Project.objects.filter(pk=project_id, active=True).first()
+    # Fetch recent news and warning images up front, the serializer then needs no additional queries
+    project_queryset = Project.objects.filter(pk=project_id, active=True)
+    project_queryset = prefetch_recent_articles(project_queryset, article_max_age)
+    project_obj = project_queryset.first()
     if project_obj is None:
         return Response(
             data=message.no_record_found,
@@ -442,9 +455,6 @@ def project_follow(request):
 
     device = Device.objects.filter(device_id=device_id).first()
 
-    # Clear cache related to device
-    memoize.clear_cache_by_key(device_id)
-
     # Follow flow
     if request.method == "POST":
         if device is None:
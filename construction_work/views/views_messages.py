@@ -1,6 +1,8 @@
 """ Views for news, articles and warning messages """
 import base64
 
+from django.conf import settings
+from django.db import transaction
 from django.http import HttpResponseForbidden
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
@@ -8,29 +10,44 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
 from construction_work.api_messages import Messages
-from construction_work.generic_functions.image_conversion import ImageConversion
+from construction_work.generic_functions import image_jobs
+from construction_work.generic_functions.image_conversion import (
+    ImageConversion,
+    ImageTooLarge,
+)
 from construction_work.generic_functions.is_authorized import (
     IsAuthorized,
     JWTAuthorized,
     ManagerAuthorized,
 )
+from construction_work.generic_functions.project_utils import (
+    get_warning_images_prefetch,
+)
 from construction_work.generic_functions.sort import Sort
 from construction_work.generic_functions.static_data import StaticData
 from construction_work.models import (
     Notification,
     Project,
     ProjectManager,
+    WarningImage,
     WarningMessage,
 )
-from construction_work.models.image import Image
-from construction_work.push_notifications.send_notification import NotificationService
+from construction_work.push_notifications.send_notification import (
+    NO_SUBSCRIBED_DEVICES,
+    get_subscribed_tokens,
+    has_subscribed_devices,
+)
+from construction_work.push_notifications.topics import MAX_CONDITION_TOPICS
 from construction_work.serializers import (
+    NotificationStatusSerializer,
     WarningImageSerializer,
     WarningMessageCreateSerializer,
     WarningMessagePublicSerializer,
 )
 from construction_work.swagger.swagger_views_messages import (
+    as_notification_broadcast_post,
     as_notification_post,
+    as_notification_status_get,
     as_warning_message_delete,
     as_warning_message_get,
     as_warning_message_image_post,
@@ -52,7 +69,11 @@ def warning_messages_get(request):
     sort_order = request.GET.get("sort-order", None)
 
     if project_id is None:
-        warning_messages = WarningMessage.objects.filter(project__active=True).all()
+        warning_messages = (
+            WarningMessage.objects.filter(project__active=True)
+            .prefetch_related(get_warning_images_prefetch())
+            .all()
+        )
         serializer = WarningMessagePublicSerializer(warning_messages, many=True)
         result = Sort().list_of_dicts(
             serializer.data, key=sort_by, sort_order=sort_order
@@ -63,7 +84,11 @@ def warning_messages_get(request):
     if project is None:
         return Response(messages.no_record_found, status=status.HTTP_404_NOT_FOUND)
 
-    warning_messages = WarningMessage.objects.filter(project=project).all()
+    warning_messages = (
+        WarningMessage.objects.filter(project=project)
+        .prefetch_related(get_warning_images_prefetch())
+        .all()
+    )
     serializer = WarningMessagePublicSerializer(warning_messages, many=True)
     result = Sort().list_of_dicts(serializer.data, key=sort_by, sort_order=sort_order)
     return Response(result, status=status.HTTP_200_OK)
@@ -223,27 +248,123 @@ def notification_post(request):
             status=status.HTTP_404_NOT_FOUND,
         )
 
-    # Store notification in database
+    # Nothing to send, do not store the notification
+    if not has_subscribed_devices(warning_message.project):
+        return Response(
+            data=NO_SUBSCRIBED_DEVICES,
+            status=status.HTTP_200_OK,
+        )
+
+    # Store notification in database, it is sent by the sendnotifications worker (see push_notifications.dispatcher)
     notification_data = {"title": title, "body": body, "warning": warning_message}
     notification_object = Notification.objects.create(**notification_data)
 
-    # Trigger the push notification services
-    notification_service = NotificationService(notification_object)
-    result = notification_service.setup()
-    if result is False:
-        # Remove notification, since it was not send
-        notification_object.delete()
+    serializer = NotificationStatusSerializer(notification_object)
+    return Response(data=serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+@swagger_auto_schema(**as_notification_broadcast_post)
+@api_view(["POST"])
+@ManagerAuthorized
+def notification_broadcast(request):
+    """Post Notification message to the followers of several projects, or of the projects in a district"""
+    title = request.data.get("title", None)
+    body = request.data.get("body", None)
+    warning_id = request.data.get("warning_id", None)
+    project_ids = request.data.get("project_ids", None)
+    district_id = request.data.get("district_id", None)
+    use_topics = request.data.get("topics", False) in ["True", "true", True]
+
+    if None in [title, body, warning_id]:
+        return Response(
+            data=messages.invalid_query,
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    # Either projects or a district
+    if (project_ids is None) == (district_id is None):
+        return Response(
+            data=messages.invalid_parameters,
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    if project_ids is not None:
+        if (
+            not isinstance(project_ids, list)
+            or len(project_ids) == 0
+            or not all(isinstance(x, int) for x in project_ids)
+        ):
+            return Response(
+                data=messages.invalid_parameters,
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        projects = Project.objects.filter(pk__in=project_ids)
+        if projects.count() != len(set(project_ids)):
+            return Response(
+                data=messages.no_record_found,
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        # A single condition reaches the followers of at most MAX_CONDITION_TOPICS projects once
+        use_topics = use_topics and len(set(project_ids)) <= MAX_CONDITION_TOPICS
+    else:
+        if district_id not in [x["id"] for x in StaticData.districts()]:
+            return Response(
+                data=messages.invalid_parameters,
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        projects = Project.objects.filter(district_id=district_id)
+
+    warning_message = WarningMessage.objects.filter(pk=warning_id).first()
+    if warning_message is None:
+        return Response(
+            data=messages.no_record_found,
+            status=status.HTTP_404_NOT_FOUND,
+        )
+
+    # Nothing to send, do not store the notification
+    if not get_subscribed_tokens(projects).exists():
         return Response(
-            data=notification_service.setup_result,
+            data=NO_SUBSCRIBED_DEVICES,
             status=status.HTTP_200_OK,
         )
 
-    notification_service.send_multicast_and_handle_errors()
+    # Topics are only subscribed to while enabled (see push_notifications.topics)
+    use_topics = use_topics and settings.FCM_TOPICS
+
+    # Sent by the sendnotifications worker, like a notification of a single warning
+    with transaction.atomic():
+        notification_object = Notification.objects.create(
+            title=title,
+            body=body,
+            warning=warning_message,
+            district_id=district_id,
+            use_topics=use_topics,
+        )
+        if project_ids is not None:
+            notification_object.projects.set(projects)
 
-    return Response(
-        data="Push notifications sent",
-        status=status.HTTP_200_OK,
-    )
+    serializer = NotificationStatusSerializer(notification_object)
+    return Response(data=serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+@swagger_auto_schema(**as_notification_status_get)
+@api_view(["GET"])
+@ManagerAuthorized
+def notification_status(request):
+    """Get delivery progress of a notification"""
+    notification_id = request.GET.get("id", None)
+    if notification_id is None:
+        return Response(data=messages.invalid_query, status=status.HTTP_400_BAD_REQUEST)
+
+    notification_object = Notification.objects.filter(pk=notification_id).first()
+    if notification_object is None:
+        return Response(
+            data=messages.no_record_found,
+            status=status.HTTP_404_NOT_FOUND,
+        )
+
+    serializer = NotificationStatusSerializer(notification_object)
+    return Response(data=serializer.data, status=status.HTTP_200_OK)
 
 
 @swagger_auto_schema(**as_warning_message_image_post)
@@ -273,45 +394,23 @@ def warning_messages_image_upload(request):
     # Get description
     description = image_data.get("description", f"Warning Message {warning_id}")
 
-    # Get image data and run ImageConversion
+    # Only check the image header here, the conversion runs in the background (see image_jobs)
     data = base64.b64decode(image_data.get("data"))
     image_conversion = ImageConversion(data, description)
-    result = image_conversion.run()
-    if result is False:
-        return Response(
-            messages.unsupported_image_format, status=status.HTTP_400_BAD_REQUEST
-        )
-
-    # Store images into DB and build warning-messages images list
-    sources = []
-    for key in image_conversion.images:  # pylint: disable=consider-using-dict-items
-        # Build image object and save to database
-        image = image_conversion.images[key]
-        image_object = Image(
-            data=image["data"],
-            description=description,
-            width=image["width"],
-            height=image["height"],
-            aspect_ratio=image_conversion.aspect_ratio,
-            coordinates=image_conversion.gps_info,
-            mime_type=image["mime_type"],
+    try:
+        if not image_conversion.read_metadata():
+            return Response(
+                messages.unsupported_image_format, status=status.HTTP_400_BAD_REQUEST
+            )
+    except ImageTooLarge:
+        return Response(messages.image_too_large, status=status.HTTP_400_BAD_REQUEST)
+
+    # The warning image gets its images once the conversion is done
+    with transaction.atomic():
+        warning_image = WarningImage.objects.create(
+            warning=warning_message, is_main=image_data["main"]
         )
-        image_object.save()
-        sources.append(image_object)
-
-    image_ids = [image.pk for image in sources]
-    warning_image_serializer = WarningImageSerializer(
-        data={
-            "warning": warning_message.pk,
-            "is_main": image_data["main"],
-            "images": image_ids,
-        }
-    )
-
-    if not warning_image_serializer.is_valid():
-        return Response(
-            warning_image_serializer.errors, status=status.HTTP_400_BAD_REQUEST
-        )  # pragma: no cover
-    warning_image_serializer.save()
+        image_jobs.enqueue(warning_image, data, description)
 
+    warning_image_serializer = WarningImageSerializer(instance=warning_image)
     return Response(warning_image_serializer.data, status=status.HTTP_200_OK)
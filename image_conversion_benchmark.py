@@ -0,0 +1,88 @@
+""" Compare direct scaling (every size from the original image) with cascaded scaling (every size from the previous
+    one) of ImageConversion. Reports the wall time and peak RSS of converting a set of photos.
+
+    usage: python image_conversion_benchmark.py [photo ...]
+"""
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+from construction_work.generic_functions.image_conversion import ImageConversion
+
+DEFAULT_PHOTO_DIR = "construction_work/unit_tests/image_data"
+
+
+def convert_photos(paths, cascade, rounds, results):
+    """Convert all photos, runs in its own process so the peak RSS is not shared with the other mode"""
+    photos = []
+    for path in paths:
+        with open(path, "rb") as f:
+            photos.append((os.path.basename(path), f.read()))
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for name, data in photos:
+            ImageConversion(data, name, cascade=cascade).run()
+    wall_time = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kilobytes on Linux
+    results.put((wall_time, peak_rss, peak_rss - baseline_rss))
+
+
+class ImageConversionBenchmark:
+    """Run the image conversion in direct and cascaded mode"""
+
+    def __init__(self, paths, rounds=3):
+        self.paths = paths
+        self.rounds = rounds
+        self.results = {}
+
+    def run_mode(self, cascade):
+        """Run a single mode in a fresh process"""
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        process = context.Process(
+            target=convert_photos, args=(self.paths, cascade, self.rounds, results)
+        )
+        process.start()
+        result = results.get()
+        process.join()
+        return result
+
+    def start_test(self):
+        """Perform benchmark"""
+        self.results["direct"] = self.run_mode(cascade=False)
+        self.results["cascade"] = self.run_mode(cascade=True)
+
+    def print_metrics(self):
+        """Print report"""
+        print("Image Conversion Benchmark:")
+        print("=" * 50)
+        print(f"Photos: {len(self.paths)}, rounds: {self.rounds}")
+        print("_" * 50)
+        for mode, (wall_time, peak_rss, rss_growth) in self.results.items():
+            per_photo = wall_time / (len(self.paths) * self.rounds)
+            print(
+                f"{mode:<8} wall time: {wall_time:.2f} s ({per_photo:.3f} s/photo), "
+                f"peak RSS: {peak_rss / 1024:.1f} Mb (+{rss_growth / 1024:.1f} Mb)"
+            )
+        print("_" * 50)
+        direct_time = self.results["direct"][0]
+        cascade_time = self.results["cascade"][0]
+        print(f"Speedup: {direct_time / cascade_time:.2f}x")
+
+
+if __name__ == "__main__":
+    photo_paths = sys.argv[1:]
+    if len(photo_paths) == 0:
+        photo_paths = [
+            os.path.join(DEFAULT_PHOTO_DIR, x)
+            for x in sorted(os.listdir(DEFAULT_PHOTO_DIR))
+        ]
+    benchmark = ImageConversionBenchmark(photo_paths)
+    benchmark.start_test()
+    benchmark.print_metrics()
@@ -63,6 +63,20 @@ function start_nginx {
     cd /code && nginx -g "daemon off;" &
 }
 
+function start_image_worker {
+  if [ -z ${UNITTEST} ]; then
+    printf "\nStarting image conversion worker\n\n"
+    (cd /code && while true; do python manage.py convertimages; sleep 1; done) &
+  fi
+}
+
+function start_notification_worker {
+  if [ -z ${UNITTEST} ]; then
+    printf "\nStarting notification worker\n\n"
+    (cd /code && while true; do python manage.py sendnotifications; sleep 1; done) &
+  fi
+}
+
 function enter_infinity_loop {
   if [ -z ${UNITTEST} ]; then
     while true; do
@@ -86,4 +100,6 @@ make_migrations
 create_user
 add_static_files
 start_nginx
+start_image_worker
+start_notification_worker
 enter_infinity_loop
@@ -205,6 +205,20 @@ CONN_MAX_AGE = None
 # and serve new connections (e.g. after database server restart closing existing connections).
 CONN_HEALTH_CHECKS = True
 
+# Cache shared by all uWSGI workers (e.g. device independent part of the projects listing)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("CACHE_LOCATION", "/tmp/construction_work_cache"),
+        "TIMEOUT": 300,
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    }
+}
+
+# Keep FCM topic subscriptions of the followers of projects and districts, so broadcasts can be sent to topics
+# (see construction_work/push_notifications/topics.py)
+FCM_TOPICS = os.getenv("FCM_TOPICS", "false").lower() == "true"
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -244,6 +258,26 @@ STATIC_URL = "/static/"
 STATICFILES_DIR = []
 STATIC_ROOT = "{base_dir}/static".format(base_dir=BASE_DIR)
 
+# Storage backends, uploaded image data is kept outside of the database in the "images" storage
+# https://docs.djangoproject.com/en/4.2/ref/settings/#storages
+
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+    "images": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {
+            "location": os.getenv(
+                "IMAGE_STORAGE_LOCATION", "{base_dir}/images".format(base_dir=BASE_DIR)
+            ),
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 